@@ -0,0 +1,46 @@
+"""
+Persistent prompt queue and history
+Revision ID: 0002_prompt_queue
+Revises: 0001_assets
+Create Date: 2026-10-18 00:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002_prompt_queue"
+down_revision = "0001_assets"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "prompt_queue",
+        sa.Column("prompt_id", sa.String(length=128), primary_key=True),
+        sa.Column("number", sa.Float(), nullable=False),
+        sa.Column("status", sa.String(length=16), nullable=False, server_default="pending"),
+        sa.Column("item", sa.Text(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=False), nullable=False),
+    )
+    op.create_index("ix_prompt_queue_number", "prompt_queue", ["number"])
+
+    op.create_table(
+        "prompt_history",
+        sa.Column("seq", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("prompt_id", sa.String(length=128), nullable=False),
+        sa.Column("status", sa.String(length=16), nullable=True),
+        sa.Column("workflow_id", sa.String(length=128), nullable=True),
+        sa.Column("entry", sa.Text(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=False), nullable=False),
+    )
+    op.create_index("uq_prompt_history_prompt_id", "prompt_history", ["prompt_id"], unique=True)
+    op.create_index("ix_prompt_history_workflow_id", "prompt_history", ["workflow_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_prompt_history_workflow_id", table_name="prompt_history")
+    op.drop_index("uq_prompt_history_prompt_id", table_name="prompt_history")
+    op.drop_table("prompt_history")
+    op.drop_index("ix_prompt_queue_number", table_name="prompt_queue")
+    op.drop_table("prompt_queue")
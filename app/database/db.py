@@ -7,6 +7,7 @@ from comfy.cli_args import args
 
 _DB_AVAILABLE = False
 Session = None
+PromptStoreSession = None
 
 
 try:
@@ -14,7 +15,7 @@ try:
     from alembic.config import Config
     from alembic.runtime.migration import MigrationContext
     from alembic.script import ScriptDirectory
-    from sqlalchemy import create_engine
+    from sqlalchemy import create_engine, event
     from sqlalchemy.orm import sessionmaker
 
     _DB_AVAILABLE = True
@@ -65,6 +66,16 @@ def get_db_path():
         raise ValueError(f"Unsupported database URL '{url}'.")
 
 
+def _set_prompt_store_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers run during writes and makes the frequent small commits of the prompt store a
+    # sequential append. The journal mode is stored in the database file, so it is only switched when
+    # the queue is persisted.
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+
 def init_db():
     db_url = args.database_url
     logging.debug(f"Database URL: {db_url}")
@@ -110,3 +121,16 @@ def init_db():
 
 def create_session():
     return Session()
+
+
+def create_prompt_store_session():
+    """
+    Session for the prompt store (--persistent-queue). It has its own engine, the only one that
+    uses WAL and synchronous=NORMAL, the other connections keep the SQLite defaults.
+    """
+    global PromptStoreSession
+    if PromptStoreSession is None:
+        engine = create_engine(args.database_url)
+        event.listen(engine, "connect", _set_prompt_store_pragmas)
+        PromptStoreSession = sessionmaker(bind=engine)
+    return PromptStoreSession()
@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import traceback
+from typing import Callable, Optional
+
+import folder_paths
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class ObjectInfoSnapshot:
+    """
+    The /object_info response at one version: the serialized body, its ETag, and its compressed
+    forms which are computed the first time a client asks for them. Each form has its own ETag.
+    """
+    def __init__(self, version: int, body: bytes):
+        self.version = version
+        self.body = body
+        self.etag = '"{}"'.format(hashlib.sha256(body).hexdigest()[:32])
+        self._encoded: dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def etag_for(self, encoding: Optional[str]) -> str:
+        """ETag of the body sent with encoding (None for the uncompressed body)."""
+        if encoding is None:
+            return self.etag
+        return '{}-{}"'.format(self.etag[:-1], encoding)
+
+    def encoded(self, encoding: str) -> bytes:
+        with self._lock:
+            out = self._encoded.get(encoding)
+            if out is None:
+                if encoding == "br":
+                    out = brotli.compress(self.body, quality=5)
+                elif encoding == "gzip":
+                    out = gzip.compress(self.body, compresslevel=6)
+                else:
+                    raise ValueError(f"Unsupported encoding: {encoding}")
+                self._encoded[encoding] = out
+            return out
+
+
+def preferred_encoding(accept_encoding: str) -> Optional[str]:
+    """The encoding to send a snapshot with, for the Accept-Encoding header of a request."""
+    encodings = {e.split(";")[0].strip() for e in accept_encoding.split(",")}
+    if "br" in encodings and brotli is not None:
+        return "br"
+    if "gzip" in encodings:
+        return "gzip"
+    return None
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Whether an If-None-Match header (a list of entity tags, or *) matches etag, by weak comparison."""
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+def _directory_mtimes(path: str) -> dict[str, float]:
+    """Modification times of a directory and its direct subdirectories."""
+    out = {}
+    try:
+        out[path] = os.path.getmtime(path)
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir():
+                    out[entry.path] = entry.stat().st_mtime
+    except OSError:
+        pass
+    return out
+
+
+class ObjectInfoCache:
+    """
+    The node definitions served by /object_info, built once and kept until something they are
+    built from changes:
+    - a node class is registered, replaced or removed: only that class is rebuilt.
+    - a model folder listed by folder_paths.get_filename_list changes (checked with the mtimes
+      folder_paths already keeps), or the input directory changes: every class is rebuilt, since
+      any INPUT_TYPES can list those files.
+    - invalidate() is called.
+
+    Every class has the version at which its definition last changed, so clients that already hold
+    a version only fetch what changed since (changed_since). Versions start at the boot time in ms
+    so a version from a previous run of the server is always older than every class.
+    """
+    def __init__(self, node_info: Callable[[str], dict], class_mappings: dict, display_name_mappings: dict, on_folders_changed: Optional[Callable[[], None]] = None):
+        self.node_info = node_info
+        self.class_mappings = class_mappings
+        self.display_name_mappings = display_name_mappings
+        self.on_folders_changed = on_folders_changed
+        self.lock = threading.Lock()
+
+        self.base_version = time.time_ns() // 1_000_000
+        self.version = self.base_version
+        self.entries: dict[str, bytes] = {}
+        self.class_versions: dict[str, int] = {}
+        self.removed: dict[str, int] = {}
+        self.snapshot: Optional[ObjectInfoSnapshot] = None
+
+        self._classes: dict = {}
+        self._display_names: dict = {}
+        self._filename_lists: dict = {}
+        self._input_mtimes: dict[str, float] = {}
+        self._dirty: set[str] = set()
+        self._all_dirty = True
+
+    def invalidate(self, node_class: Optional[str] = None):
+        """Rebuild one class, or every class, on the next request."""
+        with self.lock:
+            if node_class is None:
+                self._all_dirty = True
+            else:
+                self._dirty.add(node_class)
+
+    def _folders_changed(self) -> bool:
+        for folder_name, entry in self._filename_lists.items():
+            try:
+                if folder_paths.cached_filename_list_(folder_name) is not entry:
+                    return True
+            except (KeyError, OSError):
+                return True
+        return _directory_mtimes(folder_paths.get_input_directory()) != self._input_mtimes
+
+    def _update(self):
+        if self._all_dirty or self._folders_changed():
+            if self.on_folders_changed is not None:
+                try:
+                    self.on_folders_changed()
+                except Exception as e:
+                    logging.error(f"Failed to seed assets: {e}")
+            dirty = set(self.class_mappings) | set(self.entries)
+        else:
+            dirty = set(self._dirty)
+            for name in set(self.class_mappings) | set(self._classes):
+                if self.class_mappings.get(name) is not self._classes.get(name) or self.display_name_mappings.get(name) != self._display_names.get(name):
+                    dirty.add(name)
+            if len(dirty) == 0:
+                return
+
+        version = self.version + 1
+        changed = False
+        with folder_paths.cache_helper:
+            for name in dirty:
+                data = None
+                if name in self.class_mappings:
+                    try:
+                        data = json.dumps(self.node_info(name)).encode("utf-8")
+                    except Exception:
+                        logging.error(f"[ERROR] An error occurred while retrieving information for the '{name}' node.")
+                        logging.error(traceback.format_exc())
+                if data is None:
+                    if self.entries.pop(name, None) is not None:
+                        self.class_versions.pop(name, None)
+                        self.removed[name] = version
+                        changed = True
+                elif self.entries.get(name) != data:
+                    self.entries[name] = data
+                    self.class_versions[name] = version
+                    self.removed.pop(name, None)
+                    changed = True
+
+        self._classes = dict(self.class_mappings)
+        self._display_names = dict(self.display_name_mappings)
+        self._filename_lists = dict(folder_paths.filename_list_cache)
+        self._input_mtimes = _directory_mtimes(folder_paths.get_input_directory())
+        self._dirty.clear()
+        self._all_dirty = False
+        if changed or self.snapshot is None:
+            self.version = version
+            self.snapshot = ObjectInfoSnapshot(version, self._join(self.entries))
+
+    def _join(self, entries: dict[str, bytes]) -> bytes:
+        """Serialized classes in registration order, like json.dumps of the dict of their infos."""
+        names = [name for name in self.class_mappings if name in entries]
+        return b"{" + b", ".join(json.dumps(name).encode("utf-8") + b": " + entries[name] for name in names) + b"}"
+
+    def get(self) -> ObjectInfoSnapshot:
+        """The current definitions of every node class, rebuilding what changed."""
+        with self.lock:
+            self._update()
+            return self.snapshot
+
+    def get_class(self, node_class: str) -> Optional[bytes]:
+        with self.lock:
+            self._update()
+            return self.entries.get(node_class)
+
+    def changed_since(self, since: int) -> bytes:
+        """
+        The classes whose definition changed after version since, and those removed since. full is
+        set when since isn't a version of this run of the server: nodes then holds every class and
+        the client should drop the ones it has that aren't in it.
+        """
+        with self.lock:
+            self._update()
+            full = since < self.base_version or since > self.version
+            entries = {name: data for name, data in self.entries.items() if full or self.class_versions[name] > since}
+            removed = [] if full else [name for name, version in self.removed.items() if version > since]
+            return b'{"version": %d, "full": %s, "removed": %s, "nodes": %s}' % (self.version, b"true" if full else b"false", json.dumps(removed).encode("utf-8"), self._join(entries))
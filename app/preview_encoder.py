@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import itertools
+import json
+import struct
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+from typing import Hashable, Optional
+
+from PIL import Image, ImageOps
+
+# Image type numbers of PREVIEW_IMAGE messages
+PREVIEW_TYPE_NUMBERS = {"JPEG": 1, "PNG": 2}
+MIMETYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+DEFAULT_QUALITY = 95
+# Streams and clients whose ordering state is kept before it is forgotten.
+MAX_TRACKED = 4096
+
+
+def preview_settings(client_flags: dict, image_type: str, with_metadata: bool) -> tuple[str, int]:
+    """
+    (format, quality) a client gets previews in, from its preview_format ("jpeg", "webp" or "png")
+    and preview_quality (1-100) feature flags. WebP is only sent in PREVIEW_IMAGE_WITH_METADATA
+    messages, which carry a mimetype.
+    """
+    image_format = client_flags.get("preview_format", None)
+    image_format = image_format.upper() if isinstance(image_format, str) else image_type
+    if image_format not in MIMETYPES or (image_format == "WEBP" and not with_metadata):
+        image_format = image_type
+    quality = client_flags.get("preview_quality", DEFAULT_QUALITY)
+    if not isinstance(quality, int) or isinstance(quality, bool) or not 1 <= quality <= 100:
+        quality = DEFAULT_QUALITY
+    return image_format, quality
+
+
+def encode_preview(image: Image.Image, max_size: Optional[int], settings: list[tuple[str, int]], metadata: Optional[dict] = None) -> dict[tuple[str, int], bytes]:
+    """
+    Resize a preview once and encode it once for each (format, quality). Returns the payload of
+    PREVIEW_IMAGE messages, or of PREVIEW_IMAGE_WITH_METADATA messages if metadata is given.
+    """
+    if max_size is not None:
+        image = ImageOps.contain(image, (max_size, max_size), Image.Resampling.BILINEAR)
+
+    out = {}
+    for image_format, quality in settings:
+        bytesIO = BytesIO()
+        if metadata is None:
+            bytesIO.write(struct.pack(">I", PREVIEW_TYPE_NUMBERS[image_format]))
+        else:
+            metadata_json = json.dumps({**metadata, "image_type": MIMETYPES[image_format]}).encode('utf-8')
+            bytesIO.write(struct.pack(">I", len(metadata_json)))
+            bytesIO.write(metadata_json)
+        image.save(bytesIO, format=image_format, quality=quality, compress_level=1)
+        out[(image_format, quality)] = bytesIO.getvalue()
+    return out
+
+
+class PreviewEncoder:
+    """
+    Encodes previews on a few threads instead of the event loop. Previews arriving while
+    max_pending of them are waiting or being encoded are dropped: a newer one follows shortly.
+
+    Encoding can finish out of order, so every preview gets a frame number when it is submitted
+    and is only delivered if it is newer than the last frame delivered on its stream (client and
+    node). Previews without a node id are also stale once another node started executing for
+    their client: the client would show them on that node.
+    """
+    def __init__(self, workers: int = 2, max_pending: int = 2):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="preview-encoder")
+        self.max_pending = max_pending
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.encoded = 0
+        self.dropped = 0
+        self.stale = 0
+        self.frames = itertools.count()
+        self.delivered: dict[Hashable, int] = {}
+        # Nodes started for each client (None: for every client), see node_started()
+        self.nodes_started: dict[Optional[str], int] = {}
+
+    def submit(self, image: Image.Image, max_size: Optional[int], settings: list[tuple[str, int]], metadata: Optional[dict] = None) -> Optional[Future]:
+        with self.lock:
+            if self.pending >= self.max_pending:
+                self.dropped += 1
+                return None
+            self.pending += 1
+        future = self.executor.submit(encode_preview, image, max_size, settings, metadata)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future: Future):
+        with self.lock:
+            self.pending -= 1
+            if future.exception() is None:
+                self.encoded += 1
+
+    def node_started(self, sid: Optional[str]):
+        """Record that a node started executing for client sid, or every client if sid is None."""
+        with self.lock:
+            if len(self.nodes_started) > MAX_TRACKED:
+                self.nodes_started.clear()
+            self.nodes_started[sid] = self.nodes_started.get(sid, 0) + 1
+
+    def _node_epoch(self, sid: Optional[str]) -> tuple[int, int]:
+        return self.nodes_started.get(None, 0), self.nodes_started.get(sid, 0) if sid is not None else 0
+
+    def new_frame(self, sid: Optional[str]) -> tuple[int, tuple[int, int]]:
+        """The number of a preview about to be submitted for sid, and the node epoch to pass to deliverable()."""
+        with self.lock:
+            return next(self.frames), self._node_epoch(sid)
+
+    def deliverable(self, stream: Hashable, sid: Optional[str], frame: int, epoch: tuple[int, int], has_node_id: bool) -> bool:
+        """Whether an encoded preview is still current. Records it as the last frame delivered on stream if it is."""
+        with self.lock:
+            if frame < self.delivered.get(stream, -1) or (not has_node_id and self._node_epoch(sid) != epoch):
+                self.stale += 1
+                return False
+            if len(self.delivered) > MAX_TRACKED:
+                self.delivered.clear()
+            self.delivered[stream] = frame
+            return True
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"pending": self.pending, "encoded": self.encoded, "dropped": self.dropped, "stale": self.stale}
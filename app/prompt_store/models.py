@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+
+from sqlalchemy import DateTime, Float, Index, Integer, String, Text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database.models import Base
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class PromptQueueItem(Base):
+    """A queued (or, when the process stopped, running) prompt."""
+    __tablename__ = "prompt_queue"
+
+    prompt_id: Mapped[str] = mapped_column(String(128), primary_key=True)
+    number: Mapped[float] = mapped_column(Float, nullable=False)
+    status: Mapped[str] = mapped_column(String(16), nullable=False, default="pending")
+    # JSON of the queue item without its sensitive extra data
+    item: Mapped[str] = mapped_column(Text, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=False), nullable=False, default=utcnow)
+
+    __table_args__ = (
+        Index("ix_prompt_queue_number", "number"),
+    )
+
+
+class PromptHistoryItem(Base):
+    __tablename__ = "prompt_history"
+
+    seq: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    prompt_id: Mapped[str] = mapped_column(String(128), nullable=False)
+    status: Mapped[str | None] = mapped_column(String(16), nullable=True)
+    workflow_id: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    # JSON of the history entry
+    entry: Mapped[str] = mapped_column(Text, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=False), nullable=False, default=utcnow)
+
+    __table_args__ = (
+        Index("uq_prompt_history_prompt_id", "prompt_id", unique=True),
+        Index("ix_prompt_history_workflow_id", "workflow_id"),
+    )
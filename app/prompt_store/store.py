@@ -0,0 +1,213 @@
+"""
+Durable prompt queue and history (--persistent-queue).
+
+PromptQueue keeps serving everything from memory and reports each change to a PromptStore, which
+only appends it to a list. A background thread writes the changes to the database in batches, one
+transaction per batch, so queueing a prompt never waits for the database and the prompt worker never
+touches it. Changes are serialized when they are reported, so one that can't be saved is dropped on
+its own instead of failing the batch it would have been written with. At startup the pending queue
+and the history are loaded back.
+
+The sensitive extra data of a prompt (execution.SENSITIVE_EXTRA_DATA_KEYS: api keys and auth
+tokens) is stripped before it is saved and never written to disk. Restored prompts come back
+without it, so nodes that need it (API nodes) fail until the prompt is queued again by the client.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+from typing import Callable, Optional
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.sqlite import insert
+
+from app.prompt_store.models import PromptHistoryItem, PromptQueueItem
+from comfy_execution.queue_index import item_workflow_id
+
+# Status given to prompts that were running when the process stopped. They are not run again
+# automatically since they might be what brought the process down.
+INTERRUPTED_MESSAGE = "Prompt was running when the server stopped."
+
+
+def _item_to_json(item) -> str:
+    # Sensitive extra data (api keys...) is never written to disk.
+    return json.dumps(list(item[:5]))
+
+
+def _item_from_json(data: str):
+    item = json.loads(data)
+    return tuple(item[:5]) + ({},)
+
+
+class PromptStore:
+    def __init__(self, session_factory: Callable, max_history: int, flush_interval: float = 0.05):
+        self.session_factory = session_factory
+        self.max_history = max_history
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.ops: list[tuple] = []
+        self.thread = threading.Thread(target=self._run, daemon=True, name="prompt-store-writer")
+        self.thread.start()
+
+    def _submit(self, *op):
+        with self.lock:
+            self.ops.append(op)
+        self.wakeup.set()
+
+    def put(self, item):
+        try:
+            data = _item_to_json(item)
+        except (TypeError, ValueError) as e:
+            logging.warning(f"Not saving queued prompt {item[1]} to the database: {e}")
+            return
+        self._submit("put", item[1], item[0], data)
+
+    def started(self, prompt_id):
+        self._submit("started", prompt_id)
+
+    def delete(self, prompt_id):
+        self._submit("delete", prompt_id)
+
+    def clear_queue(self):
+        self._submit("clear_queue")
+
+    def finished(self, prompt_id, entry: dict):
+        data = self._entry_to_json(prompt_id, entry)
+        status = (entry.get("status") or {}).get("status_str")
+        workflow_id = item_workflow_id(entry["prompt"])
+        self._submit("finished", prompt_id, status, None if workflow_id is None else str(workflow_id), data)
+
+    def delete_history(self, prompt_id):
+        self._submit("delete_history", prompt_id)
+
+    def clear_history(self):
+        self._submit("clear_history")
+
+    def _run(self):
+        while True:
+            self.wakeup.wait()
+            # Let a burst of changes accumulate into one transaction.
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """Write every pending change now."""
+        with self.write_lock:
+            with self.lock:
+                ops = self.ops
+                self.ops = []
+                self.wakeup.clear()
+            if len(ops) == 0:
+                return
+            try:
+                self._write(ops)
+                return
+            except Exception as e:
+                if len(ops) == 1:
+                    logging.error(f"Failed to save a prompt queue change to the database: {e}")
+                    return
+                logging.warning(f"Failed to save {len(ops)} prompt queue changes to the database, saving them one by one: {e}")
+            # Only the changes that fail on their own are lost.
+            failed = 0
+            for op in ops:
+                try:
+                    self._write([op])
+                except Exception as e:
+                    failed += 1
+                    logging.error(f"Failed to save prompt queue change {op[0]} of prompt {op[1] if len(op) > 1 else None} to the database: {e}")
+            if failed:
+                logging.error(f"{failed} of {len(ops)} prompt queue changes were not saved to the database.")
+
+    def close(self):
+        """Write the changes not saved yet. Called when the process exits."""
+        try:
+            self.flush()
+        except Exception as e:
+            logging.error(f"Failed to save the prompt queue on exit: {e}")
+
+    def _write(self, ops):
+        history_added = False
+        with self.session_factory() as session:
+            for op in ops:
+                kind = op[0]
+                if kind == "put":
+                    prompt_id, number, data = op[1], op[2], op[3]
+                    stmt = insert(PromptQueueItem).values(prompt_id=prompt_id, number=number, status="pending", item=data)
+                    session.execute(stmt.on_conflict_do_update(index_elements=["prompt_id"], set_={"number": number, "item": stmt.excluded.item}))
+                elif kind == "started":
+                    session.execute(update(PromptQueueItem).where(PromptQueueItem.prompt_id == op[1]).values(status="running"))
+                elif kind == "delete":
+                    session.execute(delete(PromptQueueItem).where(PromptQueueItem.prompt_id == op[1]))
+                elif kind == "clear_queue":
+                    session.execute(delete(PromptQueueItem).where(PromptQueueItem.status == "pending"))
+                elif kind == "finished":
+                    prompt_id, status, workflow_id, data = op[1], op[2], op[3], op[4]
+                    session.execute(delete(PromptQueueItem).where(PromptQueueItem.prompt_id == prompt_id))
+                    if data is None:
+                        continue
+                    session.execute(delete(PromptHistoryItem).where(PromptHistoryItem.prompt_id == prompt_id))
+                    session.add(PromptHistoryItem(prompt_id=prompt_id, status=status, workflow_id=workflow_id, entry=data))
+                    history_added = True
+                elif kind == "delete_history":
+                    session.execute(delete(PromptHistoryItem).where(PromptHistoryItem.prompt_id == op[1]))
+                elif kind == "clear_history":
+                    session.execute(delete(PromptHistoryItem))
+            if history_added:
+                session.flush()
+                newest = session.execute(select(PromptHistoryItem.seq).order_by(PromptHistoryItem.seq.desc()).limit(1)).scalar()
+                if newest is not None:
+                    session.execute(delete(PromptHistoryItem).where(PromptHistoryItem.seq <= newest - self.max_history))
+            session.commit()
+
+    @staticmethod
+    def _entry_to_json(prompt_id, entry) -> Optional[str]:
+        entry = dict(entry)
+        entry["prompt"] = list(entry["prompt"][:5])
+        try:
+            return json.dumps(entry)
+        except (TypeError, ValueError) as e:
+            logging.warning(f"Not saving history of prompt {prompt_id} to the database: {e}")
+            return None
+
+    def load(self):
+        """
+        Returns (pending, history): the queue items to run, in queue order, and a list of (prompt_id, entry)
+        oldest first. Prompts that were running are moved to the history as errors.
+        """
+        pending = []
+        interrupted = []
+        history = []
+        with self.session_factory() as session:
+            for row in session.execute(select(PromptQueueItem).order_by(PromptQueueItem.number)).scalars():
+                try:
+                    item = _item_from_json(row.item)
+                except ValueError as e:
+                    logging.warning(f"Dropping unreadable queued prompt {row.prompt_id}: {e}")
+                    continue
+                if row.status == "running":
+                    interrupted.append(item)
+                else:
+                    pending.append(item)
+            rows = session.execute(select(PromptHistoryItem).order_by(PromptHistoryItem.seq.desc()).limit(self.max_history)).scalars().all()
+            for row in reversed(rows):
+                try:
+                    entry = json.loads(row.entry)
+                except ValueError:
+                    continue
+                entry["prompt"] = tuple(entry["prompt"])
+                history.append((row.prompt_id, entry))
+
+        for item in interrupted:
+            entry = {
+                "prompt": item[:5],
+                "outputs": {},
+                "status": {"status_str": "error", "completed": False, "messages": [["execution_interrupted", {"prompt_id": item[1], "message": INTERRUPTED_MESSAGE}]]},
+            }
+            history.append((item[1], entry))
+            self.finished(item[1], entry)
+        return pending, history
@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+import aiohttp
+
+# Coalescable messages (progress, previews) queued for one client beyond this many are dropped,
+# oldest first.
+MAX_QUEUED = 64
+# A client with this many messages queued is too slow to catch up and is disconnected. It
+# reconnects and gets the current state.
+MAX_PENDING = 4096
+
+SEND_ERRORS = (aiohttp.ClientError, aiohttp.ClientPayloadError, ConnectionResetError, BrokenPipeError, ConnectionError)
+
+
+def coalesce_key(event, data) -> Optional[tuple]:
+    """
+    Messages with the same key replace each other while they wait in a client queue: only the
+    latest value of a node's progress matters. None for messages that must all be delivered.
+    """
+    if event == "progress" and isinstance(data, dict):
+        return ("progress", data.get("prompt_id"), data.get("node"))
+    return None
+
+
+class WebSocketOutbox:
+    """
+    Messages waiting to be sent to one websocket, written by their own task so a slow client only
+    delays itself.
+    """
+    def __init__(self, ws):
+        self.ws = ws
+        self.queue: OrderedDict[Hashable, tuple[bool, object]] = OrderedDict()
+        self.ready = asyncio.Event()
+        self.counter = itertools.count()
+        self.coalescable = 0
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        # Set once a send failed: the connection is gone, nothing more is queued or sent.
+        self.dead = False
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        self.queue.clear()
+        self.coalescable = 0
+
+    def put(self, message, binary: bool, key: Optional[Hashable] = None) -> bool:
+        """Queue a message. Returns False if the client can't keep up and should be dropped."""
+        if self.dead:
+            return True
+        if key is None:
+            key = ("seq", next(self.counter))
+        elif key in self.queue:
+            # The replacement is sent in order with the messages queued since, not in the old slot.
+            del self.queue[key]
+            self.coalesced += 1
+        else:
+            self.coalescable += 1
+        self.queue[key] = (binary, message)
+        self.ready.set()
+
+        if self.coalescable > MAX_QUEUED:
+            for k in list(self.queue):
+                if k[0] != "seq":
+                    del self.queue[k]
+                    self.dropped += 1
+                    self.coalescable -= 1
+                    if self.coalescable <= MAX_QUEUED:
+                        break
+        return len(self.queue) < MAX_PENDING
+
+    async def run(self):
+        while True:
+            await self.ready.wait()
+            if len(self.queue) == 0:
+                self.ready.clear()
+                continue
+            key, (binary, message) = self.queue.popitem(last=False)
+            if key[0] != "seq":
+                self.coalescable -= 1
+            try:
+                if binary:
+                    await self.ws.send_bytes(message)
+                else:
+                    await self.ws.send_str(message)
+                self.sent += 1
+            except SEND_ERRORS as err:
+                # The client is gone, the websocket handler removes the outbox when it sees the close.
+                logging.warning("send error: {}".format(err))
+                self.dead = True
+                self.queue.clear()
+                self.coalescable = 0
+                self.task = None
+                return
+
+
+class WebSocketFanout:
+    """The outboxes of the connected clients, by client id."""
+    def __init__(self):
+        self.outboxes: dict[str, WebSocketOutbox] = {}
+        self.disconnected_slow = 0
+        self.removed = {"sent": 0, "dropped": 0, "coalesced": 0}
+
+    def add(self, sid: str, ws) -> WebSocketOutbox:
+        self.remove(sid)
+        outbox = WebSocketOutbox(ws)
+        outbox.start()
+        self.outboxes[sid] = outbox
+        return outbox
+
+    def remove(self, sid: str):
+        outbox = self.outboxes.pop(sid, None)
+        if outbox is not None:
+            outbox.stop()
+            self.removed["sent"] += outbox.sent
+            self.removed["dropped"] += outbox.dropped
+            self.removed["coalesced"] += outbox.coalesced
+
+    def send(self, message, binary: bool, sid: Optional[str] = None, key: Optional[Hashable] = None):
+        """Queue an already serialized message for one client, or every client if sid is None."""
+        if sid is None:
+            targets = list(self.outboxes.items())
+        elif sid in self.outboxes:
+            targets = [(sid, self.outboxes[sid])]
+        else:
+            return
+        for client_id, outbox in targets:
+            if not outbox.put(message, binary, key):
+                logging.warning("Client {} is not reading its websocket messages, disconnecting it.".format(client_id))
+                self.disconnected_slow += 1
+                ws = outbox.ws
+                self.remove(client_id)
+                asyncio.get_running_loop().create_task(ws.close(code=aiohttp.WSCloseCode.TRY_AGAIN_LATER, message=b"too slow"))
+
+    def stats(self) -> dict:
+        outboxes = list(self.outboxes.values())
+        return {
+            "clients": len(outboxes),
+            "queued": sum(len(o.queue) for o in outboxes),
+            "max_queued": max((len(o.queue) for o in outboxes), default=0),
+            "sent": self.removed["sent"] + sum(o.sent for o in outboxes),
+            "dropped": self.removed["dropped"] + sum(o.dropped for o in outboxes),
+            "coalesced": self.removed["coalesced"] + sum(o.coalesced for o in outboxes),
+            "disconnected_slow": self.disconnected_slow,
+        }
@@ -107,12 +107,16 @@ class LatentPreviewMethod(enum.Enum):
 parser.add_argument("--preview-method", type=LatentPreviewMethod, default=LatentPreviewMethod.NoPreviews, help="Default preview method for sampler nodes.", action=EnumAction)
 
 parser.add_argument("--preview-size", type=int, default=512, help="Sets the maximum preview size for sampler nodes.")
+parser.add_argument("--progress-state-hz", type=float, default=10.0, metavar="HZ", help="Send node progress updates to a websocket client at most this many times per second (node start and finish are always sent). Clients can ask for their own rate with the progress_state_hz feature flag. 0 sends every update.")
 
 cache_group = parser.add_mutually_exclusive_group()
 cache_group.add_argument("--cache-classic", action="store_true", help="Use the old style (aggressive) caching.")
 cache_group.add_argument("--cache-lru", type=int, default=0, help="Use LRU caching with a maximum of N node results cached. May use more RAM/VRAM.")
 cache_group.add_argument("--cache-none", action="store_true", help="Reduced RAM/VRAM usage at the expense of executing every node for each run.")
 cache_group.add_argument("--cache-ram", nargs='?', const=4.0, type=float, default=0, help="Use RAM pressure caching with the specified headroom threshold. If available RAM drops below the threhold the cache remove large items to free RAM. Default 4GB")
+cache_group.add_argument("--cache-bytes", type=float, default=0, help="Use an LRU cache bounded by the size of the cached outputs, in GB. Entries are sized exactly when they are cached (CPU, GPU and pinned memory).")
+parser.add_argument("--cache-disk", nargs='?', const=20.0, type=float, default=0, help="Keep a persistent copy of cached node outputs on disk, limited to the given size in GB (default 20GB). Survives restarts and RAM pressure cache evictions.")
+parser.add_argument("--cache-disk-directory", type=str, default=None, help="Directory used by --cache-disk. Defaults to a node_output_cache folder in the user directory.")
 
 attn_group = parser.add_mutually_exclusive_group()
 attn_group.add_argument("--use-split-cross-attention", action="store_true", help="Use the split cross attention optimization. Ignored when xformers is used.")
@@ -167,6 +171,13 @@ parser.add_argument("--disable-pinned-memory", action="store_true", help="Disabl
 
 parser.add_argument("--mmap-torch-files", action="store_true", help="Use mmap when loading ckpt/pt files.")
 parser.add_argument("--disable-mmap", action="store_true", help="Don't use mmap when loading safetensors.")
+parser.add_argument("--model-read-threads", type=int, default=0, metavar="N", help="Read safetensors files with N threads doing large sequential reads before loading them, instead of letting the mmap fault pages in one by one. Mostly useful on network filesystems. The achieved bandwidth is logged.")
+parser.add_argument("--patched-weight-cache-size", type=float, default=0, metavar="GB", help="Keep up to this many GB of LoRA merged weights in RAM so loading a model with the same LoRAs again skips merging them. 0 (default) disables it.")
+parser.add_argument("--patched-weight-spill-dir", type=str, default=None, metavar="DIR", help="Directory where merged weights pushed out of --patched-weight-cache-size are written instead of being dropped.")
+parser.add_argument("--patched-weight-spill-size", type=float, default=16, metavar="GB", help="Maximum size of the merged weights kept in --patched-weight-spill-dir.")
+parser.add_argument("--offload-compression", type=str, default=None, choices=["fp8", "int8"], help="Stage a copy of the weights of modules offloaded to RAM compressed to fp8 (per tensor scale) or int8 (per block scale) and expand it on the GPU when they are used. Halves the bytes pinned and sent to the GPU for offloaded fp16/bf16 weights at some loss of precision while they are offloaded. Only the compressed copy stays in RAM: the full precision weights are written to the temp directory and read back when the module is loaded again.")
+parser.add_argument("--compiled-model-cache", type=str, default=None, metavar="DIR", help="Directory where diffusion models are stored ready to load (detected, converted and cast to their inference dtype) after they are first loaded. Later loads of the same file with the same options read that instead. Disabled by default.")
+parser.add_argument("--state-dict-cache-size", type=float, default=0, metavar="GB", help="Share the memory mapped weights of safetensors files loaded by several nodes (with dynamic VRAM) and keep up to this many GB of recently loaded files that are no longer in use mapped for the next loader. Off by default. Files kept mapped can't be deleted or replaced on Windows.")
 
 parser.add_argument("--dont-print-server", action="store_true", help="Don't print server output.")
 parser.add_argument("--quick-test-for-ci", action="store_true", help="Quick test for CI.")
@@ -221,7 +232,15 @@ parser.add_argument("--user-directory", type=is_valid_directory, default=None, h
 
 parser.add_argument("--enable-compress-response-body", action="store_true", help="Enable compressing response body.")
 
-parser.add_argument("--executor", type=str, default="legacy", choices=["legacy", "nova"], help="Select execution backend. 'nova' enables phased NOVA scheduler scaffolding.")
+parser.add_argument("--executor", type=str, default="legacy", choices=["legacy", "nova"], help="Select execution backend. 'nova' runs independent branches of the graph in parallel on a worker pool.")
+parser.add_argument("--nova-io-workers", type=int, default=4, help="Number of worker threads used by the nova executor for loader (disk bound) nodes.")
+parser.add_argument("--nova-cpu-workers", type=int, default=2, help="Number of worker threads used by the nova executor for nodes that don't run a model.")
+parser.add_argument("--batch-prompts", type=int, default=0, metavar="N", help="Execute up to N queued prompts that only differ in sampler seed or prompt text as one batched prompt (max 16). Only deterministic samplers are batched into a single sampling call.")
+parser.add_argument("--worker-devices", type=str, nargs="?", const="all", default=None, metavar="DEVICES", help="Run one prompt worker per device, all pulling from the same queue. Either \"all\" (the default when the flag is given without a value) for every visible GPU or a comma separated list of torch devices like cuda:0,cuda:1. Each worker has its own cache and prefers queued prompts that use the models it has loaded.")
+parser.add_argument("--queue-affinity-window", type=int, default=0, metavar="N", help="Look at the next N queued prompts and run the ones that use the same checkpoints and LoRAs as the previous prompt first, to avoid swapping models. 0 (default) runs prompts strictly in queue order.")
+parser.add_argument("--queue-affinity-max-delay", type=float, default=120.0, metavar="SECONDS", help="Longest a queued prompt can be held back by prompts moved ahead of it with --queue-affinity-window or --worker-devices.")
+parser.add_argument("--prefetch-models", action="store_true", help="While a prompt runs, read the model files of its upcoming loader nodes into the page cache in the background. Helps when models are on slow or network storage.")
+parser.add_argument("--eviction-policy", type=str, default="default", choices=["default", "cost"], help="How to pick the models to unload when memory is needed. 'default' unloads partially offloaded and unreferenced models first. 'cost' keeps the models that are slowest to load again, used most often or needed by queued prompts.")
 
 
 parser.add_argument(
@@ -236,6 +255,7 @@ database_default_path = os.path.abspath(
 )
 parser.add_argument("--database-url", type=str, default=f"sqlite:///{database_default_path}", help="Specify the database URL, e.g. for an in-memory database you can use 'sqlite:///:memory:'.")
 parser.add_argument("--disable-assets-autoscan", action="store_true", help="Disable asset scanning on startup for database synchronization.")
+parser.add_argument("--persistent-queue", action="store_true", help="Save the prompt queue and history in the database so they survive a restart. Prompts still queued are run again at startup, prompts that were running are added to the history as errors. API keys and auth tokens sent with a prompt are never saved, restored prompts run without them.")
 
 if comfy.options.args_parsing:
     args = parser.parse_args()
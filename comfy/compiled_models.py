@@ -0,0 +1,240 @@
+"""
+Cache of ready to load diffusion models (--compiled-model-cache).
+
+Loading a diffusion model file runs the model detection (model_detection.detect_unet_config) and
+converts its keys (prefix stripping, old fp8 quants, diffusers layouts) before the model is built
+and the weights are copied into it. The first time a file is loaded, the result is written to a
+single safetensors file: the converted state dict, with every weight already cast to the dtype of
+the parameter it is copied into, and the detected model config in its metadata. Later loads of the
+same file with the same options skip the detection and conversion and mmap that file instead.
+
+Artifacts are tied to the source file's size and modification time, the comfy version and the
+loading options, and are rewritten when any of them changes.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import struct
+import threading
+from typing import Optional
+
+import safetensors
+import torch
+
+import comfy.utils
+
+FORMAT_VERSION = 1
+METADATA_KEY = "comfy_compiled_model"
+# Tensor data starts at a multiple of this, tensors are written by decreasing element size so each
+# one is aligned to its element size.
+HEADER_ALIGNMENT = 64
+
+SAFETENSORS_DTYPES = {
+    torch.float64: "F64",
+    torch.float32: "F32",
+    torch.float16: "F16",
+    torch.bfloat16: "BF16",
+    torch.int64: "I64",
+    torch.int32: "I32",
+    torch.int16: "I16",
+    torch.int8: "I8",
+    torch.uint8: "U8",
+    torch.bool: "BOOL",
+    torch.float8_e4m3fn: "F8_E4M3",
+    torch.float8_e5m2: "F8_E5M2",
+}
+PRECAST_DTYPES = (torch.float32, torch.float16, torch.bfloat16)
+
+
+def _comfy_version() -> str:
+    try:
+        from comfyui_version import __version__
+        return __version__
+    except ImportError:
+        return ""
+
+
+def _encode(value):
+    if isinstance(value, torch.dtype):
+        return {"__dtype__": str(value).split(".")[-1]}
+    if isinstance(value, tuple):
+        return {"__tuple__": [_encode(v) for v in value]}
+    if isinstance(value, list):
+        return [_encode(v) for v in value]
+    if isinstance(value, dict):
+        if not all(isinstance(k, str) for k in value):
+            raise TypeError("non string key")
+        return {k: _encode(v) for k, v in value.items()}
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    raise TypeError(type(value).__name__)
+
+
+def _decode(value):
+    if isinstance(value, dict):
+        if "__dtype__" in value:
+            return getattr(torch, value["__dtype__"])
+        if "__tuple__" in value:
+            return tuple(_decode(v) for v in value["__tuple__"])
+        return {k: _decode(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    return value
+
+
+def _model_config_class(name: str):
+    import comfy.supported_models
+    return next((c for c in comfy.supported_models.models if c.__name__ == name), None)
+
+
+def write_safetensors(path: str, tensors: dict, metadata: dict, dtypes: Optional[dict] = None):
+    """
+    Write tensors to a safetensors file one at a time. Those with an entry in dtypes are cast to it
+    right before being written, so no converted copy of the whole state dict is ever in memory.
+    """
+    dtypes = dtypes or {}
+    items = sorted(((key, tensor, dtypes.get(key, tensor.dtype)) for key, tensor in tensors.items()), key=lambda x: -x[2].itemsize)
+
+    header = {"__metadata__": metadata}
+    offset = 0
+    for key, tensor, dtype in items:
+        size = tensor.numel() * dtype.itemsize
+        header[key] = {"dtype": SAFETENSORS_DTYPES[dtype], "shape": list(tensor.shape), "data_offsets": [offset, offset + size]}
+        offset += size
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    header_bytes += b" " * (-(len(header_bytes) + 8) % HEADER_ALIGNMENT)
+
+    with open(path, "wb") as f:
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        for _, tensor, dtype in items:
+            tensor = tensor.detach().to(device="cpu", dtype=dtype).contiguous()
+            if tensor.numel() > 0:
+                f.write(tensor.reshape(-1).view(torch.uint8).numpy().data)
+
+
+class CompiledModelCache:
+    def __init__(self, directory: Optional[str]):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.writing: set = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.directory is not None
+
+    def options_key(self, model_options: dict) -> Optional[dict]:
+        """The loading options an artifact depends on, or None if they can't be cached."""
+        if model_options.get("custom_operations", None) is not None:
+            return None
+        dtype = model_options.get("dtype", None)
+        return {
+            "dtype": None if dtype is None else str(dtype),
+            "fp8_optimizations": bool(model_options.get("fp8_optimizations", False)),
+        }
+
+    def artifact_path(self, source: str, options: dict) -> str:
+        digest = hashlib.sha256(json.dumps([os.path.realpath(source), options], sort_keys=True).encode("utf-8")).hexdigest()[:16]
+        name = os.path.splitext(os.path.basename(source))[0]
+        return os.path.join(self.directory, f"{name}-{digest}.safetensors")
+
+    def _header(self, source: str, options: dict) -> dict:
+        st = os.stat(source)
+        return {"version": FORMAT_VERSION, "comfy_version": _comfy_version(), "source_size": st.st_size, "source_mtime_ns": st.st_mtime_ns, "options": options}
+
+    def load(self, source: str, model_options: dict) -> Optional[tuple]:
+        """
+        (model_config, state_dict, parameters, weight_dtype, precast_dtype) of the artifact of a
+        source file, or None if there is no valid one.
+        """
+        if not self.enabled:
+            return None
+        options = self.options_key(model_options)
+        if options is None:
+            return None
+        path = self.artifact_path(source, options)
+        if not os.path.isfile(path):
+            return None
+        try:
+            with safetensors.safe_open(path, framework="pt") as f:
+                info = _decode(json.loads(f.metadata()[METADATA_KEY]))
+            expected = self._header(source, options)
+            if any(info.get(k) != v for k, v in expected.items()):
+                logging.info("Compiled model {} is out of date".format(path))
+                return None
+            model_config_class = _model_config_class(info["model_config"])
+            if model_config_class is None:
+                return None
+            model_config = model_config_class(info["unet_config"])
+            if info["quant_config"] is not None:
+                model_config.quant_config = info["quant_config"]
+            sd = comfy.utils.load_torch_file(path, safe_load=True)
+        except Exception as e:
+            logging.warning("Failed to read compiled model {}: {}".format(path, e))
+            return None
+        logging.info("Loading compiled model {}".format(path))
+        return model_config, dict(sd), info["parameters"], info["weight_dtype"], info["precast_dtype"]
+
+    def store(self, source: str, model_options: dict, model_config, state_dict: dict, parameters: int, weight_dtype, model_patcher):
+        """
+        Write the artifact of a source file in the background. state_dict holds the converted
+        weights, before the model consumed them.
+        """
+        if not self.enabled:
+            return
+        options = self.options_key(model_options)
+        if options is None:
+            return
+        path = self.artifact_path(source, options)
+        try:
+            info = self._header(source, options)
+            info.update({
+                "model_config": type(model_config).__name__,
+                # The model config constructor applies unet_extra_config again, which is idempotent.
+                "unet_config": _encode({k: v for k, v in model_config.unet_config.items() if k != "dtype"}),
+                "quant_config": _encode(getattr(model_config, "quant_config", None)),
+                "parameters": parameters,
+                "weight_dtype": _encode(weight_dtype),
+                "precast_dtype": _encode(model_config.unet_config.get("dtype", None)),
+            })
+            metadata = {METADATA_KEY: json.dumps(info)}
+        except TypeError as e:
+            logging.debug("Not compiling {}, its config can't be stored: {}".format(source, e))
+            return
+
+        # Store weights as the dtype of the parameters they are copied into. Dynamic models assign
+        # the tensors to the parameters instead and are left alone.
+        dtypes = {}
+        if not model_patcher.is_dynamic():
+            params = model_patcher.model.diffusion_model.state_dict()
+            for key, tensor in state_dict.items():
+                param = params.get(key, None)
+                if param is not None and param.dtype in PRECAST_DTYPES and tensor.dtype in PRECAST_DTYPES:
+                    dtypes[key] = param.dtype
+
+        with self.lock:
+            if path in self.writing:
+                return
+            self.writing.add(path)
+        threading.Thread(target=self._write, args=(path, dict(state_dict), metadata, dtypes), daemon=True, name="compiled-model-writer").start()
+
+    def _write(self, path, state_dict, metadata, dtypes):
+        tmp = "{}.{}.tmp".format(path, os.getpid())
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            write_safetensors(tmp, state_dict, metadata, dtypes=dtypes)
+            os.replace(tmp, path)
+            logging.info("Wrote compiled model {}".format(path))
+        except Exception as e:
+            logging.warning("Failed to write compiled model {}: {}".format(path, e))
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+        finally:
+            with self.lock:
+                self.writing.discard(path)
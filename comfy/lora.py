@@ -374,7 +374,78 @@ def pad_tensor_to_shape(tensor: torch.Tensor, new_shape: list[int]) -> torch.Ten
 
     return padded_tensor
 
-def calculate_weight(patches, weight, key, intermediate_dtype=torch.float32, original_weights=None):
+# Largest batch of LoRA diffs batched_lora_diffs() materializes at once.
+LORA_BATCH_BYTES = 256 * 1024 * 1024
+
+def is_plain_lora(patch):
+    """A LoRA patch (no DoRA, LoCon mid weight, reshape, offset, function or strength_model) whose merge is a scaled up @ down."""
+    strength, v, strength_model, offset, function = patch[:5]
+    if offset is not None or function is not None or strength_model != 1.0 or type(v) is not weight_adapter.LoRAAdapter:
+        return False
+    return v.weights[3] is None and v.weights[4] is None and v.weights[5] is None
+
+def lora_factors(patches, device, intermediate_dtype=torch.float32):
+    """
+    Concatenate the ranks of plain LoRA patches into a single (up, down) pair, with the strength and
+    alpha scaling folded into up, so that up @ down is the sum of their diffs.
+    """
+    ups = []
+    downs = []
+    for p in patches:
+        v = p[1].weights
+        mat1 = comfy.model_management.cast_to_device(v[0], device, intermediate_dtype)
+        mat2 = comfy.model_management.cast_to_device(v[1], device, intermediate_dtype)
+        alpha = v[2] / mat2.shape[0] if v[2] is not None else 1.0
+        ups.append(mat1.flatten(start_dim=1) * (p[0] * alpha))
+        downs.append(mat2.flatten(start_dim=1))
+    if len(ups) == 1:
+        return ups[0], downs[0]
+    return torch.cat(ups, dim=1), torch.cat(downs, dim=0)
+
+def batched_lora_diffs(key_patches, device, intermediate_dtype=torch.float32, max_batch_bytes=LORA_BATCH_BYTES):
+    """
+    Merged diffs of keys whose patches are all plain LoRAs, as {key: diff}. Keys with the same up and
+    down shapes are computed together with one bmm per batch of up to max_batch_bytes of output
+    instead of one small mm per patch. The diffs are flat (out, in) matrices: calculate_weight()
+    reshapes them. Keys with any other patch (LoHa, LoKr, OFT, DoRA...) are left out and merged patch by
+    patch by calculate_weight().
+    """
+    groups = {}
+    for key, patches in key_patches.items():
+        if len(patches) == 0 or not all(is_plain_lora(p) for p in patches):
+            continue
+        up, down = lora_factors(patches, device, intermediate_dtype)
+        groups.setdefault((up.shape, down.shape), []).append((key, up, down))
+
+    out = {}
+    for (up_shape, down_shape), items in groups.items():
+        if len(items) == 1:
+            key, up, down = items[0]
+            out[key] = torch.mm(up, down)
+            continue
+        diff_bytes = up_shape[0] * down_shape[1] * torch.empty((), dtype=intermediate_dtype).element_size()
+        batch = max(1, max_batch_bytes // max(1, diff_bytes))
+        for i in range(0, len(items), batch):
+            chunk = items[i:i + batch]
+            diffs = torch.bmm(torch.stack([x[1] for x in chunk]), torch.stack([x[2] for x in chunk]))
+            for (key, _, _), diff in zip(chunk, diffs.unbind(0)):
+                out[key] = diff
+    return out
+
+def calculate_weight(patches, weight, key, intermediate_dtype=torch.float32, original_weights=None, lora_diff=None):
+    """
+    Apply patches to weight. lora_diff is the precomputed sum of the diffs of patches when they are
+    all plain LoRAs (see batched_lora_diffs()). Without it, stacks of plain LoRAs are still merged
+    with a single matmul.
+    """
+    if lora_diff is None and len(patches) > 1 and all(is_plain_lora(p) for p in patches):
+        up, down = lora_factors(patches, weight.device, intermediate_dtype)
+        lora_diff = torch.mm(up, down)
+    if lora_diff is not None and lora_diff.numel() == weight.numel():
+        weight += lora_diff.reshape(weight.shape).type(weight.dtype)
+        return weight
+    # A shape mismatch goes through the per patch path below, which reports it.
+
     for p in patches:
         strength = p[0]
         v = p[1]
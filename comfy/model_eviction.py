@@ -0,0 +1,117 @@
+"""
+Policies deciding the order in which model_management.free_memory() unloads the models in
+current_loaded_models. Models with the smallest sort_key() are unloaded first.
+"""
+
+from __future__ import annotations
+
+import math
+import sys
+import threading
+import time
+import weakref
+from typing import Callable, Iterable, Optional
+
+# Bandwidth assumed for a device until a model load on it has been timed.
+DEFAULT_LOAD_BANDWIDTH = 2 * 1024 * 1024 * 1024
+# Loads moving less than this are too short to give a meaningful bandwidth.
+MIN_TIMED_LOAD_BYTES = 64 * 1024 * 1024
+# Uses older than this count for about a third as much as a use now.
+USAGE_DECAY_SECONDS = 600.0
+
+# ModelPatcher -> model files it was loaded from, as ("ckpt_name", "sd_xl_base_1.0.safetensors") keys.
+_model_keys: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_model_keys_lock = threading.Lock()
+
+
+def tag_model(patcher, keys: Iterable) -> None:
+    """Remember which model files a ModelPatcher was loaded from (see worker_pool.prompt_model_keys)."""
+    keys = frozenset(keys)
+    if len(keys) == 0:
+        return
+    with _model_keys_lock:
+        _model_keys[patcher] = _model_keys.get(patcher, frozenset()) | keys
+
+
+def model_keys(patcher) -> frozenset:
+    """Model files of a ModelPatcher and of the patchers it was cloned from."""
+    keys = frozenset()
+    with _model_keys_lock:
+        while patcher is not None:
+            keys |= _model_keys.get(patcher, frozenset())
+            patcher = getattr(patcher, "parent", None)
+    return keys
+
+
+class EvictionPolicy:
+    """
+    The historical order: models that are already partially offloaded first, then the ones nothing
+    else holds a reference to, then the smallest.
+    """
+
+    name = "default"
+
+    def sort_key(self, loaded_model) -> tuple:
+        return (-loaded_model.model_offloaded_memory(), sys.getrefcount(loaded_model.model), loaded_model.model_memory())
+
+    def model_used(self, loaded_model) -> None:
+        pass
+
+    def model_loaded(self, loaded_model, num_bytes: int, seconds: float) -> None:
+        pass
+
+
+class CostEvictionPolicy(EvictionPolicy):
+    """
+    Unloads the models that are cheapest to bring back first. The cost of a model is the time it
+    takes to load its currently loaded weights again, at the bandwidth measured for its device,
+    weighted by how often it was used recently. Models referenced by queued prompts are unloaded last.
+    """
+
+    name = "cost"
+
+    def __init__(self, queued_model_keys: Optional[Callable[[], frozenset]] = None):
+        self.queued_model_keys = queued_model_keys
+        self.bandwidth: dict = {}
+        self.usage: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+    def load_bandwidth(self, device) -> float:
+        return self.bandwidth.get(str(device), DEFAULT_LOAD_BANDWIDTH)
+
+    def usage_frequency(self, patcher, now: Optional[float] = None) -> float:
+        uses, last = self.usage.get(patcher, (0.0, 0.0))
+        if now is None:
+            now = time.monotonic()
+        return uses * math.exp(-(now - last) / USAGE_DECAY_SECONDS)
+
+    def model_used(self, loaded_model) -> None:
+        patcher = loaded_model.model
+        if patcher is None:
+            return
+        now = time.monotonic()
+        self.usage[patcher] = (self.usage_frequency(patcher, now) + 1.0, now)
+
+    def model_loaded(self, loaded_model, num_bytes: int, seconds: float) -> None:
+        if num_bytes < MIN_TIMED_LOAD_BYTES or seconds <= 0:
+            return
+        device = str(loaded_model.device)
+        measured = num_bytes / seconds
+        previous = self.bandwidth.get(device)
+        self.bandwidth[device] = measured if previous is None else previous * 0.7 + measured * 0.3
+
+    def reload_seconds(self, loaded_model) -> float:
+        return loaded_model.model_loaded_memory() / self.load_bandwidth(loaded_model.device)
+
+    def sort_key(self, loaded_model) -> tuple:
+        queued = False
+        if self.queued_model_keys is not None:
+            keys = model_keys(loaded_model.model)
+            queued = len(keys) > 0 and not keys.isdisjoint(self.queued_model_keys())
+        cost = self.reload_seconds(loaded_model) * (1.0 + self.usage_frequency(loaded_model.model))
+        return (queued, cost, loaded_model.model_memory())
+
+
+EVICTION_POLICIES = {
+    EvictionPolicy.name: EvictionPolicy,
+    CostEvictionPolicy.name: CostEvictionPolicy,
+}
@@ -21,20 +21,26 @@ import logging
 from enum import Enum
 from comfy.cli_args import args, PerformanceFeature
 import threading
+import time
+import contextvars
 import torch
-import sys
 import platform
 import weakref
 import gc
+import itertools
 import os
+import contextlib
 from contextlib import nullcontext
 import comfy.memory_management
+import comfy.model_eviction
 import comfy.utils
 import comfy.quant_ops
 
 import comfy_aimdo.torch
 import comfy_aimdo.model_vbar
 
+from comfy_execution.residency_graph import AssetState, MODEL_RESIDENCY
+
 class VRAMState(Enum):
     DISABLED = 0    #No vram present: no need to move models to vram
     NO_VRAM = 1     #Very low vram: enable all the options to save vram
@@ -180,9 +186,21 @@ def is_ixuca():
         return True
     return False
 
+# Set by each prompt worker when one worker runs per device (--worker-devices).
+torch_device_override: contextvars.ContextVar = contextvars.ContextVar("torch_device_override", default=None)
+
+def set_torch_device_override(device):
+    """Make get_torch_device() return device in the current context (thread or task)."""
+    torch_device_override.set(device)
+    if device is not None and getattr(device, "type", None) == "cuda" and device.index is not None:
+        torch.cuda.set_device(device)
+
 def get_torch_device():
     global directml_enabled
     global cpu_state
+    override = torch_device_override.get()
+    if override is not None:
+        return override
     if directml_enabled:
         global directml_device
         return directml_device
@@ -474,6 +492,27 @@ except:
 
 
 current_loaded_models = []
+# Guards the current_loaded_models list itself, only held while it is read or changed. Loading and
+# unloading models is serialized per device by device_models_lock(), so prompt workers on different
+# devices (--worker-devices) load their models at the same time.
+models_lock = threading.RLock()
+device_models_locks = {}
+
+def device_models_lock(device):
+    """The lock held while models are loaded to or unloaded from device (nodes can be dispatched from several threads)."""
+    with models_lock:
+        lock = device_models_locks.get(str(device))
+        if lock is None:
+            lock = threading.RLock()
+            device_models_locks[str(device)] = lock
+        return lock
+
+def _remove_loaded_model(loaded_model):
+    with models_lock:
+        for i in range(len(current_loaded_models)):
+            if current_loaded_models[i] is loaded_model:
+                return current_loaded_models.pop(i)
+    return None
 
 def module_size(module):
     module_mem = 0
@@ -611,41 +650,110 @@ def extra_reserved_memory():
 def minimum_inference_memory():
     return (1024 * 1024 * 1024) * 0.8 + extra_reserved_memory()
 
+eviction_policy = comfy.model_eviction.EVICTION_POLICIES[args.eviction_policy]()
+
+def set_eviction_policy(policy):
+    """Replace the policy ordering the models free_memory() unloads, see comfy/model_eviction.py."""
+    global eviction_policy
+    eviction_policy = policy
+
+# Every load, unload and RAM unload of the models, served at /nova/residency and /nova/metrics.
+model_residency = MODEL_RESIDENCY
+_residency_serial = itertools.count()
+
+def _residency_id(real_model):
+    asset_id = getattr(real_model, "comfy_residency_id", None)
+    if asset_id is None:
+        asset_id = "model:{}:{}".format(real_model.__class__.__name__, next(_residency_serial))
+        real_model.comfy_residency_id = asset_id
+        weakref.finalize(real_model, model_residency.touch, asset_id, state=AssetState.UNLOADED, bytes_gpu_resident=0, bytes_cpu_resident=0)
+    return asset_id
+
+def report_residency(loaded_model, event, seconds=None):
+    """Record a residency event (see comfy_execution/residency_graph.py) with where the model's weights are now."""
+    patcher = loaded_model.model
+    if patcher is None:
+        return
+    try:
+        real_model = getattr(patcher, "model", patcher)
+        total = loaded_model.model_memory()
+        loaded = loaded_model.model_loaded_memory()
+        if loaded <= 0:
+            state = AssetState.CPU_HOT
+        elif loaded >= total:
+            state = AssetState.GPU_FULL
+        else:
+            state = AssetState.GPU_PARTIAL
+        files = sorted(str(k[-1]) for k in comfy.model_eviction.model_keys(patcher))
+        model_residency.record(_residency_id(real_model), event, seconds=seconds, state=state, bytes_total=total,
+                               bytes_gpu_resident=loaded, bytes_cpu_resident=max(0, total - loaded),
+                               device=str(loaded_model.device), label=", ".join(files) or real_model.__class__.__name__)
+    except Exception as e:
+        logging.debug("Failed to record model residency: {}".format(e))
+
+def memory_stats():
+    """Stats of the RAM caches kept next to the loaded models."""
+    import comfy.model_patcher
+    import comfy.pinned_memory
+    return {
+        "state_dict_cache": comfy.utils.STATE_DICT_REGISTRY.stats(),
+        "patched_weight_cache": comfy.model_patcher.PATCHED_WEIGHTS.stats(),
+        "pinned_pool": comfy.pinned_memory.POOL.stats(),
+    }
+
 def free_memory(memory_required, device, keep_loaded=[], for_dynamic=False, ram_required=0):
+    with device_models_lock(device):
+        return _free_memory(memory_required, device, keep_loaded=keep_loaded, for_dynamic=for_dynamic, ram_required=ram_required)
+
+def _free_memory(memory_required, device, keep_loaded=[], for_dynamic=False, ram_required=0):
     cleanup_models_gc()
+    if ram_required > 0 and not DISABLE_SMART_MEMORY:
+        ram_short = ram_required - get_free_ram()
+        if ram_short > 0:
+            comfy.utils.STATE_DICT_REGISTRY.trim(ram_short)
     unloaded_model = []
     can_unload = []
     unloaded_models = []
 
-    for i in range(len(current_loaded_models) -1, -1, -1):
-        shift_model = current_loaded_models[i]
-        if shift_model.device == device:
-            if shift_model not in keep_loaded and not shift_model.is_dead():
-                can_unload.append((-shift_model.model_offloaded_memory(), sys.getrefcount(shift_model.model), shift_model.model_memory(), i))
-                shift_model.currently_used = False
-
-    for x in sorted(can_unload):
-        i = x[-1]
+    # The models of other devices can be loaded meanwhile: the models of this one are kept by
+    # reference, not by index.
+    with models_lock:
+        for i in range(len(current_loaded_models) -1, -1, -1):
+            shift_model = current_loaded_models[i]
+            if shift_model.device == device:
+                if shift_model not in keep_loaded and not shift_model.is_dead():
+                    can_unload.append((eviction_policy.sort_key(shift_model), i, shift_model))
+                    shift_model.currently_used = False
+
+    for x in sorted(can_unload, key=lambda x: x[:2]):
+        i, loaded_model = x[1], x[2]
         memory_to_free = 1e32
         ram_to_free = 1e32
         if not DISABLE_SMART_MEMORY:
             memory_to_free = memory_required - get_free_memory(device)
             ram_to_free = ram_required - get_free_ram()
 
-        if current_loaded_models[i].model.is_dynamic() and for_dynamic:
+        if loaded_model.model.is_dynamic() and for_dynamic:
             #don't actually unload dynamic models for the sake of other dynamic models
             #as that works on-demand.
-            memory_required -= current_loaded_models[i].model.loaded_size()
+            memory_required -= loaded_model.model.loaded_size()
             memory_to_free = 0
-        if memory_to_free > 0 and current_loaded_models[i].model_unload(memory_to_free):
-            logging.debug(f"Unloading {current_loaded_models[i].model.model.__class__.__name__}")
-            unloaded_model.append(i)
+        if memory_to_free > 0:
+            loaded_before = loaded_model.model_loaded_memory()
+            if loaded_model.model_unload(memory_to_free):
+                logging.debug(f"Unloading {loaded_model.model.model.__class__.__name__}")
+                unloaded_model.append((i, loaded_model))
+                report_residency(loaded_model, "unload")
+            elif loaded_model.model_loaded_memory() != loaded_before:
+                report_residency(loaded_model, "partial_unload")
         if ram_to_free > 0:
-            logging.debug(f"RAM Unloading {current_loaded_models[i].model.model.__class__.__name__}")
-            current_loaded_models[i].model.partially_unload_ram(ram_to_free)
+            logging.debug(f"RAM Unloading {loaded_model.model.model.__class__.__name__}")
+            loaded_model.model.partially_unload_ram(ram_to_free)
+            report_residency(loaded_model, "ram_unload")
 
-    for i in sorted(unloaded_model, reverse=True):
-        unloaded_models.append(current_loaded_models.pop(i))
+    for _, loaded_model in sorted(unloaded_model, key=lambda x: x[0], reverse=True):
+        if _remove_loaded_model(loaded_model) is not None:
+            unloaded_models.append(loaded_model)
 
     if len(unloaded_model) > 0:
         soft_empty_cache()
@@ -657,6 +765,17 @@ def free_memory(memory_required, device, keep_loaded=[], for_dynamic=False, ram_
     return unloaded_models
 
 def load_models_gpu(models, memory_required=0, force_patch_weights=False, minimum_memory_required=None, force_full_load=False):
+    devices = {}
+    for m in models:
+        for x in [m] + list(m.model_patches_models()):
+            devices[str(x.load_device)] = x.load_device
+    with contextlib.ExitStack() as stack:
+        # Always taken in the same order so workers loading to several devices can't deadlock.
+        for key in sorted(devices):
+            stack.enter_context(device_models_lock(devices[key]))
+        return _load_models_gpu(models, memory_required=memory_required, force_patch_weights=force_patch_weights, minimum_memory_required=minimum_memory_required, force_full_load=force_full_load)
+
+def _load_models_gpu(models, memory_required=0, force_patch_weights=False, minimum_memory_required=None, force_full_load=False):
     cleanup_models_gc()
     global vram_state
 
@@ -682,27 +801,31 @@ def load_models_gpu(models, memory_required=0, force_patch_weights=False, minimu
         if not x.is_dynamic():
             free_for_dynamic = False
         loaded_model = LoadedModel(x)
-        try:
-            loaded_model_index = current_loaded_models.index(loaded_model)
-        except:
-            loaded_model_index = None
+        with models_lock:
+            try:
+                loaded_model_index = current_loaded_models.index(loaded_model)
+                loaded = current_loaded_models[loaded_model_index]
+            except:
+                loaded_model_index = None
 
         if loaded_model_index is not None:
-            loaded = current_loaded_models[loaded_model_index]
             loaded.currently_used = True
             models_to_load.append(loaded)
         else:
             if hasattr(x, "model"):
                 logging.info(f"Requested to load {x.model.__class__.__name__}")
             models_to_load.append(loaded_model)
+        eviction_policy.model_used(models_to_load[-1])
+        report_residency(models_to_load[-1], "miss" if loaded_model_index is None else "hit")
 
     for loaded_model in models_to_load:
         to_unload = []
-        for i in range(len(current_loaded_models)):
-            if loaded_model.model.is_clone(current_loaded_models[i].model):
-                to_unload = [i] + to_unload
-        for i in to_unload:
-            model_to_unload = current_loaded_models.pop(i)
+        with models_lock:
+            for i in range(len(current_loaded_models)):
+                if loaded_model.model.is_clone(current_loaded_models[i].model):
+                    to_unload = [i] + to_unload
+            to_unload = [current_loaded_models.pop(i) for i in to_unload]
+        for model_to_unload in to_unload:
             model_to_unload.model.detach(unpatch_all=False)
             model_to_unload.model_finalizer.detach()
 
@@ -748,8 +871,16 @@ def load_models_gpu(models, memory_required=0, force_patch_weights=False, minimu
         if vram_set_state == VRAMState.NO_VRAM:
             lowvram_model_memory = 0.1
 
+        loaded_before = loaded_model.model_loaded_memory()
+        load_start = time.perf_counter()
         loaded_model.model_load(lowvram_model_memory, force_patch_weights=force_patch_weights)
-        current_loaded_models.insert(0, loaded_model)
+        load_seconds = time.perf_counter() - load_start
+        loaded_after = loaded_model.model_loaded_memory()
+        eviction_policy.model_loaded(loaded_model, loaded_after - loaded_before, load_seconds)
+        if loaded_after != loaded_before:
+            report_residency(loaded_model, "load" if loaded_after >= loaded_model.model_memory() else "partial_load", seconds=load_seconds)
+        with models_lock:
+            current_loaded_models.insert(0, loaded_model)
     return
 
 def load_model_gpu(model):
@@ -757,7 +888,9 @@ def load_model_gpu(model):
 
 def loaded_models(only_currently_used=False):
     output = []
-    for m in current_loaded_models:
+    with models_lock:
+        loaded = list(current_loaded_models)
+    for m in loaded:
         if only_currently_used:
             if not m.currently_used:
                 continue
@@ -771,8 +904,9 @@ def cleanup_models_gc():
 
     reset_cast_buffers()
 
-    for i in range(len(current_loaded_models)):
-        cur = current_loaded_models[i]
+    with models_lock:
+        loaded = list(current_loaded_models)
+    for cur in loaded:
         if cur.is_dead():
             logging.info("Potential memory leak detected with model {}, doing a full garbage collect, for maximum performance avoid circular references in the model code.".format(cur.real_model().__class__.__name__))
             do_gc = True
@@ -782,8 +916,9 @@ def cleanup_models_gc():
         gc.collect()
         soft_empty_cache()
 
-        for i in range(len(current_loaded_models)):
-            cur = current_loaded_models[i]
+        with models_lock:
+            loaded = list(current_loaded_models)
+        for cur in loaded:
             if cur.is_dead():
                 logging.warning("WARNING, memory leak with model {}. Please make sure it is not being referenced from somewhere.".format(cur.real_model().__class__.__name__))
 
@@ -796,13 +931,14 @@ def archive_model_dtypes(model):
 
 def cleanup_models():
     to_delete = []
-    for i in range(len(current_loaded_models)):
-        if current_loaded_models[i].real_model() is None:
-            to_delete = [i] + to_delete
+    with models_lock:
+        for i in range(len(current_loaded_models)):
+            if current_loaded_models[i].real_model() is None:
+                to_delete = [i] + to_delete
 
-    for i in to_delete:
-        x = current_loaded_models.pop(i)
-        del x
+        for i in to_delete:
+            x = current_loaded_models.pop(i)
+            del x
 
 def dtype_size(dtype):
     dtype_size = 4
@@ -1726,22 +1862,53 @@ class InterruptProcessingException(Exception):
 interrupt_processing_mutex = threading.RLock()
 
 interrupt_processing = False
-def interrupt_current_processing(value=True):
+# With one prompt worker per device (--worker-devices) each worker has its own interrupt flag, set
+# with set_interrupt_worker() in its context. The code running its prompt only sees its own flag.
+interrupt_worker: contextvars.ContextVar = contextvars.ContextVar("interrupt_worker", default=None)
+worker_interrupt_flags = {}
+
+def set_interrupt_worker(worker):
+    """Give the prompt worker running in the current context (thread or task) its own interrupt flag."""
+    with interrupt_processing_mutex:
+        worker_interrupt_flags.setdefault(worker, False)
+    interrupt_worker.set(worker)
+
+def interrupt_current_processing(value=True, worker=None):
+    """
+    Set the interrupt flag of worker. Without worker: the flag of the worker running in the current
+    context, or if there is none (the server) the flags of every worker.
+    """
     global interrupt_processing
     global interrupt_processing_mutex
+    if worker is None:
+        worker = interrupt_worker.get()
     with interrupt_processing_mutex:
+        if worker is not None:
+            worker_interrupt_flags[worker] = value
+            return
         interrupt_processing = value
+        for w in worker_interrupt_flags:
+            worker_interrupt_flags[w] = value
 
 def processing_interrupted():
     global interrupt_processing
     global interrupt_processing_mutex
+    worker = interrupt_worker.get()
     with interrupt_processing_mutex:
+        if worker is not None:
+            return worker_interrupt_flags.get(worker, False)
         return interrupt_processing
 
 def throw_exception_if_processing_interrupted():
     global interrupt_processing
     global interrupt_processing_mutex
+    worker = interrupt_worker.get()
     with interrupt_processing_mutex:
+        if worker is not None:
+            if worker_interrupt_flags.get(worker, False):
+                worker_interrupt_flags[worker] = False
+                raise InterruptProcessingException()
+            return
         if interrupt_processing:
             interrupt_processing = False
             raise InterruptProcessingException()
@@ -31,8 +31,11 @@ import comfy.float
 import comfy.hooks
 import comfy.lora
 import comfy.model_management
+import comfy.offload_compression
+import comfy.patched_weight_cache
 import comfy.patcher_extension
 import comfy.utils
+from comfy.cli_args import args
 from comfy.comfy_types import UnetWrapperFunction
 from comfy.quant_ops import QuantizedTensor
 from comfy.patcher_extension import CallbacksMP, PatcherInjection, WrappersMP
@@ -136,6 +139,13 @@ def low_vram_patch_estimate_vram(model, key):
 
     return weight.numel() * model_dtype.itemsize * LOWVRAM_PATCH_ESTIMATE_MATH_FACTOR
 
+# LoRA merged weights reused across loads of identically patched models, see comfy/patched_weight_cache.py
+PATCHED_WEIGHTS = comfy.patched_weight_cache.PatchedWeightCache(
+    int(args.patched_weight_cache_size * 1024 * 1024 * 1024),
+    disk_dir=args.patched_weight_spill_dir,
+    max_disk_bytes=int(args.patched_weight_spill_size * 1024 * 1024 * 1024),
+)
+
 def get_key_weight(model, key):
     set_func = None
     convert_func = None
@@ -634,7 +644,68 @@ class ModelPatcher:
                         sd.pop(k)
             return sd
 
-    def patch_weight_to_device(self, key, device_to=None, inplace_update=False, return_weight=False):
+    def _patched_weight_key(self, key, weight, set_func, temp_dtype):
+        return PATCHED_WEIGHTS.key(self.model, key, self.patches[key], temp_dtype, weight.dtype, weight.shape, set_func is None)
+
+    def _lora_diff_bytes(self, key):
+        """Size of the precomputed diff of key, 0 if its patches aren't all plain LoRAs (see comfy.lora.batched_lora_diffs())."""
+        patches = self.patches.get(key)
+        if not patches or not all(comfy.lora.is_plain_lora(p) for p in patches):
+            return 0
+        return get_key_weight(self.model, key)[0].numel() * 4
+
+    def _lora_diff_reserve(self, device_to):
+        """
+        Memory the precomputed LoRA diffs of one batch of _lora_diff_batches() hold on device_to while the
+        model loads. load() counts it in the memory budget.
+        """
+        if device_to is None or torch.device(device_to).type == "cpu":
+            return 0
+        total = 0
+        for key in self.patches:
+            total += self._lora_diff_bytes(key)
+            if total >= comfy.lora.LORA_BATCH_BYTES:
+                return comfy.lora.LORA_BATCH_BYTES
+        return total
+
+    def _lora_diff_batches(self, modules, device_to, max_bytes):
+        """
+        Split modules, a list of (name, module, weight keys), in batches whose precomputed LoRA diffs take at most
+        max_bytes (a module with larger diffs on its own is a batch by itself) and yield each batch with these diffs.
+        """
+        batch = []
+        batch_bytes = 0
+        for x in modules:
+            module_bytes = sum(self._lora_diff_bytes(key) for key in x[2])
+            if len(batch) > 0 and batch_bytes + module_bytes > max_bytes:
+                yield batch, self._batched_lora_diffs(batch, device_to)
+                batch = []
+                batch_bytes = 0
+            batch.append(x)
+            batch_bytes += module_bytes
+        if len(batch) > 0:
+            yield batch, self._batched_lora_diffs(batch, device_to)
+
+    def _batched_lora_diffs(self, modules, device_to):
+        # On the CPU the per key matmuls already run at full speed: batching them only costs memory.
+        if device_to is None or torch.device(device_to).type == "cpu":
+            return {}
+        temp_dtype = comfy.model_management.lora_compute_dtype(device_to)
+        key_patches = {}
+        for _, _, keys in modules:
+            for key in keys:
+                if key not in self.patches:
+                    continue
+                if PATCHED_WEIGHTS.enabled:
+                    weight, set_func, _ = get_key_weight(self.model, key)
+                    if PATCHED_WEIGHTS.contains(self._patched_weight_key(key, weight, set_func, temp_dtype)):
+                        continue
+                key_patches[key] = self.patches[key]
+        if len(key_patches) == 0:
+            return {}
+        return comfy.lora.batched_lora_diffs(key_patches, device_to)
+
+    def patch_weight_to_device(self, key, device_to=None, inplace_update=False, return_weight=False, lora_diff=None):
         weight, set_func, convert_func = get_key_weight(self.model, key)
         if key not in self.patches:
             return weight
@@ -645,16 +716,24 @@ class ModelPatcher:
             self.backup[key] = collections.namedtuple('Dimension', ['weight', 'inplace_update'])(weight.to(device=self.offload_device, copy=inplace_update), inplace_update)
 
         temp_dtype = comfy.model_management.lora_compute_dtype(device_to)
-        if device_to is not None:
-            temp_weight = comfy.model_management.cast_to_device(weight, device_to, temp_dtype, copy=True)
+        cache_key = self._patched_weight_key(key, weight, set_func, temp_dtype)
+        out_weight = PATCHED_WEIGHTS.get(cache_key)
+        if out_weight is not None:
+            out_weight = comfy.model_management.cast_to_device(out_weight, weight.device if device_to is None else device_to, None, copy=True)
         else:
-            temp_weight = weight.to(temp_dtype, copy=True)
-        if convert_func is not None:
-            temp_weight = convert_func(temp_weight, inplace=True)
+            if device_to is not None:
+                temp_weight = comfy.model_management.cast_to_device(weight, device_to, temp_dtype, copy=True)
+            else:
+                temp_weight = weight.to(temp_dtype, copy=True)
+            if convert_func is not None:
+                temp_weight = convert_func(temp_weight, inplace=True)
+
+            out_weight = comfy.lora.calculate_weight(self.patches[key], temp_weight, key, lora_diff=lora_diff)
+            if set_func is None:
+                out_weight = comfy.float.stochastic_rounding(out_weight, weight.dtype, seed=comfy.utils.string_to_seed(key))
+            PATCHED_WEIGHTS.put(cache_key, out_weight)
 
-        out_weight = comfy.lora.calculate_weight(self.patches[key], temp_weight, key)
         if set_func is None:
-            out_weight = comfy.float.stochastic_rounding(out_weight, weight.dtype, seed=comfy.utils.string_to_seed(key))
             if return_weight:
                 return out_weight
             elif inplace_update:
@@ -679,6 +758,17 @@ class ModelPatcher:
         for key in list(self.pinned):
             self.unpin_weight(key)
 
+    def _compress_offloaded(self, n, m):
+        if args.offload_compression is None or "{}.weight".format(n) in self.backup:
+            return 0
+        return comfy.offload_compression.compress_module(m, args.offload_compression)
+
+    def _decompress_offloaded(self, n, m, params):
+        if comfy.offload_compression.is_compressed(m):
+            for param in params:
+                self.unpin_weight(key_param_name_to_key(n, param))
+            comfy.offload_compression.decompress_module(m)
+
     def _load_list(self, prio_comfy_cast_weights=False):
         loading = []
         for n, m in self.model.named_modules():
@@ -691,7 +781,7 @@ class ModelPatcher:
                     skip = True # skip random weights in non leaf modules
                     break
             if not skip and (hasattr(m, "comfy_cast_weights") or len(params) > 0):
-                module_mem = comfy.model_management.module_size(m)
+                module_mem = comfy.offload_compression.module_size(m)
                 module_offload_mem = module_mem
                 if hasattr(m, "comfy_cast_weights"):
                     def check_module_offload_mem(key):
@@ -722,6 +812,8 @@ class ModelPatcher:
             load_completely = []
             offloaded = []
             offload_buffer = 0
+            # The LoRA diffs precomputed for the modules loaded completely stay on the device until they are merged.
+            lora_diff_reserve = self._lora_diff_reserve(device_to)
             loading.sort(reverse=True)
             for i, x in enumerate(loading):
                 module_offload_mem, module_mem, n, m, params = x
@@ -729,7 +821,7 @@ class ModelPatcher:
                 lowvram_weight = False
 
                 potential_offload = max(offload_buffer, module_offload_mem + sum([ x1[1] for x1 in loading[i+1:i+1+comfy.model_management.NUM_STREAMS]]))
-                lowvram_fits = mem_counter + module_mem + potential_offload < lowvram_model_memory
+                lowvram_fits = mem_counter + module_mem + potential_offload + lora_diff_reserve < lowvram_model_memory
 
                 weight_key = "{}.weight".format(n)
                 bias_key = "{}.bias".format(n)
@@ -769,6 +861,7 @@ class ModelPatcher:
                     offloaded.append((module_mem, n, m, params))
                 else:
                     if hasattr(m, "comfy_cast_weights"):
+                        self._decompress_offloaded(n, m, params)
                         wipe_lowvram_weight(m)
 
                     if full_load or lowvram_fits:
@@ -790,6 +883,7 @@ class ModelPatcher:
                 mem_counter += move_weight_functions(m, device_to)
 
             load_completely.sort(reverse=True)
+            to_patch = []
             for x in load_completely:
                 n = x[1]
                 m = x[2]
@@ -797,16 +891,19 @@ class ModelPatcher:
                 if hasattr(m, "comfy_patched_weights"):
                     if m.comfy_patched_weights == True:
                         continue
+                to_patch.append((n, m, [key_param_name_to_key(n, param) for param in params]))
 
-                for param in params:
-                    key = key_param_name_to_key(n, param)
-                    self.unpin_weight(key)
-                    self.patch_weight_to_device(key, device_to=device_to)
-                if comfy.model_management.is_device_cuda(device_to):
-                    torch.cuda.synchronize()
+            # LoRA diffs of modules with the same shapes are computed together, see comfy.lora.batched_lora_diffs()
+            for batch, lora_diffs in self._lora_diff_batches(to_patch, device_to, max(lora_diff_reserve, 1)):
+                for n, m, keys in batch:
+                    for key in keys:
+                        self.unpin_weight(key)
+                        self.patch_weight_to_device(key, device_to=device_to, lora_diff=lora_diffs.pop(key, None))
+                    if comfy.model_management.is_device_cuda(device_to):
+                        torch.cuda.synchronize()
 
-                logging.debug("lowvram: loaded module regularly {} {}".format(n, m))
-                m.comfy_patched_weights = True
+                    logging.debug("lowvram: loaded module regularly {} {}".format(n, m))
+                    m.comfy_patched_weights = True
 
             for x in load_completely:
                 x[2].to(device_to)
@@ -814,6 +911,7 @@ class ModelPatcher:
             for x in offloaded:
                 n = x[1]
                 params = x[3]
+                self._compress_offloaded(n, x[2])
                 for param in params:
                     self.pin_weight_to_device(key_param_name_to_key(n, param))
 
@@ -864,6 +962,7 @@ class ModelPatcher:
             if self.model.model_lowvram:
                 for m in self.model.modules():
                     move_weight_functions(m, device_to)
+                    comfy.offload_compression.decompress_module(m)
                     wipe_lowvram_weight(m)
 
                 self.model.model_lowvram = False
@@ -901,6 +1000,7 @@ class ModelPatcher:
         with self.use_ejected():
             hooks_unpatched = False
             memory_freed = 0
+            staged = 0
             patch_counter = 0
             unload_list = self._load_list()
             unload_list.sort()
@@ -971,6 +1071,8 @@ class ModelPatcher:
                         offload_weight_factor.pop(0)
                         logging.debug("freed {}".format(n))
 
+                        if lowvram_possible:
+                            staged += self._compress_offloaded(n, m)
                         for param in params:
                             self.pin_weight_to_device(key_param_name_to_key(n, param))
 
@@ -979,6 +1081,8 @@ class ModelPatcher:
             self.model.lowvram_patch_counter += patch_counter
             self.model.model_loaded_weight_memory -= memory_freed
             self.model.model_offload_buffer_memory = offload_buffer
+            if staged > 0:
+                logging.debug("Compressed offloaded weights: {:.2f} MB staged for transfer".format(staged / (1024 * 1024)))
             logging.info("Unloaded partially: {:.2f} MB freed, {:.2f} MB remains loaded, {:.2f} MB buffer reserved, lowvram patches: {}".format(memory_freed / (1024 * 1024), self.model.model_loaded_weight_memory / (1024 * 1024), offload_buffer / (1024 * 1024), self.model.lowvram_patch_counter))
             return memory_freed
 
@@ -1579,12 +1683,18 @@ class ModelPatcherDynamic(ModelPatcher):
         return 0 if vbar is None else vbar.free_memory(memory_to_free)
 
     def partially_unload_ram(self, ram_to_unload):
+        # Unpinned blocks go back to the pool, RAM is only given back when a slab empties out and is
+        # unregistered, so count what the pool actually released.
+        registered = comfy.pinned_memory.registered_bytes()
         loading = self._load_list(prio_comfy_cast_weights=True)
         for x in loading:
             _, _, _, _, m, _ = x
-            ram_to_unload -= comfy.pinned_memory.unpin_memory(m)
-            if ram_to_unload <= 0:
+            if comfy.pinned_memory.unpin_memory(m) == 0:
+                continue
+            comfy.pinned_memory.trim_pool()
+            if registered - comfy.pinned_memory.registered_bytes() >= ram_to_unload:
                 return
+        comfy.pinned_memory.trim_pool()
 
     def patch_model(self, device_to=None, lowvram_model_memory=0, load_weights=True, force_patch_weights=False):
         #This isn't used by the core at all and can only be to load a model out of
@@ -0,0 +1,117 @@
+"""
+Compressed CPU tier for offloaded weights (--offload-compression).
+
+When a ModelPatcher offloads modules to the CPU (partially_unload, or a partial load), the weights
+they are computed with are replaced by QuantizedTensors of a comfy.quant_ops layout: per tensor
+scaled FP8 or block scaled int8. That halves (from fp16/bf16) or quarters (from fp32) the bytes
+pinned and sent to the GPU on every cast. comfy.ops.cast_bias_weight dequantizes them on the
+compute device.
+
+The compressed copy is the only copy of the weight kept in RAM. The full precision weight is
+written to a file in spill_directory and mapped back from it, so the OS can page it out, and it is
+read back from that file when the module is loaded again or the model is unpatched: the
+quantization error never outlives the offload.
+"""
+
+import logging
+import os
+import tempfile
+
+import torch
+
+import comfy.model_management
+from comfy.quant_ops import QuantizedTensor, ck_available
+
+LAYOUTS = {
+    "fp8": "TensorCoreFP8E4M3Layout",
+    "int8": "BlockINT8Layout",
+}
+COMPRESSIBLE_DTYPES = (torch.float32, torch.float16, torch.bfloat16)
+
+# Where the full precision weights of compressed modules go. main.py points it at the temp
+# directory, which is cleaned up at exit and startup. None uses the system temp directory.
+spill_directory = None
+
+
+def is_compressed(m) -> bool:
+    return getattr(m, "comfy_offload_compressed", None) is not None
+
+
+def module_size(m) -> int:
+    """Size of the module on the compute device, which is its uncompressed size."""
+    size = getattr(m, "comfy_offload_compressed", None)
+    if size is not None:
+        return size
+    return comfy.model_management.module_size(m)
+
+
+def _spill(tensor):
+    """Copy tensor to a file and return a tensor mapped from it, plus the path if it must be removed later."""
+    if spill_directory is not None:
+        os.makedirs(spill_directory, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix="offload_", suffix=".bin", dir=spill_directory)
+    try:
+        os.ftruncate(fd, tensor.nbytes)
+    finally:
+        os.close(fd)
+    try:
+        source = torch.from_file(path, shared=True, size=tensor.nbytes, dtype=torch.uint8)
+        source = source.view(tensor.dtype).view(tensor.shape)
+        source.copy_(tensor)
+    except Exception:
+        os.remove(path)
+        raise
+    try:
+        os.remove(path)  # the mapping keeps it alive
+        path = None
+    except OSError:  # Windows doesn't remove mapped files
+        pass
+    return source, path
+
+
+def compress_module(m, mode) -> int:
+    """Stage a compressed copy of the weight of a module that lives on the CPU. Returns its size in bytes."""
+    weight = getattr(m, "weight", None)
+    if mode is None or is_compressed(m) or not ck_available():
+        return 0
+    if not isinstance(weight, torch.Tensor) or isinstance(weight, QuantizedTensor) or weight.dtype not in COMPRESSIBLE_DTYPES:
+        return 0
+    if not comfy.model_management.is_device_cpu(weight.device) or weight.numel() == 0:
+        return 0
+
+    size = comfy.model_management.module_size(m)
+    try:
+        qweight = QuantizedTensor.from_float(weight.data, LAYOUTS[mode], scale="recalculate")
+        source, path = _spill(weight.data)
+    except Exception as e:
+        logging.warning("Failed to compress offloaded weight of {}: {}".format(type(m).__name__, e))
+        return 0
+    # Plain tensors, so the module doesn't register them as parameters
+    m.comfy_offload_source = source
+    m.comfy_offload_source_path = path
+    m.weight = torch.nn.Parameter(qweight, requires_grad=False)
+    m.comfy_offload_compressed = size
+    return comfy.model_management.module_size(m) - (size - weight.nbytes)
+
+
+def decompress_module(m):
+    """Read the full precision weight back into RAM, dropping the compressed copy and the spilled one."""
+    if not is_compressed(m):
+        return
+    m.weight = torch.nn.Parameter(m.comfy_offload_source.clone(), requires_grad=False)
+    path = m.comfy_offload_source_path
+    del m.comfy_offload_source
+    del m.comfy_offload_source_path
+    del m.comfy_offload_compressed
+    if path is not None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def dequantize_weight(s, weight):
+    """Used by cast_bias_weight on the weight of a compressed module once it is on the compute device."""
+    if is_compressed(s) and isinstance(weight, QuantizedTensor):
+        return weight.dequantize()
+    return weight
@@ -24,6 +24,7 @@ import comfy.float
 import comfy.rmsnorm
 import json
 import comfy.memory_management
+import comfy.offload_compression
 import comfy.pinned_memory
 import comfy.utils
 
@@ -248,6 +249,9 @@ def cast_bias_weight(s, input=None, dtype=None, device=None, bias_dtype=None, of
     bias_a = bias
     weight_a = weight
 
+    # Offloaded weights kept compressed in RAM are sent compressed and expanded here.
+    weight = comfy.offload_compression.dequantize_weight(s, weight)
+
     if s.bias is not None:
         bias = bias.to(dtype=bias_dtype)
         for f in s.bias_function:
@@ -0,0 +1,102 @@
+"""
+Parallel sequential reads of model files into the page cache.
+
+Loading a safetensors file through its mmap faults the pages in one at a time, in whatever order the
+weights are first touched, which is slow on network filesystems. readahead() reads the file with a
+few threads in large aligned chunks first, so the mmap finds everything resident.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+CHUNK_SIZE = 32 * 1024 * 1024
+
+
+def _advise(fd, offset, length):
+    if hasattr(os, "posix_fadvise"):
+        try:
+            os.posix_fadvise(fd, offset, length, os.POSIX_FADV_SEQUENTIAL)
+            os.posix_fadvise(fd, offset, length, os.POSIX_FADV_WILLNEED)
+        except OSError:
+            pass
+
+
+def readahead(path: str, threads: int = 4, offset: int = 0, length: Optional[int] = None, chunk_size: int = CHUNK_SIZE,
+              should_stop: Optional[Callable[[], bool]] = None) -> tuple[int, float]:
+    """
+    Read length bytes of path starting at offset (the whole file by default) using threads threads,
+    each reading chunk_size aligned chunks. Returns (bytes read, seconds). Stops early when
+    should_stop() returns True.
+    """
+    size = os.path.getsize(path)
+    if length is None:
+        length = size - offset
+    end = min(size, offset + length)
+    start_offset = offset - offset % chunk_size
+    chunks = list(range(start_offset, end, chunk_size))
+    threads = max(1, min(threads, len(chunks)))
+
+    next_chunk = [0]
+    lock = threading.Lock()
+    totals = [0] * threads
+    errors = []
+
+    start = time.perf_counter()
+    fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        _advise(fd, start_offset, end - start_offset)
+
+        def worker(index):
+            buffer = bytearray(chunk_size)
+            view = memoryview(buffer)
+            try:
+                while should_stop is None or not should_stop():
+                    with lock:
+                        i = next_chunk[0]
+                        next_chunk[0] += 1
+                    if i >= len(chunks):
+                        return
+                    position = chunks[i]
+                    want = min(chunk_size, end - position)
+                    while want > 0:
+                        if hasattr(os, "preadv"):
+                            n = os.preadv(fd, [view[:want]], position)
+                        elif hasattr(os, "pread"):
+                            n = len(os.pread(fd, want, position))
+                        else:
+                            # Windows: no positional reads, share the file offset.
+                            with lock:
+                                os.lseek(fd, position, os.SEEK_SET)
+                                n = len(os.read(fd, want))
+                        if n <= 0:
+                            break
+                        totals[index] += n
+                        position += n
+                        want -= n
+            except OSError as e:
+                errors.append(e)
+
+        if threads == 1:
+            worker(0)
+        else:
+            pool = [threading.Thread(target=worker, args=(i,), daemon=True, name="model-read-{}".format(i)) for i in range(threads)]
+            for t in pool:
+                t.start()
+            for t in pool:
+                t.join()
+    finally:
+        os.close(fd)
+
+    if len(errors) > 0:
+        raise errors[0]
+    return sum(totals), time.perf_counter() - start
+
+
+def log_bandwidth(path: str, num_bytes: int, seconds: float, threads: int):
+    gb = num_bytes / (1024 * 1024 * 1024)
+    logging.info("Read {} ({:.2f} GB) in {:.2f}s, {:.2f} GB/s with {} threads".format(os.path.basename(path), gb, seconds, gb / max(seconds, 1e-6), threads))
@@ -0,0 +1,216 @@
+"""
+Cache of patched (LoRA merged) weights, used by ModelPatcher.patch_weight_to_device.
+
+Loading the same ModelPatcher clone again, or any clone applying the same patches to the same base
+model, reuses the merged weights instead of running comfy.lora.calculate_weight for every key. The
+key identifies the base model, the weight key and every tensor, adapter and strength of the ordered
+patch list. Tensors are identified by the objects themselves: an entry is dropped as soon as one of
+them is freed, so a new tensor reusing the address can't match it.
+
+Merged weights are kept in RAM up to a budget and, when a directory is set, least recently used ones
+are spilled there instead of being dropped.
+"""
+
+from __future__ import annotations
+
+import atexit
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Any, Optional
+
+_SCALAR_TYPES = (int, float, str, bool, bytes, type(None))
+
+
+class Uncacheable(Exception):
+    pass
+
+
+def _fingerprint(value, refs: list):
+    if isinstance(value, _SCALAR_TYPES):
+        return value
+    if isinstance(value, (tuple, list)):
+        return (type(value).__name__,) + tuple(_fingerprint(v, refs) for v in value)
+    if isinstance(value, dict):
+        return ("dict",) + tuple((k, _fingerprint(v, refs)) for k, v in value.items())
+    weights = getattr(value, "weights", None)
+    if weights is not None and not hasattr(value, "data_ptr"):
+        # comfy.weight_adapter adapters: new objects on every load but built over the same tensors.
+        return (type(value).__name__, _fingerprint(weights, refs))
+    try:
+        refs.append(weakref.ref(value))
+    except TypeError:
+        raise Uncacheable(type(value).__name__)
+    return ("obj", id(value))
+
+
+def make_key(model, weight_key: str, patches: list, *extra) -> tuple:
+    """
+    Returns (key, refs): refs are weak references to the objects the key identifies by id. Raises
+    Uncacheable when a patch contains something that can't be identified.
+    """
+    refs = []
+    key = (_fingerprint(model, refs), weight_key, _fingerprint(patches, refs)) + tuple(str(e) for e in extra)
+    return key, refs
+
+
+class _Entry:
+    __slots__ = ("value", "size", "refs", "path")
+
+    def __init__(self, value, size, refs):
+        self.value = value
+        self.size = size
+        self.refs = refs
+        self.path = None
+
+
+class PatchedWeightCache:
+    def __init__(self, max_bytes: int, disk_dir: Optional[str] = None, max_disk_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.disk_dir = None
+        self.max_disk_bytes = 0
+        if disk_dir is not None and max_disk_bytes > 0:
+            # Keys only mean something in this process: spill to a directory of our own.
+            os.makedirs(disk_dir, exist_ok=True)
+            self.disk_dir = tempfile.mkdtemp(prefix="patched_weights_", dir=disk_dir)
+            self.max_disk_bytes = max_disk_bytes
+            atexit.register(shutil.rmtree, self.disk_dir, True)
+        # Reentrant: freeing a tensor while the lock is held runs the weakref callbacks.
+        self.lock = threading.RLock()
+        self.entries: OrderedDict = OrderedDict()
+        self.on_disk: OrderedDict = OrderedDict()
+        self.ram_bytes = 0
+        self.disk_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def key(self, model, weight_key: str, patches: list, *extra) -> Optional[tuple]:
+        if not self.enabled:
+            return None
+        try:
+            return make_key(model, weight_key, patches, *extra)
+        except Uncacheable:
+            return None
+
+    def contains(self, key) -> bool:
+        if key is None:
+            return False
+        with self.lock:
+            return key[0] in self.entries or key[0] in self.on_disk
+
+    def get(self, key) -> Optional[Any]:
+        """The merged weight stored under a key from key(), on the CPU, or None."""
+        if key is None:
+            return None
+        key = key[0]
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry.value
+            entry = self.on_disk.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            try:
+                value = _load(entry.path)
+            except Exception as e:
+                logging.warning("Failed to read spilled patched weight {}: {}".format(entry.path, e))
+                self._drop(key)
+                self.misses += 1
+                return None
+            self._drop(key)
+            self.hits += 1
+        self._store(key, entry.refs, value)
+        return value
+
+    def put(self, key, value):
+        """Store a merged weight. It is copied to the CPU when it isn't there already."""
+        if key is None:
+            return
+        key, refs = key
+        if getattr(getattr(value, "device", None), "type", "cpu") != "cpu":
+            value = value.to("cpu")
+        self._store(key, refs, value)
+
+    def _store(self, key, refs, value):
+        size = getattr(value, "nbytes", 0)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries or any(r() is None for r in refs):
+                return
+            entry = _Entry(value, size, [])
+            callback = lambda _, key=key: self._drop(key)
+            entry.refs = [weakref.ref(r(), callback) for r in refs]
+            self.entries[key] = entry
+            self.ram_bytes += size
+            while self.ram_bytes > self.max_bytes:
+                self._spill(next(iter(self.entries)))
+
+    def _spill(self, key):
+        entry = self.entries.pop(key)
+        self.ram_bytes -= entry.size
+        if self.max_disk_bytes < entry.size:
+            return
+        path = os.path.join(self.disk_dir, hashlib.sha256(repr(key).encode()).hexdigest() + ".safetensors")
+        try:
+            _save(path, entry.value)
+        except Exception as e:
+            logging.warning("Failed to spill patched weight to {}: {}".format(path, e))
+            return
+        entry.value = None
+        entry.path = path
+        self.on_disk[key] = entry
+        self.disk_bytes += entry.size
+        while self.disk_bytes > self.max_disk_bytes:
+            self._drop(next(iter(self.on_disk)))
+
+    def _drop(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.ram_bytes -= entry.size
+            entry = self.on_disk.pop(key, None)
+            if entry is not None:
+                self.disk_bytes -= entry.size
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+
+    def clear(self):
+        with self.lock:
+            for key in list(self.entries.keys()) + list(self.on_disk.keys()):
+                self._drop(key)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.ram_bytes,
+                "spilled_entries": len(self.on_disk),
+                "spilled_bytes": self.disk_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def _save(path, tensor):
+    import safetensors.torch
+    safetensors.torch.save_file({"weight": tensor.contiguous()}, path)
+
+
+def _load(path):
+    import safetensors.torch
+    return safetensors.torch.load_file(path)["weight"]
@@ -1,9 +1,27 @@
 import torch
+import weakref
 import comfy.model_management
 import comfy.memory_management
+import comfy.pinned_pool
 
 from comfy.cli_args import args
 
+class TorchPinnedBackend:
+    """Slabs for comfy.pinned_pool, registered through model_management.pin_memory() so they count towards MAX_PINNED_MEMORY."""
+    def allocate(self, nbytes):
+        slab = torch.empty((nbytes,), dtype=torch.uint8)
+        if comfy.model_management.pin_memory(slab):
+            return slab
+        return None
+
+    def free(self, slab):
+        comfy.model_management.unpin_memory(slab)
+
+    def view(self, slab, offset, nbytes):
+        return slab[offset:offset + nbytes]
+
+POOL = comfy.pinned_pool.PinnedPool(TorchPinnedBackend())
+
 def get_pin(module):
     return getattr(module, "_pin", None)
 
@@ -12,9 +30,11 @@ def pin_memory(module):
         return
     #FIXME: This is a RAM cache trigger event
     size = comfy.memory_management.vram_aligned_size([ module.weight, module.bias ])
-    pin = torch.empty((size,), dtype=torch.uint8)
-    if comfy.model_management.pin_memory(pin):
-        module._pin = pin
+    block = POOL.acquire(size)
+    if block is not None:
+        # Calling the finalizer releases the block, which also happens if the module is freed while pinned.
+        module._pin_release = weakref.finalize(module, POOL.release, block)
+        module._pin = block.buffer
     else:
         module.pin_failed = True
         return False
@@ -24,6 +44,13 @@ def unpin_memory(module):
     if get_pin(module) is None:
         return 0
     size = module._pin.numel() * module._pin.element_size()
-    comfy.model_management.unpin_memory(module._pin)
+    module._pin_release()
     del module._pin
+    del module._pin_release
     return size
+
+def trim_pool():
+    return POOL.trim()
+
+def registered_bytes():
+    return POOL.stats()["registered_bytes"]
@@ -0,0 +1,157 @@
+"""
+Pool of pinned host memory for the weights streamed to the GPU (comfy.pinned_memory).
+
+Pinning each module's buffer on its own costs a cudaHostRegister/cudaHostUnregister pair per module
+and every model swap, and scatters small pinned allocations over host memory. The pool registers
+large slabs instead and hands out blocks of a few size classes from them. Released blocks are reused
+by the next model and slabs with nothing in use are only given back past a retained amount.
+
+The pool doesn't touch torch itself: slabs come from a backend with allocate(nbytes) (returning None
+on failure), free(slab) and view(slab, offset, nbytes).
+"""
+
+from __future__ import annotations
+
+import threading
+from typing import Any, Optional
+
+MIN_BLOCK_SIZE = 16 * 1024
+SLAB_SIZE = 32 * 1024 * 1024
+# Empty slabs kept registered for the next model to reuse.
+DEFAULT_RETAIN_BYTES = 1024 * 1024 * 1024
+
+
+def size_class(nbytes: int) -> int:
+    """Round nbytes up to 2^k, 1.25 * 2^k, 1.5 * 2^k or 1.75 * 2^k (at most 25% waste)."""
+    if nbytes <= MIN_BLOCK_SIZE:
+        return MIN_BLOCK_SIZE
+    power = 1 << (nbytes - 1).bit_length()
+    quarter = power // 8
+    for size in (power // 2 + quarter, power // 2 + 2 * quarter, power // 2 + 3 * quarter, power):
+        if nbytes <= size:
+            return size
+    return power
+
+
+class _Slab:
+    __slots__ = ("handle", "block_size", "nbytes", "free", "used")
+
+    def __init__(self, handle, block_size, nbytes):
+        self.handle = handle
+        self.block_size = block_size
+        self.nbytes = nbytes
+        self.free = list(range(nbytes // block_size - 1, -1, -1))
+        self.used = 0
+
+
+class PinnedBlock:
+    __slots__ = ("slab", "index", "nbytes", "buffer")
+
+    def __init__(self, slab: _Slab, index: int, nbytes: int, buffer: Any):
+        self.slab = slab
+        self.index = index
+        self.nbytes = nbytes
+        self.buffer = buffer
+
+
+class PinnedPool:
+    def __init__(self, backend, max_bytes: Optional[int] = None, retain_bytes: int = DEFAULT_RETAIN_BYTES, slab_size: int = SLAB_SIZE):
+        self.backend = backend
+        self.max_bytes = max_bytes
+        self.retain_bytes = retain_bytes
+        self.slab_size = slab_size
+        self.lock = threading.Lock()
+        # size class -> slabs of that class with at least one free block
+        self.partial: dict[int, list[_Slab]] = {}
+        self.slabs: list[_Slab] = []
+        self.registered_bytes = 0
+        self.in_use_bytes = 0
+        self.requested_bytes = 0
+        self.counters = {"acquired": 0, "reused": 0, "slabs_allocated": 0, "slabs_freed": 0, "failed": 0}
+
+    def acquire(self, nbytes: int) -> Optional[PinnedBlock]:
+        """A pinned block of at least nbytes, or None if the pool can't grow."""
+        block_size = size_class(nbytes)
+        with self.lock:
+            slab = self._slab_with_free_block(block_size)
+            if slab is None:
+                self.counters["failed"] += 1
+                return None
+            index = slab.free.pop()
+            slab.used += 1
+            if len(slab.free) == 0:
+                self.partial[block_size].remove(slab)
+            self.in_use_bytes += block_size
+            self.requested_bytes += nbytes
+            self.counters["acquired"] += 1
+            return PinnedBlock(slab, index, nbytes, self.backend.view(slab.handle, index * block_size, nbytes))
+
+    def _slab_with_free_block(self, block_size) -> Optional[_Slab]:
+        partial = self.partial.setdefault(block_size, [])
+        if len(partial) > 0:
+            self.counters["reused"] += 1
+            # Fill the fullest slab first so the others can empty out.
+            return max(partial, key=lambda s: s.used)
+
+        slab_bytes = max(block_size, self.slab_size - self.slab_size % block_size)
+        handle = None
+        if self.max_bytes is None or self.registered_bytes + slab_bytes <= self.max_bytes:
+            handle = self.backend.allocate(slab_bytes)
+        if handle is None:
+            # Out of pinnable memory: give back the empty slabs of other sizes and try again.
+            if self._free_empty_slabs(0) == 0:
+                return None
+            if self.max_bytes is not None and self.registered_bytes + slab_bytes > self.max_bytes:
+                return None
+            handle = self.backend.allocate(slab_bytes)
+            if handle is None:
+                return None
+        slab = _Slab(handle, block_size, slab_bytes)
+        self.slabs.append(slab)
+        partial.append(slab)
+        self.registered_bytes += slab_bytes
+        self.counters["slabs_allocated"] += 1
+        return slab
+
+    def release(self, block: PinnedBlock):
+        with self.lock:
+            slab = block.slab
+            slab.free.append(block.index)
+            slab.used -= 1
+            if len(slab.free) == 1:
+                self.partial.setdefault(slab.block_size, []).append(slab)
+            self.in_use_bytes -= slab.block_size
+            self.requested_bytes -= block.nbytes
+            if slab.used == 0:
+                self._free_empty_slabs(self.retain_bytes)
+
+    def _free_empty_slabs(self, retain_bytes: int) -> int:
+        empty = [s for s in self.slabs if s.used == 0]
+        kept = sum(s.nbytes for s in empty)
+        freed = 0
+        for slab in empty:
+            if kept <= retain_bytes:
+                break
+            self.slabs.remove(slab)
+            self.partial[slab.block_size].remove(slab)
+            self.backend.free(slab.handle)
+            self.registered_bytes -= slab.nbytes
+            self.counters["slabs_freed"] += 1
+            kept -= slab.nbytes
+            freed += slab.nbytes
+        return freed
+
+    def trim(self) -> int:
+        """Unregister every slab with nothing in use. Returns the number of bytes given back."""
+        with self.lock:
+            return self._free_empty_slabs(0)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "registered_bytes": self.registered_bytes,
+                "in_use_bytes": self.in_use_bytes,
+                "requested_bytes": self.requested_bytes,
+                "slabs": len(self.slabs),
+                **self.counters,
+            }
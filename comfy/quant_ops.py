@@ -1,9 +1,11 @@
 import torch
 import logging
+from dataclasses import dataclass
 
 try:
     import comfy_kitchen as ck
     from comfy_kitchen.tensor import (
+        BaseLayoutParams,
         QuantizedTensor,
         QuantizedLayout,
         TensorCoreFP8Layout as _CKFp8Layout,
@@ -31,6 +33,12 @@ except ImportError as e:
     class QuantizedTensor:
         pass
 
+    class QuantizedLayout:
+        pass
+
+    class BaseLayoutParams:
+        pass
+
     class _CKFp8Layout:
         pass
 
@@ -43,6 +51,11 @@ except ImportError as e:
     def get_layout_class(name):
         return None
 
+
+def ck_available() -> bool:
+    """Whether comfy_kitchen is installed, without it QuantizedTensor and the layouts are placeholders."""
+    return _CK_AVAILABLE
+
 import comfy.float
 
 # ==============================================================================
@@ -129,6 +142,52 @@ class TensorCoreFP8E5M2Layout(_TensorCoreFP8LayoutBase):
 TensorCoreFP8Layout = TensorCoreFP8E4M3Layout
 
 
+# ==================== Weight-only Layouts ====================
+
+class BlockINT8Layout(QuantizedLayout):
+    """
+    int8 with one absmax scale per BLOCK_SIZE consecutive values. There are no matmul ops for it:
+    it stages the weights of offloaded modules in RAM (comfy.offload_compression), which are
+    dequantized on the compute device by cast_bias_weight.
+    """
+    BLOCK_SIZE = 128
+
+    @dataclass(frozen=True)
+    class Params(BaseLayoutParams):
+        pass
+
+    @classmethod
+    def quantize(cls, tensor, scale=None, stochastic_rounding=0, inplace_ops=False):
+        orig_dtype = tensor.dtype
+        orig_shape = tuple(tensor.shape)
+
+        flat = tensor.reshape(-1)
+        pad = -flat.numel() % cls.BLOCK_SIZE
+        if pad > 0:
+            flat = torch.nn.functional.pad(flat, (0, pad))
+        blocks = flat.reshape(-1, cls.BLOCK_SIZE).float()
+        scale = blocks.abs().amax(dim=1, keepdim=True) / 127.0
+        scale = torch.where(scale > 0, scale, torch.ones_like(scale))
+        qdata = torch.round(blocks / scale).clamp_(-127, 127).to(torch.int8)
+        return qdata, cls.Params(scale=scale, orig_dtype=orig_dtype, orig_shape=orig_shape)
+
+    @classmethod
+    def dequantize(cls, qdata, params):
+        numel = 1
+        for s in params.orig_shape:
+            numel *= s
+        out = qdata.to(torch.float32) * params.scale.to(qdata.device)
+        return out.reshape(-1)[:numel].reshape(params.orig_shape).to(params.orig_dtype)
+
+    @classmethod
+    def get_plain_tensors(cls, qtensor):
+        return qtensor._qdata, qtensor._params.scale
+
+    @classmethod
+    def state_dict_tensors(cls, qdata, params):
+        return {"": qdata, "_scale": params.scale}
+
+
 # ==============================================================================
 # Registry
 # ==============================================================================
@@ -137,6 +196,7 @@ register_layout_class("TensorCoreFP8Layout", TensorCoreFP8Layout)
 register_layout_class("TensorCoreFP8E4M3Layout", TensorCoreFP8E4M3Layout)
 register_layout_class("TensorCoreFP8E5M2Layout", TensorCoreFP8E5M2Layout)
 register_layout_class("TensorCoreNVFP4Layout", TensorCoreNVFP4Layout)
+register_layout_class("BlockINT8Layout", BlockINT8Layout)
 
 QUANT_ALGOS = {
     "float8_e4m3fn": {
@@ -169,6 +229,7 @@ __all__ = [
     "TensorCoreFP8E4M3Layout",
     "TensorCoreFP8E5M2Layout",
     "TensorCoreNVFP4Layout",
+    "BlockINT8Layout",
     "QUANT_ALGOS",
     "register_layout_op",
 ]
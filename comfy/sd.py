@@ -71,6 +71,11 @@ import comfy.taesd.taehv
 import comfy.latent_formats
 
 import comfy.ldm.flux.redux
+import comfy.compiled_models
+from comfy.cli_args import args
+
+# Ready to load artifacts of diffusion models, see comfy.compiled_models
+COMPILED_MODELS = comfy.compiled_models.CompiledModelCache(args.compiled_model_cache)
 
 def load_lora_for_models(model, clip, lora, strength_model, strength_clip):
     key_map = {}
@@ -1634,8 +1639,18 @@ def load_diffusion_model_state_dict(sd, model_options={}, metadata=None):
     4. Manages model optimization settings
     5. Loads weights and returns a device-managed model instance
     """
-    dtype = model_options.get("dtype", None)
+    detected = _detect_diffusion_model(sd, model_options=model_options, metadata=metadata)
+    if detected is None:
+        return None
+    model_config, new_sd, sd, parameters, weight_dtype = detected
+    unet_dtype, manual_cast_dtype = _diffusion_model_dtype(model_config, parameters, weight_dtype, model_options)
+    model_patcher = _build_diffusion_model(model_config, new_sd, unet_dtype, manual_cast_dtype, model_options)
+    left_over = sd.keys()
+    if len(left_over) > 0:
+        logging.info("left over keys in diffusion model: {}".format(left_over))
+    return model_patcher
 
+def _detect_diffusion_model(sd, model_options={}, metadata=None):
     #Allow loading unets from checkpoint files
     diffusion_model_prefix = model_detection.unet_prefix_from_state_dict(sd)
     temp_sd = comfy.utils.state_dict_prefix_replace(sd, {diffusion_model_prefix: ""}, filter_keys=True)
@@ -1648,7 +1663,6 @@ def load_diffusion_model_state_dict(sd, model_options={}, metadata=None):
     parameters = comfy.utils.calculate_parameters(sd)
     weight_dtype = comfy.utils.weight_dtype(sd)
 
-    load_device = model_management.get_torch_device()
     model_config = model_detection.model_config_from_unet(sd, "", metadata=metadata)
 
     if model_config is not None:
@@ -1673,10 +1687,14 @@ def load_diffusion_model_state_dict(sd, model_options={}, metadata=None):
                 else:
                     logging.warning("{} {}".format(diffusers_keys[k], k))
 
-    offload_device = model_management.unet_offload_device()
-    unet_weight_dtype = list(model_config.supported_inference_dtypes)
     if model_config.quant_config is not None:
         weight_dtype = None
+    return model_config, new_sd, sd, parameters, weight_dtype
+
+def _diffusion_model_dtype(model_config, parameters, weight_dtype, model_options):
+    dtype = model_options.get("dtype", None)
+    load_device = model_management.get_torch_device()
+    unet_weight_dtype = list(model_config.supported_inference_dtypes)
 
     if dtype is None:
         unet_dtype = model_management.unet_dtype(model_params=parameters, supported_dtypes=unet_weight_dtype, weight_dtype=weight_dtype)
@@ -1687,8 +1705,14 @@ def load_diffusion_model_state_dict(sd, model_options={}, metadata=None):
         manual_cast_dtype = model_management.unet_manual_cast(None, load_device, model_config.supported_inference_dtypes)
     else:
         manual_cast_dtype = model_management.unet_manual_cast(unet_dtype, load_device, model_config.supported_inference_dtypes)
+    return unet_dtype, manual_cast_dtype
+
+def _build_diffusion_model(model_config, new_sd, unet_dtype, manual_cast_dtype, model_options):
+    load_device = model_management.get_torch_device()
+    offload_device = model_management.unet_offload_device()
     model_config.set_inference_dtype(unet_dtype, manual_cast_dtype)
 
+    custom_operations = model_options.get("custom_operations", None)
     if custom_operations is not None:
         model_config.custom_operations = custom_operations
 
@@ -1700,17 +1724,30 @@ def load_diffusion_model_state_dict(sd, model_options={}, metadata=None):
     if not model_management.is_device_cpu(offload_device):
         model.to(offload_device)
     model.load_model_weights(new_sd, "", assign=model_patcher.is_dynamic())
-    left_over = sd.keys()
-    if len(left_over) > 0:
-        logging.info("left over keys in diffusion model: {}".format(left_over))
     return model_patcher
 
 def load_diffusion_model(unet_path, model_options={}):
+    compiled = COMPILED_MODELS.load(unet_path, model_options)
+    if compiled is not None:
+        model_config, sd, parameters, weight_dtype, precast_dtype = compiled
+        unet_dtype, manual_cast_dtype = _diffusion_model_dtype(model_config, parameters, weight_dtype, model_options)
+        if unet_dtype == precast_dtype: # otherwise the weights were cast to a dtype this load doesn't use
+            return _build_diffusion_model(model_config, sd, unet_dtype, manual_cast_dtype, model_options)
+
     sd, metadata = comfy.utils.load_torch_file(unet_path, return_metadata=True)
-    model = load_diffusion_model_state_dict(sd, model_options=model_options, metadata=metadata)
-    if model is None:
+    detected = _detect_diffusion_model(sd, model_options=model_options, metadata=metadata)
+    if detected is None:
         logging.error("ERROR UNSUPPORTED DIFFUSION MODEL {}".format(unet_path))
         raise RuntimeError("ERROR: Could not detect model type of: {}\n{}".format(unet_path, model_detection_error_hint(unet_path, sd)))
+    model_config, new_sd, left_over_sd, parameters, weight_dtype = detected
+    unet_dtype, manual_cast_dtype = _diffusion_model_dtype(model_config, parameters, weight_dtype, model_options)
+    converted_sd = dict(new_sd) if COMPILED_MODELS.enabled else None
+    model = _build_diffusion_model(model_config, new_sd, unet_dtype, manual_cast_dtype, model_options)
+    left_over = left_over_sd.keys()
+    if len(left_over) > 0:
+        logging.info("left over keys in diffusion model: {}".format(left_over))
+    if converted_sd is not None:
+        COMPILED_MODELS.store(unet_path, model_options, model_config, converted_sd, parameters, weight_dtype, model)
     return model
 
 def load_unet(unet_path, dtype=None):
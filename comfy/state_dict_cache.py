@@ -0,0 +1,146 @@
+"""
+Process wide registry of loaded state dicts, used by comfy.utils.load_torch_file.
+
+Every loader asking for the same file (same real path, size and mtime) gets a shallow copy of one
+state dict: the tensors, which are views over a single read-only mmap of a safetensors file, are
+shared while each caller can still add or pop keys. Files nobody holds a state dict of any more
+are kept around up to a byte budget and evicted least recently used first. Off unless
+--state-dict-cache-size is set.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+
+class SharedStateDict(dict):
+    """The state dict handed out by the registry. Plain dicts can't be weakly referenced."""
+    __slots__ = ("__weakref__",)
+
+
+def file_key(path: str) -> tuple:
+    st = os.stat(path)
+    return (os.path.realpath(path), st.st_size, st.st_mtime_ns)
+
+
+def state_dict_size(sd: dict) -> int:
+    return sum(getattr(v, "nbytes", 0) for v in sd.values())
+
+
+class _Entry:
+    __slots__ = ("sd", "metadata", "size", "refs")
+
+    def __init__(self, sd, metadata, size):
+        self.sd = sd
+        self.metadata = metadata
+        self.size = size
+        self.refs = 0
+
+
+class StateDictRegistry:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        # Reentrant: a garbage collection run while the lock is held can release a state dict.
+        self.lock = threading.RLock()
+        self.entries: OrderedDict = OrderedDict()
+        self.loading: dict = {}
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, path: str, options: Hashable, load: Callable[[], tuple]) -> tuple:
+        """
+        Returns (state_dict, metadata) of path, calling load() to read it unless it is registered
+        already. options is whatever else the result of load() depends on.
+        """
+        key = file_key(path) + (options,)
+        while True:
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is not None:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return self._hand_out(entry), entry.metadata
+                pending = self.loading.get(key)
+                if pending is None:
+                    pending = threading.Event()
+                    self.loading[key] = pending
+                    self.misses += 1
+                    break
+            # Another thread is reading this file, wait for it instead of reading it twice.
+            pending.wait()
+
+        try:
+            sd, metadata = load()
+            if not isinstance(sd, dict):
+                return sd, metadata
+            entry = _Entry(sd, metadata, state_dict_size(sd))
+            with self.lock:
+                self.entries[key] = entry
+                out = self._hand_out(entry)
+                self._evict()
+            return out, metadata
+        finally:
+            with self.lock:
+                del self.loading[key]
+            pending.set()
+
+    def _hand_out(self, entry: _Entry) -> SharedStateDict:
+        out = SharedStateDict(entry.sd)
+        entry.refs += 1
+        weakref.finalize(out, self._release, entry)
+        return out
+
+    def _release(self, entry: _Entry):
+        with self.lock:
+            entry.refs -= 1
+            if entry.refs == 0:
+                self._evict()
+
+    def _evict(self, max_bytes: Optional[int] = None):
+        # Entries still referenced are skipped: dropping them would not free their memory.
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        total = sum(e.size for e in self.entries.values())
+        freed = 0
+        for key in list(self.entries.keys()):
+            if total <= max_bytes:
+                break
+            entry = self.entries.get(key)
+            if entry is None or entry.refs > 0:
+                continue
+            del self.entries[key]
+            total -= entry.size
+            freed += entry.size
+        return freed
+
+    def trim(self, num_bytes: int) -> int:
+        """Evict unreferenced state dicts until num_bytes are freed. Returns the number of bytes freed."""
+        with self.lock:
+            total = sum(e.size for e in self.entries.values())
+            freed = self._evict(max(0, total - num_bytes))
+        if freed > 0:
+            logging.debug("Dropped {:.1f} MB of cached state dicts.".format(freed / (1024 * 1024)))
+        return freed
+
+    def clear(self):
+        with self.lock:
+            self._evict(0)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "files": len(self.entries),
+                "bytes": sum(e.size for e in self.entries.values()),
+                "referenced": sum(1 for e in self.entries.values() if e.refs > 0),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -21,8 +21,11 @@ import torch
 import math
 import struct
 import comfy.checkpoint_pickle
+import comfy.parallel_read
+import comfy.state_dict_cache
 import safetensors.torch
 import numpy as np
+import psutil
 from PIL import Image
 import logging
 import itertools
@@ -33,10 +36,15 @@ from comfy.cli_args import args, enables_dynamic_vram
 import json
 import time
 import mmap
+import os
 import warnings
 
 MMAP_TORCH_FILES = args.mmap_torch_files
 DISABLE_MMAP = args.disable_mmap
+MODEL_READ_THREADS = args.model_read_threads
+
+# Loaded state dicts shared by every loader reading the same file, see comfy/state_dict_cache.py
+STATE_DICT_REGISTRY = comfy.state_dict_cache.StateDictRegistry(int(args.state_dict_cache_size * 1024 * 1024 * 1024))
 
 ALWAYS_SAFE_LOAD = False
 if hasattr(torch.serialization, "add_safe_globals"):  # TODO: this was added in pytorch 2.4, the unsafe path should be removed once earlier versions are deprecated
@@ -107,11 +115,35 @@ def load_safetensors(ckpt):
     return sd, header.get("__metadata__", {}),
 
 
+def _shares_state_dict(ckpt):
+    # Only the read-only mmaps of load_safetensors are shared: they take no memory beyond the page
+    # cache and nothing can write into them in place, so one loader can't change another's weights.
+    # Loaders that need writable weights get them from a copy, like they do without the registry.
+    return STATE_DICT_REGISTRY.enabled and enables_dynamic_vram() and ckpt.lower().endswith((".safetensors", ".sft"))
+
 def load_torch_file(ckpt, safe_load=False, device=None, return_metadata=False):
     if device is None:
         device = torch.device("cpu")
+    if device.type == "cpu" and _shares_state_dict(ckpt):
+        sd, metadata = STATE_DICT_REGISTRY.get(ckpt, (safe_load or ALWAYS_SAFE_LOAD, DISABLE_MMAP, MMAP_TORCH_FILES), lambda: _load_torch_file(ckpt, safe_load, device, True))
+    else:
+        sd, metadata = _load_torch_file(ckpt, safe_load, device, return_metadata)
+    return (sd, metadata) if return_metadata else sd
+
+def readahead_model_file(ckpt):
+    """With --model-read-threads, read the file into the page cache with parallel sequential reads before it gets mmapped."""
+    if MODEL_READ_THREADS <= 0 or DISABLE_MMAP:
+        return
+    size = os.path.getsize(ckpt)
+    if size > psutil.virtual_memory().available:
+        return
+    num_bytes, seconds = comfy.parallel_read.readahead(ckpt, threads=MODEL_READ_THREADS)
+    comfy.parallel_read.log_bandwidth(ckpt, num_bytes, seconds, MODEL_READ_THREADS)
+
+def _load_torch_file(ckpt, safe_load, device, return_metadata):
     metadata = None
     if ckpt.lower().endswith(".safetensors") or ckpt.lower().endswith(".sft"):
+        readahead_model_file(ckpt)
         try:
             if enables_dynamic_vram():
                 sd, metadata = load_safetensors(ckpt)
@@ -155,7 +187,7 @@ def load_torch_file(ckpt, safe_load=False, device=None, return_metadata=False):
                     sd = pl_sd
             else:
                 sd = pl_sd
-    return (sd, metadata) if return_metadata else sd
+    return sd, metadata
 
 def save_torch_file(sd, ckpt, metadata=None):
     if metadata is not None:
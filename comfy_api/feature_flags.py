@@ -17,6 +17,8 @@ SERVER_FEATURE_FLAGS: dict[str, Any] = {
     "supports_nova_telemetry": True,
     "supports_nova_partial_output": True,
     "supports_nova_auto_optimize_hints": True,
+    "supports_progress_state_delta": True,
+    "preview_formats": ["jpeg", "png", "webp"],
 }
 
 
@@ -1,13 +1,23 @@
 import bisect
 import gc
+import hashlib
+import heapq
 import itertools
+import math
+import os
 import psutil
+import struct
+import sys
+import threading
 import time
 import torch
-from typing import Sequence, Mapping, Dict
+import weakref
+from typing import Any, Callable, Sequence, Mapping, Dict, NamedTuple, Optional
 from comfy_execution.graph import DynamicPrompt
+from comfy_execution.disk_cache import DiskCache
 from abc import ABC, abstractmethod
 
+import folder_paths
 import nodes
 
 from comfy_execution.graph_utils import is_link
@@ -46,10 +56,77 @@ class CacheKeySet(ABC):
     def get_subcache_key(self, node_id):
         return self.subcache_keys.get(node_id, None)
 
+    def get_persistent_key(self, node_id):
+        """Key of the node's output in the disk cache, or None if it can't outlive the process."""
+        return None
+
+    def reuse_from(self, previous):
+        pass
+
 class Unhashable:
     def __init__(self):
         self.value = float("NaN")
 
+# Content hashing for values that aren't plain data. Objects can implement __comfy_cache_key__()
+# returning plain data (or bytes) that identifies their content, or a hasher can be registered
+# for a type with register_cache_key_hasher. A hasher returns None when it can't identify the value.
+CACHE_KEY_HASHERS: Dict[type, Callable[[Any], Any]] = {}
+
+def register_cache_key_hasher(cls: type, hasher: Callable[[Any], Any]):
+    CACHE_KEY_HASHERS[cls] = hasher
+
+def object_cache_key(obj):
+    cache_key_fn = getattr(obj, "__comfy_cache_key__", None)
+    if cache_key_fn is not None and not isinstance(obj, type):
+        return cache_key_fn()
+    for cls in type(obj).__mro__:
+        hasher = CACHE_KEY_HASHERS.get(cls)
+        if hasher is not None:
+            return hasher(obj)
+    return None
+
+class TensorDigestCache:
+    """
+    sha256 of tensor contents, memoized per storage view. An entry stays valid while the tensor it was
+    computed from is alive (so the storage pointer can't have been reused) and the version counter,
+    which is shared by all views of a storage and bumped by in-place ops, hasn't moved.
+    """
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def _view_key(self, tensor):
+        return (tensor.untyped_storage().data_ptr(), tensor.storage_offset(), tuple(tensor.shape), tuple(tensor.stride()), tensor.dtype, str(tensor.device))
+
+    def digest(self, tensor) -> bytes:
+        key = self._view_key(tensor)
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is not None:
+            ref, version, digest = entry
+            if ref() is not None and version == tensor._version:
+                return digest
+
+        h = hashlib.sha256()
+        h.update(f"{tensor.dtype}:{tuple(tensor.shape)}:".encode("utf-8"))
+        if tensor.numel() > 0:
+            data = tensor.detach().to("cpu").contiguous().reshape(-1).view(torch.uint8)
+            h.update(memoryview(data.numpy()))
+        digest = h.digest()
+
+        with self.lock:
+            if len(self.entries) >= self.max_entries:
+                self.entries = {k: v for k, v in self.entries.items() if v[0]() is not None}
+                if len(self.entries) >= self.max_entries:
+                    self.entries = {}
+            self.entries[key] = (weakref.ref(tensor), tensor._version, digest)
+        return digest
+
+TENSOR_DIGESTS = TensorDigestCache()
+
+register_cache_key_hasher(torch.Tensor, TENSOR_DIGESTS.digest)
+
 def to_hashable(obj):
     # So that we don't infinitely recurse since frozenset and tuples
     # are Sequences.
@@ -60,8 +137,10 @@ def to_hashable(obj):
     elif isinstance(obj, Sequence):
         return frozenset(zip(itertools.count(), [to_hashable(i) for i in obj]))
     else:
-        # TODO - Support other objects like tensors?
-        return Unhashable()
+        key = object_cache_key(obj)
+        if key is None:
+            return Unhashable()
+        return (type(obj).__qualname__, to_hashable(key))
 
 class CacheKeySetID(CacheKeySet):
     def __init__(self, dynprompt, node_ids, is_changed_cache):
@@ -78,15 +157,178 @@ class CacheKeySetID(CacheKeySet):
             self.keys[node_id] = (node_id, node["class_type"])
             self.subcache_keys[node_id] = (node_id, node["class_type"])
 
+SIGNATURE_DIGEST_SIZE = 16
+
+def _comfy_version() -> str:
+    try:
+        from comfyui_version import __version__
+        return __version__
+    except ImportError:
+        return ""
+
+NODE_CLASS_CODE_VERSIONS: Dict[str, str] = {}
+
+def node_code_version(class_type: str) -> str:
+    """Identifies the code of a node class: its qualified name and the size and mtime of its module file."""
+    if class_type in NODE_CLASS_CODE_VERSIONS:
+        return NODE_CLASS_CODE_VERSIONS[class_type]
+    class_def = nodes.NODE_CLASS_MAPPINGS[class_type]
+    version = f"{class_def.__module__}.{class_def.__qualname__}"
+    module_file = getattr(sys.modules.get(class_def.__module__), "__file__", None)
+    if module_file is not None:
+        try:
+            st = os.stat(module_file)
+            version += f":{st.st_size}:{st.st_mtime_ns}"
+        except OSError:
+            pass
+    NODE_CLASS_CODE_VERSIONS[class_type] = version
+    return version
+
+def model_file_stamp(filename: str) -> Optional[tuple]:
+    """(path, size, mtime) of the model file a widget value names, or None if it doesn't name one."""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in folder_paths.supported_pt_extensions:
+        return None
+    for folder_name, (_, extensions) in list(folder_paths.folder_names_and_paths.items()):
+        if len(extensions) > 0 and extension not in extensions:
+            continue
+        path = folder_paths.get_full_path(folder_name, filename)
+        if path is not None:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            return (path, st.st_size, st.st_mtime_ns)
+    return None
+
+def _hash_value(h, obj) -> bool:
+    """Feed a widget value into h. Returns False if the value can't be hashed deterministically."""
+    if obj is None:
+        h.update(b"N")
+    elif isinstance(obj, bool):
+        h.update(b"T" if obj else b"F")
+    elif isinstance(obj, int):
+        h.update(b"i%d;" % obj)
+    elif isinstance(obj, float):
+        if math.isnan(obj):
+            return False
+        h.update(b"f" + struct.pack("<d", obj))
+    elif isinstance(obj, str):
+        data = obj.encode("utf-8", "surrogatepass")
+        h.update(b"s%d:" % len(data))
+        h.update(data)
+    elif isinstance(obj, bytes):
+        h.update(b"b%d:" % len(obj))
+        h.update(obj)
+    elif isinstance(obj, Mapping):
+        h.update(b"m%d:" % len(obj))
+        for k, v in sorted(obj.items(), key=lambda kv: repr(kv[0])):
+            if not _hash_value(h, k) or not _hash_value(h, v):
+                return False
+    elif isinstance(obj, Sequence):
+        h.update(b"l%d:" % len(obj))
+        for v in obj:
+            if not _hash_value(h, v):
+                return False
+    else:
+        key = object_cache_key(obj)
+        if key is None:
+            return False
+        h.update(b"o")
+        _hash_value(h, type(obj).__qualname__)
+        return _hash_value(h, key)
+    return True
+
+class _NoFingerprint(Exception):
+    pass
+
+def _fingerprint(obj):
+    """
+    Hashable snapshot of a widget value for spotting unchanged nodes between prompts. Values carry
+    their type so 1, 1.0 and True differ, containers are copied so in-place edits show, and other
+    objects are represented by their object_cache_key.
+    """
+    if obj is None or isinstance(obj, (bool, int, float, str, bytes)):
+        return (type(obj).__name__, obj)
+    elif isinstance(obj, Mapping):
+        return ("m", tuple(sorted(((repr(k), _fingerprint(k), _fingerprint(v)) for k, v in obj.items()), key=lambda kv: kv[0])))
+    elif isinstance(obj, Sequence):
+        return ("l", tuple(_fingerprint(v) for v in obj))
+    key = object_cache_key(obj)
+    if key is None:
+        raise _NoFingerprint()
+    return ("o", type(obj).__qualname__, _fingerprint(key))
+
 class CacheKeySetInputSignature(CacheKeySet):
+    """
+    Keys are Merkle style digests: each node hashes its own class, IS_CHANGED result and widget values
+    together with the digests of the nodes it links to, so every node is visited once per prompt.
+    Nodes whose inputs can't be hashed get a fresh Unhashable key (and so do their descendants),
+    which only matches itself.
+    """
     def __init__(self, dynprompt, node_ids, is_changed_cache):
         super().__init__(dynprompt, node_ids, is_changed_cache)
         self.dynprompt = dynprompt
         self.is_changed_cache = is_changed_cache
+        self.node_digests = {}
+        self.node_sources = {}
+        self.previous_digests = {}
+        self.previous_sources = {}
+        self.node_stamps = {}
+        self.persistent_keys = {}
 
     def include_node_id_in_input(self) -> bool:
         return False
 
+    def _node_stamp(self, node_id) -> bytes:
+        # Code version of the node and the model files its widgets name: the parts of what a node
+        # computes that its signature doesn't cover, but that change across restarts.
+        stamp = self.node_stamps.get(node_id)
+        if stamp is None:
+            node = self.dynprompt.get_node(node_id)
+            h = hashlib.blake2b(digest_size=SIGNATURE_DIGEST_SIZE)
+            _hash_value(h, node_code_version(node["class_type"]))
+            for key in sorted(node["inputs"].keys()):
+                value = node["inputs"][key]
+                if isinstance(value, str):
+                    file_stamp = model_file_stamp(value)
+                    if file_stamp is not None:
+                        _hash_value(h, key)
+                        _hash_value(h, file_stamp)
+            stamp = h.digest()
+            self.node_stamps[node_id] = stamp
+        return stamp
+
+    def get_persistent_key(self, node_id):
+        # The signature plus the ComfyUI version and the stamps of the node and all of its ancestors.
+        if node_id in self.persistent_keys:
+            return self.persistent_keys[node_id]
+        digest = self.node_digests.get(node_id)
+        if not isinstance(digest, bytes):
+            return None
+        ancestors = {node_id}
+        stack = [node_id]
+        while len(stack) > 0:
+            current = stack.pop()
+            for value in self.dynprompt.get_node(current)["inputs"].values():
+                if is_link(value) and value[0] not in ancestors and self.dynprompt.has_node(value[0]):
+                    ancestors.add(value[0])
+                    stack.append(value[0])
+        h = hashlib.blake2b(digest_size=SIGNATURE_DIGEST_SIZE)
+        h.update(digest)
+        _hash_value(h, _comfy_version())
+        for stamp in sorted(set(self._node_stamp(ancestor) for ancestor in ancestors)):
+            h.update(stamp)
+        key = h.digest()
+        self.persistent_keys[node_id] = key
+        return key
+
+    def reuse_from(self, previous):
+        # Digests of nodes that are unchanged since the previous prompt are reused without rehashing.
+        if isinstance(previous, CacheKeySetInputSignature):
+            self.previous_digests = previous.node_digests
+            self.previous_sources = previous.node_sources
+
     async def add_keys(self, node_ids):
         for node_id in node_ids:
             if node_id in self.keys:
@@ -98,66 +340,96 @@ class CacheKeySetInputSignature(CacheKeySet):
             self.subcache_keys[node_id] = (node_id, node["class_type"])
 
     async def get_node_signature(self, dynprompt, node_id):
-        signature = []
-        ancestors, order_mapping = self.get_ordered_ancestry(dynprompt, node_id)
-        signature.append(await self.get_immediate_node_signature(dynprompt, node_id, order_mapping))
-        for ancestor_id in ancestors:
-            signature.append(await self.get_immediate_node_signature(dynprompt, ancestor_id, order_mapping))
-        return to_hashable(signature)
-
-    async def get_immediate_node_signature(self, dynprompt, node_id, ancestor_order_mapping):
+        # Iterative post-order walk so parents are always hashed before their children. A node is pushed
+        # once to expand it and once more (expanded=True) to hash it after its parents. The nodes expanded
+        # but not hashed yet are the path from node_id to the current node.
+        stack = [(node_id, False)]
+        in_progress = set()
+        while len(stack) > 0:
+            current, expanded = stack.pop()
+            if current in self.node_digests:
+                continue
+            if expanded:
+                in_progress.discard(current)
+                self.node_digests[current] = await self.get_immediate_node_signature(dynprompt, current)
+                continue
+            in_progress.add(current)
+            stack.append((current, True))
+            if not dynprompt.has_node(current):
+                continue
+            for value in dynprompt.get_node(current)["inputs"].values():
+                if is_link(value) and value[0] not in self.node_digests:
+                    if value[0] in in_progress:
+                        # Cycles are reported by the execution list, just make sure we terminate.
+                        self.node_digests[value[0]] = Unhashable()
+                    else:
+                        stack.append((value[0], False))
+        return self.node_digests[node_id]
+
+    async def get_immediate_node_signature(self, dynprompt, node_id):
         if not dynprompt.has_node(node_id):
             # This node doesn't exist -- we can't cache it.
-            return [float("NaN")]
+            return Unhashable()
         node = dynprompt.get_node(node_id)
         class_type = node["class_type"]
         class_def = nodes.NODE_CLASS_MAPPINGS[class_type]
-        signature = [class_type, await self.is_changed_cache.get(node_id)]
-        if self.include_node_id_in_input() or (hasattr(class_def, "NOT_IDEMPOTENT") and class_def.NOT_IDEMPOTENT) or include_unique_id_in_input(class_type):
-            signature.append(node_id)
+        is_changed = await self.is_changed_cache.get(node_id)
         inputs = node["inputs"]
+        parents = []
         for key in sorted(inputs.keys()):
             if is_link(inputs[key]):
-                (ancestor_id, ancestor_socket) = inputs[key]
-                ancestor_index = ancestor_order_mapping[ancestor_id]
-                signature.append((key,("ANCESTOR", ancestor_index, ancestor_socket)))
-            else:
-                signature.append((key, inputs[key]))
-        return signature
-
-    # This function returns a list of all ancestors of the given node. The order of the list is
-    # deterministic based on which specific inputs the ancestor is connected by.
-    def get_ordered_ancestry(self, dynprompt, node_id):
-        ancestors = []
-        order_mapping = {}
-        self.get_ordered_ancestry_internal(dynprompt, node_id, ancestors, order_mapping)
-        return ancestors, order_mapping
-
-    def get_ordered_ancestry_internal(self, dynprompt, node_id, ancestors, order_mapping):
-        if not dynprompt.has_node(node_id):
-            return
-        inputs = dynprompt.get_node(node_id)["inputs"]
-        input_keys = sorted(inputs.keys())
-        for key in input_keys:
-            if is_link(inputs[key]):
-                ancestor_id = inputs[key][0]
-                if ancestor_id not in order_mapping:
-                    ancestors.append(ancestor_id)
-                    order_mapping[ancestor_id] = len(ancestors) - 1
-                    self.get_ordered_ancestry_internal(dynprompt, ancestor_id, ancestors, order_mapping)
+                parent = self.node_digests[inputs[key][0]]
+                if isinstance(parent, Unhashable):
+                    return Unhashable()
+                parents.append(parent)
+
+        try:
+            source = (class_type, _fingerprint(is_changed), _fingerprint(inputs), tuple(parents))
+        except _NoFingerprint:
+            source = None
+        previous = self.previous_sources.get(node_id)
+        if source is not None and previous is not None and previous == source:
+            self.node_sources[node_id] = previous
+            return self.previous_digests[node_id]
+
+        h = hashlib.blake2b(digest_size=SIGNATURE_DIGEST_SIZE)
+        _hash_value(h, class_type)
+        if not _hash_value(h, is_changed):
+            return Unhashable()
+        if self.include_node_id_in_input() or (hasattr(class_def, "NOT_IDEMPOTENT") and class_def.NOT_IDEMPOTENT) or include_unique_id_in_input(class_type):
+            _hash_value(h, node_id)
+        for key in sorted(inputs.keys()):
+            _hash_value(h, key)
+            value = inputs[key]
+            if is_link(value):
+                h.update(b"L")
+                h.update(self.node_digests[value[0]])
+                _hash_value(h, value[1])
+            elif not _hash_value(h, value):
+                return Unhashable()
+        if source is not None:
+            self.node_sources[node_id] = source
+        return h.digest()
 
 class BasicCache:
-    def __init__(self, key_class):
+    def __init__(self, key_class, disk_cache: Optional[DiskCache] = None):
         self.key_class = key_class
         self.initialized = False
         self.dynprompt: DynamicPrompt
         self.cache_key_set: CacheKeySet
         self.cache = {}
         self.subcaches = {}
+        # Optional persistent tier. Only meaningful for content based keys (CacheKeySetInputSignature).
+        # Entries are written to it when they are evicted from memory, under the persistent key
+        # they had when they were set.
+        self.disk_cache = disk_cache
+        self.persistent_keys = {}
 
     async def set_prompt(self, dynprompt, node_ids, is_changed_cache):
         self.dynprompt = dynprompt
+        previous_key_set = self.cache_key_set if self.initialized else None
         self.cache_key_set = self.key_class(dynprompt, node_ids, is_changed_cache)
+        self.cache_key_set.reuse_from(previous_key_set)
         await self.cache_key_set.add_keys(node_ids)
         self.is_changed_cache = is_changed_cache
         self.initialized = True
@@ -176,7 +448,7 @@ class BasicCache:
             if key not in preserve_keys:
                 to_remove.append(key)
         for key in to_remove:
-            del self.cache[key]
+            self._spill(key, self.cache.pop(key))
 
     def _clean_subcaches(self):
         preserve_subcaches = set(self.cache_key_set.get_used_subcache_keys())
@@ -186,7 +458,31 @@ class BasicCache:
             if key not in preserve_subcaches:
                 to_remove.append(key)
         for key in to_remove:
-            del self.subcaches[key]
+            self.subcaches.pop(key)._spill_all()
+
+    def _spill(self, cache_key, value):
+        """Called with entries leaving memory: writes them to the disk tier, if there is one."""
+        persistent_key = self.persistent_keys.pop(cache_key, None)
+        if self.disk_cache is not None and persistent_key is not None:
+            self.disk_cache.put(persistent_key, value)
+
+    def _spill_all(self):
+        for key in list(self.cache):
+            self._spill(key, self.cache.pop(key))
+        for subcache in self.subcaches.values():
+            subcache._spill_all()
+        self.subcaches = {}
+
+    def persist(self):
+        """Write every entry held in memory to the disk tier, keeping them in memory."""
+        if self.disk_cache is None:
+            return
+        for cache_key, value in list(self.cache.items()):
+            persistent_key = self.persistent_keys.get(cache_key)
+            if persistent_key is not None:
+                self.disk_cache.put(persistent_key, value)
+        for subcache in list(self.subcaches.values()):
+            subcache.persist()
 
     def clean_unused(self):
         assert self.initialized
@@ -200,6 +496,8 @@ class BasicCache:
         assert self.initialized
         cache_key = self.cache_key_set.get_data_key(node_id)
         self.cache[cache_key] = value
+        if self.disk_cache is not None:
+            self.persistent_keys[cache_key] = self.cache_key_set.get_persistent_key(node_id)
 
     def _get_immediate(self, node_id):
         if not self.initialized:
@@ -207,6 +505,13 @@ class BasicCache:
         cache_key = self.cache_key_set.get_data_key(node_id)
         if cache_key in self.cache:
             return self.cache[cache_key]
+        elif self.disk_cache is not None:
+            persistent_key = self.cache_key_set.get_persistent_key(node_id)
+            value = self.disk_cache.get(persistent_key)
+            if value is not None:
+                self.cache[cache_key] = value
+                self.persistent_keys[cache_key] = persistent_key
+            return value
         else:
             return None
 
@@ -214,7 +519,7 @@ class BasicCache:
         subcache_key = self.cache_key_set.get_subcache_key(node_id)
         subcache = self.subcaches.get(subcache_key, None)
         if subcache is None:
-            subcache = BasicCache(self.key_class)
+            subcache = BasicCache(self.key_class, disk_cache=self.disk_cache)
             self.subcaches[subcache_key] = subcache
         await subcache.set_prompt(self.dynprompt, children_ids, self.is_changed_cache)
         return subcache
@@ -236,8 +541,8 @@ class BasicCache:
         return result
 
 class HierarchicalCache(BasicCache):
-    def __init__(self, key_class):
-        super().__init__(key_class)
+    def __init__(self, key_class, disk_cache: Optional[DiskCache] = None):
+        super().__init__(key_class, disk_cache=disk_cache)
 
     def _get_cache_for(self, node_id):
         assert self.dynprompt is not None
@@ -297,8 +602,8 @@ class NullCache:
         return self
 
 class LRUCache(BasicCache):
-    def __init__(self, key_class, max_size=100):
-        super().__init__(key_class)
+    def __init__(self, key_class, max_size=100, disk_cache: Optional[DiskCache] = None):
+        super().__init__(key_class, disk_cache=disk_cache)
         self.max_size = max_size
         self.min_generation = 0
         self.generation = 0
@@ -316,7 +621,7 @@ class LRUCache(BasicCache):
             self.min_generation += 1
             to_remove = [key for key in self.cache if self.used_generation[key] < self.min_generation]
             for key in to_remove:
-                del self.cache[key]
+                self._spill(key, self.cache.pop(key))
                 del self.used_generation[key]
                 if key in self.children:
                     del self.children[key]
@@ -349,6 +654,127 @@ class LRUCache(BasicCache):
         return self
 
 
+class CacheEntrySize(NamedTuple):
+    cpu: int = 0
+    gpu: int = 0
+    pinned: int = 0
+
+    @property
+    def total(self):
+        return self.cpu + self.gpu + self.pinned
+
+def cache_entry_size(value) -> CacheEntrySize:
+    """Bytes held by a cache entry. Storages shared between outputs of the entry are counted once."""
+    sizes = {"cpu": 0, "gpu": 0, "pinned": 0}
+    seen = set()
+    def scan(obj):
+        if isinstance(obj, torch.Tensor):
+            storage = obj.untyped_storage()
+            storage_id = (obj.device, storage.data_ptr())
+            if storage_id in seen:
+                return
+            seen.add(storage_id)
+            if obj.device.type != "cpu":
+                sizes["gpu"] += storage.nbytes()
+            elif obj.is_pinned():
+                sizes["pinned"] += storage.nbytes()
+            else:
+                sizes["cpu"] += storage.nbytes()
+        elif isinstance(obj, (list, tuple)):
+            for x in obj:
+                scan(x)
+        elif isinstance(obj, dict):
+            for x in obj.values():
+                scan(x)
+        elif hasattr(obj, "get_ram_usage"):
+            if id(obj) not in seen:
+                seen.add(id(obj))
+                sizes["cpu"] += obj.get_ram_usage()
+    scan(getattr(value, "outputs", value))
+    return CacheEntrySize(**sizes)
+
+class ByteBudgetCache(LRUCache):
+    """
+    LRU cache bounded by the bytes its entries hold rather than by entry count.
+
+    Each entry is sized once when it is set. Recency is tracked in a heap with lazy deletion:
+    a touch pushes a new (tick, key) pair and stale pairs are skipped when popped, so eviction
+    is O(log n) per entry and never rescans the cache.
+    """
+
+    def __init__(self, key_class, max_bytes, disk_cache: Optional[DiskCache] = None):
+        super().__init__(key_class, 0, disk_cache=disk_cache)
+        self.max_bytes = max_bytes
+        self.entry_sizes: Dict[Any, CacheEntrySize] = {}
+        self.total_size = CacheEntrySize()
+        self.tick = 0
+        self.last_used = {}
+        self.heap = []
+
+    def _touch(self, cache_key):
+        self.tick += 1
+        self.last_used[cache_key] = self.tick
+        heapq.heappush(self.heap, (self.tick, cache_key))
+        if len(self.heap) > 2 * len(self.last_used) + 64:
+            self.heap = [(tick, key) for key, tick in self.last_used.items()]
+            heapq.heapify(self.heap)
+
+    def _account(self, cache_key, size: Optional[CacheEntrySize]):
+        old = self.entry_sizes.pop(cache_key, None)
+        cpu, gpu, pinned = self.total_size
+        if old is not None:
+            cpu, gpu, pinned = cpu - old.cpu, gpu - old.gpu, pinned - old.pinned
+        if size is not None:
+            self.entry_sizes[cache_key] = size
+            cpu, gpu, pinned = cpu + size.cpu, gpu + size.gpu, pinned + size.pinned
+        self.total_size = CacheEntrySize(cpu, gpu, pinned)
+
+    def _evict(self, cache_key):
+        self._spill(cache_key, self.cache.pop(cache_key))
+        self._account(cache_key, None)
+        self.last_used.pop(cache_key, None)
+        self.used_generation.pop(cache_key, None)
+        self.children.pop(cache_key, None)
+
+    def evict_to_budget(self):
+        while self.total_size.total > self.max_bytes and len(self.heap) > 0:
+            tick, cache_key = heapq.heappop(self.heap)
+            if self.last_used.get(cache_key) != tick:
+                continue # stale heap entry
+            if cache_key in self.cache:
+                self._evict(cache_key)
+            else:
+                self.last_used.pop(cache_key, None)
+
+    def _set_immediate(self, node_id, value):
+        super()._set_immediate(node_id, value)
+        cache_key = self.cache_key_set.get_data_key(node_id)
+        self._account(cache_key, cache_entry_size(value))
+        self._touch(cache_key)
+        self.evict_to_budget()
+
+    def _get_immediate(self, node_id):
+        if not self.initialized:
+            return None
+        cache_key = self.cache_key_set.get_data_key(node_id)
+        in_memory = cache_key in self.cache
+        value = super()._get_immediate(node_id)
+        if value is not None:
+            self._touch(cache_key)
+            if not in_memory:
+                # Came back from the disk tier
+                self._account(cache_key, cache_entry_size(value))
+                self.evict_to_budget()
+        return value
+
+    def clean_unused(self):
+        self.evict_to_budget()
+        self._clean_subcaches()
+
+    def poll(self, **kwargs):
+        self.evict_to_budget()
+
+
 #Iterating the cache for usage analysis might be expensive, so if we trigger make sure
 #to take a chunk out to give breathing space on high-node / low-ram-per-node flows.
 
@@ -366,8 +792,8 @@ RAM_CACHE_OLD_WORKFLOW_OOM_MULTIPLIER = 1.3
 
 class RAMPressureCache(LRUCache):
 
-    def __init__(self, key_class):
-        super().__init__(key_class, 0)
+    def __init__(self, key_class, disk_cache: Optional[DiskCache] = None):
+        super().__init__(key_class, 0, disk_cache=disk_cache)
         self.timestamps = {}
 
     def clean_unused(self):
@@ -419,5 +845,5 @@ class RAMPressureCache(LRUCache):
 
         while _ram_gb() < ram_headroom * RAM_CACHE_HYSTERESIS and clean_list:
             _, _, key = clean_list.pop()
-            del self.cache[key]
+            self._spill(key, self.cache.pop(key))
             gc.collect()
@@ -0,0 +1,318 @@
+"""
+Persistent, size-bounded second tier for the node output cache.
+
+Entries are keyed by a digest of the node's input signature together with the ComfyUI version,
+the code version of the nodes and the size and mtime of the model files they load. Entries are
+written when they are evicted from the in-memory cache, not on every set, and the entries still in
+memory are written when the executor resets its caches and when the process exits, so a restarted
+server starts warm. There is one DiskCache per directory in the process (see shared_disk_cache()),
+shared by the caches of every prompt worker. Each entry is a single
+safetensors file: every tensor in the cached outputs is stored as a tensor and the rest of the structure
+(lists, dicts, numbers, strings) is stored as a JSON skeleton in the file metadata. Outputs that
+contain anything else (models, custom objects) are not persisted.
+"""
+
+from __future__ import annotations
+
+import base64
+import atexit
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+import torch
+import safetensors
+import safetensors.torch
+
+DISK_CACHE_FORMAT_VERSION = "2"
+DISK_CACHE_SUFFIX = ".safetensors"
+
+
+class NotPersistable(Exception):
+    pass
+
+
+def _key_to_json(obj):
+    if obj is None or isinstance(obj, (bool, int, str)):
+        return [type(obj).__name__, obj]
+    if isinstance(obj, float):
+        if math.isnan(obj):
+            # NaN never compares equal, so a signature containing it can never be hit again.
+            raise NotPersistable()
+        return ["float", repr(obj)]
+    if isinstance(obj, bytes):
+        return ["bytes", base64.b64encode(obj).decode("ascii")]
+    if isinstance(obj, (tuple, list)):
+        return ["seq", [_key_to_json(x) for x in obj]]
+    if isinstance(obj, frozenset):
+        items = [json.dumps(_key_to_json(x), separators=(",", ":")) for x in obj]
+        return ["set", sorted(items)]
+    raise NotPersistable()
+
+
+def cache_key_digest(cache_key) -> Optional[str]:
+    """Process independent digest of an input signature cache key, or None if it can't be persisted."""
+    if isinstance(cache_key, bytes):
+        # Already a content digest (CacheKeySetInputSignature)
+        return cache_key.hex()
+    try:
+        data = json.dumps(_key_to_json(cache_key), separators=(",", ":"))
+    except NotPersistable:
+        return None
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def _encode(obj, tensors: dict, seen: dict):
+    if isinstance(obj, torch.Tensor):
+        name = seen.get(id(obj))
+        if name is None:
+            name = str(len(tensors))
+            seen[id(obj)] = name
+            tensors[name] = obj.detach()
+        return {"t": "tensor", "k": name, "d": str(obj.device)}
+    if obj is None or isinstance(obj, (bool, int, float, str)):
+        return obj
+    if isinstance(obj, bytes):
+        return {"t": "bytes", "v": base64.b64encode(obj).decode("ascii")}
+    if isinstance(obj, tuple):
+        return {"t": "tuple", "v": [_encode(x, tensors, seen) for x in obj]}
+    if isinstance(obj, list):
+        return [_encode(x, tensors, seen) for x in obj]
+    if isinstance(obj, dict) and type(obj) is dict:
+        return {"t": "dict", "v": [[_encode(k, tensors, seen), _encode(v, tensors, seen)] for k, v in obj.items()]}
+    raise NotPersistable()
+
+
+def _restore_device(tensor: torch.Tensor, device: Optional[str]) -> torch.Tensor:
+    # Tensors come back on the device they were cached from, or stay on the CPU if it's gone.
+    if device is None or device == "cpu":
+        return tensor
+    try:
+        return tensor.to(device)
+    except (RuntimeError, AssertionError) as e:
+        logging.debug(f"Disk cache entry stays on the cpu, can't move it to {device}: {e}")
+        return tensor
+
+
+def _decode(obj, tensors: dict):
+    if isinstance(obj, list):
+        return [_decode(x, tensors) for x in obj]
+    if isinstance(obj, dict):
+        kind = obj["t"]
+        if kind == "tensor":
+            # Moved in place in tensors so outputs that shared a tensor still share it.
+            tensors[obj["k"]] = _restore_device(tensors[obj["k"]], obj.get("d"))
+            return tensors[obj["k"]]
+        if kind == "bytes":
+            return base64.b64decode(obj["v"])
+        if kind == "tuple":
+            return tuple(_decode(x, tensors) for x in obj["v"])
+        if kind == "dict":
+            return {_decode(k, tensors): _decode(v, tensors) for k, v in obj["v"]}
+        raise ValueError(f"Unknown disk cache skeleton entry {kind}")
+    return obj
+
+
+class DiskCache:
+    """Size-bounded LRU store of cache entries on disk. Writes happen on a background thread."""
+
+    def __init__(self, directory: str, max_bytes: int, entry_factory: Callable[..., Any]):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entry_factory = entry_factory
+        self.lock = threading.RLock()
+        self.entries: OrderedDict[str, int] = OrderedDict()
+        self.total_bytes = 0
+        self.pending = set()
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="disk-cache-writer")
+        self.digests = {}
+        # Write on the calling thread: the writer thread is gone once the interpreter exits.
+        self.inline_writes = False
+        # Caches whose live entries are written out when the process exits, see register().
+        self.sources = weakref.WeakSet()
+        os.makedirs(directory, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        found = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".tmp"):
+                # Left over from a crash during a write
+                self._remove_file(path)
+                continue
+            if not name.endswith(DISK_CACHE_SUFFIX):
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            found.append((st.st_mtime, name[:-len(DISK_CACHE_SUFFIX)], st.st_size))
+        for _, digest, size in sorted(found):
+            self.entries[digest] = size
+            self.total_bytes += size
+        self._evict()
+        logging.info("Disk cache at {} holds {} entries ({:.1f} MB).".format(self.directory, len(self.entries), self.total_bytes / (1024 * 1024)))
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest + DISK_CACHE_SUFFIX)
+
+    def _remove_file(self, path):
+        try:
+            os.remove(path)
+        except OSError as e:
+            logging.debug(f"Could not remove disk cache file {path}: {e}")
+
+    def _evict(self):
+        with self.lock:
+            while self.total_bytes > self.max_bytes and len(self.entries) > 0:
+                digest, size = self.entries.popitem(last=False)
+                self.total_bytes -= size
+                self._remove_file(self._path(digest))
+
+    def digest(self, cache_key) -> Optional[str]:
+        if cache_key is None:
+            return None
+        digest = self.digests.get(cache_key)
+        if digest is None:
+            if len(self.digests) > 16384:
+                self.digests = {}
+            digest = cache_key_digest(cache_key)
+            self.digests[cache_key] = digest if digest is not None else ""
+        return digest or None
+
+    def contains(self, cache_key) -> bool:
+        digest = self.digest(cache_key)
+        with self.lock:
+            return digest is not None and (digest in self.entries or digest in self.pending)
+
+    def get(self, cache_key):
+        digest = self.digest(cache_key)
+        if digest is None:
+            return None
+        with self.lock:
+            if digest not in self.entries:
+                return None
+            self.entries.move_to_end(digest)
+        path = self._path(digest)
+        try:
+            with safetensors.safe_open(path, framework="pt", device="cpu") as f:
+                metadata = f.metadata() or {}
+                if metadata.get("format_version") != DISK_CACHE_FORMAT_VERSION:
+                    raise ValueError("unsupported format version")
+                tensors = {k: f.get_tensor(k) for k in f.keys()}
+            skeleton = json.loads(metadata["skeleton"])
+            entry = self.entry_factory(ui=_decode(skeleton["ui"], tensors), outputs=_decode(skeleton["outputs"], tensors))
+            os.utime(path)
+        except Exception as e:
+            logging.warning(f"Dropping unreadable disk cache entry {path}: {e}")
+            self._drop(digest)
+            return None
+        return entry
+
+    def _drop(self, digest):
+        with self.lock:
+            size = self.entries.pop(digest, None)
+            if size is not None:
+                self.total_bytes -= size
+        self._remove_file(self._path(digest))
+
+    def put(self, cache_key, entry) -> bool:
+        """Schedule entry to be written. Returns False if the entry can't be persisted."""
+        digest = self.digest(cache_key)
+        if digest is None:
+            return False
+        with self.lock:
+            if digest in self.entries:
+                self.entries.move_to_end(digest)
+                return True
+            if digest in self.pending:
+                return True
+        tensors = {}
+        try:
+            skeleton = {"ui": _encode(entry.ui, tensors, {}), "outputs": _encode(entry.outputs, tensors, {})}
+        except NotPersistable:
+            return False
+        with self.lock:
+            self.pending.add(digest)
+        if self.inline_writes:
+            self._write(digest, skeleton, tensors)
+        else:
+            self.writer.submit(self._write, digest, skeleton, tensors)
+        return True
+
+    def _write(self, digest, skeleton, tensors):
+        path = self._path(digest)
+        tmp_path = path + ".tmp"
+        try:
+            metadata = {"format_version": DISK_CACHE_FORMAT_VERSION, "skeleton": json.dumps(skeleton)}
+            # Fresh contiguous copies: safetensors refuses views that share storage.
+            tensors = {k: v.to("cpu", copy=True).contiguous() for k, v in tensors.items()}
+            safetensors.torch.save_file(tensors, tmp_path, metadata=metadata)
+            os.replace(tmp_path, path)
+            size = os.path.getsize(path)
+        except Exception as e:
+            logging.warning(f"Failed to write disk cache entry {path}: {e}")
+            self._remove_file(tmp_path)
+            with self.lock:
+                self.pending.discard(digest)
+            return
+        with self.lock:
+            self.pending.discard(digest)
+            self.entries[digest] = size
+            self.total_bytes += size
+        self._evict()
+
+    def flush(self):
+        self.writer.submit(lambda: None).result()
+
+    def register(self, source):
+        """Write the entries source (a BasicCache) holds in memory when the process exits."""
+        self.sources.add(source)
+
+    def persist_all(self, inline: bool = False):
+        """Write the in-memory entries of every registered cache and wait for the writes."""
+        if inline:
+            # The writer thread finished its queued writes when the interpreter started exiting.
+            self.inline_writes = True
+        for source in list(self.sources):
+            try:
+                source.persist()
+            except Exception as e:
+                logging.warning(f"Failed to write the node cache to the disk cache: {e}")
+        if not inline:
+            self.flush()
+
+
+_shared_lock = threading.Lock()
+_shared: dict[str, DiskCache] = {}
+
+
+def shared_disk_cache(directory: str, max_bytes: int, entry_factory: Callable[..., Any]) -> DiskCache:
+    """
+    The process-wide DiskCache of directory, created on first use. All caches using a directory share
+    its index, size budget and writer.
+    """
+    key = os.path.realpath(directory)
+    with _shared_lock:
+        cache = _shared.get(key)
+        if cache is None:
+            cache = DiskCache(directory, max_bytes, entry_factory)
+            if len(_shared) == 0:
+                atexit.register(_persist_shared)
+            _shared[key] = cache
+        return cache
+
+
+def _persist_shared():
+    with _shared_lock:
+        caches = list(_shared.values())
+    for cache in caches:
+        cache.persist_all(inline=True)
@@ -112,6 +112,7 @@ class TopologicalSort:
         self.blocking = {} # Which nodes are blocked by this node
         self.externalBlocks = 0
         self.unblockedEvent = asyncio.Event()
+        self.pendingOrder = None # Cached get_pending_order, dropped when nodes, links or blocks are added
 
     def get_input_info(self, unique_id, input_name):
         class_type = self.dynprompt.get_node(unique_id)["class_type"]
@@ -134,6 +135,7 @@ class TopologicalSort:
             if to_node_id not in self.blocking[from_node_id]:
                 self.blocking[from_node_id][to_node_id] = {}
                 self.blockCount[to_node_id] += 1
+                self.pendingOrder = None
             self.blocking[from_node_id][to_node_id][from_socket] = True
 
     def add_node(self, node_unique_id, include_lazy=False, subgraph_nodes=None):
@@ -148,6 +150,7 @@ class TopologicalSort:
             self.pendingNodes[unique_id] = True
             self.blockCount[unique_id] = 0
             self.blocking[unique_id] = {}
+            self.pendingOrder = None
 
             inputs = self.dynprompt.get_node(unique_id)["inputs"]
             for input_name in inputs:
@@ -170,9 +173,11 @@ class TopologicalSort:
         assert node_id in self.blockCount, "Can't add external block to a node that isn't pending"
         self.externalBlocks += 1
         self.blockCount[node_id] += 1
+        self.pendingOrder = None
         def unblock():
             self.externalBlocks -= 1
             self.blockCount[node_id] -= 1
+            self.pendingOrder = None
             self.unblockedEvent.set()
         return unblock
 
@@ -182,8 +187,40 @@ class TopologicalSort:
     def get_ready_nodes(self):
         return [node_id for node_id in self.pendingNodes if self.blockCount[node_id] == 0]
 
+    def get_pending_order(self):
+        """
+        The pending nodes in an order they can run in: ready nodes first, then every node once the
+        nodes blocking it are done. Nodes that can't become ready on their own (external blocks,
+        cycles) come last.
+
+        The order is computed once and kept while nodes finish (pop_node drops them from it, which
+        leaves a valid order), it is only computed again once nodes, links or blocks are added.
+        """
+        if self.pendingOrder is not None:
+            return list(self.pendingOrder)
+        block_count = dict(self.blockCount)
+        order = self.get_ready_nodes()
+        i = 0
+        while i < len(order):
+            for blocked_node_id in self.blocking[order[i]]:
+                block_count[blocked_node_id] -= 1
+                if block_count[blocked_node_id] == 0:
+                    order.append(blocked_node_id)
+            i += 1
+        if len(order) < len(self.pendingNodes):
+            ordered = set(order)
+            order.extend(node_id for node_id in self.pendingNodes if node_id not in ordered)
+        self.pendingOrder = dict.fromkeys(order)
+        return order
+
+    def has_pending_order(self):
+        """Whether get_pending_order would return the cached order, which only lost finished nodes since."""
+        return self.pendingOrder is not None
+
     def pop_node(self, unique_id):
         del self.pendingNodes[unique_id]
+        if self.pendingOrder is not None:
+            self.pendingOrder.pop(unique_id, None)
         for blocked_node_id in self.blocking[unique_id]:
             self.blockCount[blocked_node_id] -= 1
         del self.blocking[unique_id]
@@ -306,16 +343,19 @@ class ExecutionList(TopologicalSort):
         #TODO: this function should be improved
         return node_list[0]
 
-    def unstage_node_execution(self):
-        assert self.staged_node_id is not None
-        self.staged_node_id = None
+    def unstage_node_execution(self, node_id=None):
+        # Dispatchers that run several nodes at once track their own in-flight nodes and pass node_id.
+        if node_id is None:
+            assert self.staged_node_id is not None
+            self.staged_node_id = None
 
-    def complete_node_execution(self):
-        node_id = self.staged_node_id
+    def complete_node_execution(self, node_id=None):
+        if node_id is None:
+            node_id = self.staged_node_id
+            self.staged_node_id = None
         self.pop_node(node_id)
         self.execution_cache.pop(node_id, None)
         self.execution_cache_listeners.pop(node_id, None)
-        self.staged_node_id = None
 
     def get_nodes_in_cycle(self):
         # We'll dissolve the graph in reverse topological order to leave only the nodes in the cycle.
@@ -0,0 +1,182 @@
+"""
+Lookahead model prefetching (--prefetch-models).
+
+When a prompt starts, and again whenever nodes get added to its ExecutionList, the loader nodes still
+pending are looked up (in the order they can run in) and the model files they will load are read on a background thread, so they are in the page cache
+(where the safetensors mmap in comfy.utils.load_torch_file finds them) by the time the loader runs.
+In between, nodes that start running only drop their own files from the plan.
+Progress is recorded in the ResidencyGraph as file assets going from UNLOADED to CPU_HOT.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+import psutil
+
+import comfy.parallel_read
+import folder_paths
+from comfy_execution.nova_scheduler import NodeLane, classify_node
+from comfy_execution.residency_graph import AssetState, ResidencyGraph
+from comfy_execution.worker_pool import MODEL_FILE_EXTENSIONS
+
+# Widget name prefix -> model folders it is looked up in. Anything else is looked up in MODEL_FOLDERS.
+WIDGET_FOLDERS = (
+    ("ckpt_name", ("checkpoints",)),
+    ("unet_name", ("diffusion_models",)),
+    ("vae_name", ("vae",)),
+    ("clip_name", ("text_encoders", "clip_vision")),
+    ("lora_name", ("loras",)),
+    ("control_net_name", ("controlnet",)),
+    ("style_model_name", ("style_models",)),
+)
+MODEL_FOLDERS = (
+    "checkpoints", "diffusion_models", "vae", "text_encoders", "loras", "controlnet", "clip_vision",
+    "style_models", "upscale_models", "gligen", "hypernetworks", "photomaker", "model_patches",
+)
+
+# Never prefetch more than this fraction of the currently available RAM, the page cache would only
+# evict what was read earlier.
+MAX_AVAILABLE_RAM_FRACTION = 0.5
+# A file read this long ago may have been evicted from the page cache since, it is read again. So is
+# one followed by more reads than the RAM that was available when it was read.
+WARM_SECONDS = 300.0
+
+
+def _model_path(widget: str, value: str) -> Optional[str]:
+    folders = MODEL_FOLDERS
+    for prefix, widget_folders in WIDGET_FOLDERS:
+        if widget.startswith(prefix):
+            folders = widget_folders
+            break
+    for folder in folders:
+        try:
+            path = folder_paths.get_full_path(folder, value)
+        except KeyError:
+            continue
+        if path is not None:
+            return path
+    return None
+
+
+def loader_files(class_def, node: dict) -> list[str]:
+    """Model files a loader node reads, or an empty list if the node isn't a loader."""
+    if classify_node(class_def, node) != NodeLane.IO:
+        return []
+    paths = []
+    for widget, value in node.get("inputs", {}).items():
+        if isinstance(value, str) and value.lower().endswith(MODEL_FILE_EXTENSIONS):
+            path = _model_path(widget, value)
+            if path is not None:
+                paths.append(path)
+    return paths
+
+
+class ModelPrefetcher:
+    def __init__(self, residency: Optional[ResidencyGraph] = None, threads: int = 1):
+        self.residency = residency if residency is not None else ResidencyGraph()
+        self.threads = threads
+        self.condition = threading.Condition()
+        self.wanted: list[str] = []
+        self.current: Optional[str] = None
+        self.cancel_current = False
+        # path -> (size, mtime_ns, read at, bytes_read when read, available RAM when read) of files
+        # read since they last changed
+        self.warm: dict[str, tuple[int, int, float, int, int]] = {}
+        self.bytes_read = 0
+        self._node_files: dict[tuple, list[str]] = {}
+        self.thread = threading.Thread(target=self._run, daemon=True, name="model-prefetch")
+        self.thread.start()
+
+    def files_for(self, dynprompt, node_id) -> list[str]:
+        import nodes
+        node = dynprompt.get_node(node_id)
+        key = (node_id, node["class_type"], tuple(sorted((k, v) for k, v in node["inputs"].items() if isinstance(v, str))))
+        files = self._node_files.get(key)
+        if files is None:
+            class_def = nodes.NODE_CLASS_MAPPINGS.get(node["class_type"])
+            files = loader_files(class_def, node) if class_def is not None else []
+            if len(self._node_files) > 4096:
+                self._node_files = {}
+            self._node_files[key] = files
+        return files
+
+    def schedule(self, dynprompt, node_ids):
+        """Prefetch the model files of the loader nodes among node_ids (in order), replacing the previous plan."""
+        wanted = []
+        for node_id in node_ids:
+            for path in self.files_for(dynprompt, node_id):
+                if path not in wanted and not self._is_warm(path):
+                    wanted.append(path)
+        with self.condition:
+            if self.current is not None and self.current not in wanted:
+                # The file being read isn't needed anymore (its loader ran, or the prompt ended).
+                self.cancel_current = True
+            elif self.current in wanted:
+                wanted.remove(self.current)
+            self.wanted = wanted
+            self.condition.notify()
+
+    def node_started(self, dynprompt, node_id):
+        """Drop the files of a node that started running from the plan, the node reads them itself."""
+        files = self.files_for(dynprompt, node_id)
+        if len(files) == 0:
+            return
+        with self.condition:
+            if self.current in files:
+                self.cancel_current = True
+            self.wanted = [path for path in self.wanted if path not in files]
+
+    def cancel(self):
+        self.schedule(None, [])
+
+    def _is_warm(self, path) -> bool:
+        entry = self.warm.get(path)
+        if entry is None:
+            return False
+        size, mtime_ns, read_at, bytes_read, available = entry
+        try:
+            st = os.stat(path)
+            unchanged = (size, mtime_ns) == (st.st_size, st.st_mtime_ns)
+        except OSError:
+            unchanged = False
+        if unchanged and time.monotonic() - read_at < WARM_SECONDS and self.bytes_read - bytes_read < available:
+            return True
+        self.warm.pop(path, None)
+        self.residency.touch(f"file:{path}", state=AssetState.UNLOADED)
+        return False
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while len(self.wanted) == 0:
+                    self.condition.wait()
+                path = self.wanted.pop(0)
+                self.current = path
+                self.cancel_current = False
+            try:
+                self._read(path)
+            except Exception as e:
+                logging.debug(f"Model prefetch of {path} failed: {e}")
+            finally:
+                with self.condition:
+                    self.current = None
+
+    def _read(self, path):
+        st = os.stat(path)
+        asset_id = f"file:{path}"
+        available = psutil.virtual_memory().available
+        if st.st_size > available * MAX_AVAILABLE_RAM_FRACTION:
+            self.residency.touch(asset_id, state=AssetState.CPU_MMAP, bytes_total=st.st_size)
+            return
+        num_bytes, elapsed = comfy.parallel_read.readahead(path, threads=self.threads, should_stop=lambda: self.cancel_current)
+        self.bytes_read += num_bytes
+        if num_bytes < st.st_size:
+            return
+        self.warm[path] = (st.st_size, st.st_mtime_ns, time.monotonic(), self.bytes_read, available)
+        self.residency.touch(asset_id, state=AssetState.CPU_HOT, bytes_total=st.st_size)
+        logging.debug("Prefetched {} ({:.1f} MB at {:.1f} MB/s)".format(path, num_bytes / (1024 * 1024), num_bytes / (1024 * 1024) / max(elapsed, 1e-6)))
@@ -1,24 +1,202 @@
-"""NOVA scheduler façade (phase-in): planning + telemetry + legacy execution path."""
+"""NOVA scheduler: planning + telemetry + parallel dispatch of independent graph branches."""
 
 from __future__ import annotations
 
-from typing import Any
+import asyncio
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from typing import Any, Awaitable, Callable
 
+from comfy_execution.graph_utils import is_link
 from comfy_execution.profile_policy import detect_profile, get_profile_hints
-from comfy_execution.residency_graph import ResidencyGraph
+from comfy_execution.residency_graph import MODEL_RESIDENCY
 from comfy_execution.telemetry import ExecutionTelemetry
+from comfy_execution.utils import current_node_executor
+
+
+class NodeLane(str, Enum):
+    IO = "io"
+    CPU = "cpu"
+    GPU = "gpu"
+
+
+# Types that represent model weights rather than activations. A node that only produces these is a
+# loader (disk bound), a node that consumes them runs inference on the torch device.
+MODEL_ASSET_TYPES = frozenset([
+    "MODEL", "CLIP", "VAE", "CONTROL_NET", "CLIP_VISION", "STYLE_MODEL", "GLIGEN",
+    "UPSCALE_MODEL", "PHOTOMAKER", "HOOKS", "LATENT_UPSCALE_MODEL", "AUDIO_ENCODER", "MODEL_PATCH",
+])
+
+
+def _input_types(class_def) -> dict:
+    try:
+        valid_inputs = class_def.INPUT_TYPES()
+    except Exception:
+        return {}
+    types = {}
+    for category in ("required", "optional"):
+        for name, info in valid_inputs.get(category, {}).items():
+            if isinstance(info, (tuple, list)) and len(info) > 0 and isinstance(info[0], str):
+                types[name] = info[0]
+    return types
+
+
+def classify_node(class_def, node: dict) -> NodeLane:
+    """Pick the worker lane for a node. Nodes can override this with a NOVA_LANE class attribute."""
+    hint = getattr(class_def, "NOVA_LANE", None)
+    if hint is not None:
+        return NodeLane(hint)
+
+    return_types = [t for t in getattr(class_def, "RETURN_TYPES", ()) if isinstance(t, str)]
+    if len(return_types) > 0 and all(t in MODEL_ASSET_TYPES for t in return_types):
+        return NodeLane.IO
+
+    input_types = _input_types(class_def)
+    for name, value in node.get("inputs", {}).items():
+        if is_link(value) and input_types.get(name) in MODEL_ASSET_TYPES:
+            return NodeLane.GPU
+    return NodeLane.CPU
+
+
+class ParallelNodeDispatcher:
+    """
+    Runs every ready node of an ExecutionList on a worker pool instead of one at a time.
+
+    Loader nodes share an I/O lane, plain tensor/file work shares a CPU lane and anything that runs a
+    model is serialized on a single worker per torch device. Async node functions stay on the event loop.
+    """
+
+    def __init__(self, io_workers: int = 4, cpu_workers: int = 2, device: str | None = None):
+        self.capacity = {NodeLane.IO: max(1, io_workers), NodeLane.CPU: max(1, cpu_workers), NodeLane.GPU: 1}
+        self._device = device
+        self._pools: dict[str, ThreadPoolExecutor] = {}
+        self._lanes: dict[str, NodeLane] = {}
+
+    def _device_name(self) -> str:
+        if self._device is None:
+            import comfy.model_management
+            self._device = str(comfy.model_management.get_torch_device())
+        return self._device
+
+    def lane_key(self, lane: NodeLane) -> str:
+        if lane == NodeLane.GPU:
+            return f"gpu:{self._device_name()}"
+        return lane.value
+
+    def lane_for(self, dynprompt, node_id: str) -> NodeLane:
+        import nodes
+        node = dynprompt.get_node(node_id)
+        class_type = node["class_type"]
+        # Classification depends on which inputs are linked, so it's cached per node rather than per class.
+        cache_key = f"{node_id}:{class_type}"
+        lane = self._lanes.get(cache_key)
+        if lane is None:
+            lane = classify_node(nodes.NODE_CLASS_MAPPINGS[class_type], node)
+            self._lanes[cache_key] = lane
+        return lane
+
+    def _pool(self, lane: NodeLane) -> ThreadPoolExecutor:
+        key = self.lane_key(lane)
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = ThreadPoolExecutor(max_workers=self.capacity[lane], thread_name_prefix=f"nova-{key}")
+            self._pools[key] = pool
+        return pool
+
+    async def _run_in_lane(self, lane: NodeLane, execute_node, node_id):
+        current_node_executor.set(self._pool(lane))
+        return await execute_node(node_id)
+
+    async def run(self, dynprompt, execution_list,
+                  execute_node: Callable[[str], Awaitable[tuple]],
+                  finish_node: Callable[[str, Any, Any, Any], bool]):
+        """
+        Drive execution_list to completion.
+
+        Returns (completed, error, ex). error is only set for scheduling errors (dependency cycles),
+        node failures are reported through finish_node returning False.
+        """
+        self._lanes = {}
+        running: dict[str, tuple[asyncio.Task, NodeLane]] = {}
+        in_flight = Counter()
+        stopped = False
+
+        while running or (not stopped and not execution_list.is_empty()):
+            if not stopped:
+                for node_id in execution_list.get_ready_nodes():
+                    if node_id in running:
+                        continue
+                    lane = self.lane_for(dynprompt, node_id)
+                    if in_flight[lane] >= self.capacity[lane]:
+                        continue
+                    in_flight[lane] += 1
+                    running[node_id] = (asyncio.create_task(self._run_in_lane(lane, execute_node, node_id)), lane)
+
+            if len(running) == 0:
+                if execution_list.externalBlocks > 0:
+                    await execution_list.unblockedEvent.wait()
+                    execution_list.unblockedEvent.clear()
+                    continue
+                # Nothing is ready and nothing can become ready: let the execution list report the cycle.
+                _, error, ex = await execution_list.stage_node_execution()
+                return False, error, ex
+
+            waiters = {task for task, _ in running.values()}
+            unblocked = None
+            if execution_list.externalBlocks > 0:
+                unblocked = asyncio.create_task(execution_list.unblockedEvent.wait())
+                waiters.add(unblocked)
+            done, _ = await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+            if unblocked is not None:
+                if unblocked in done:
+                    execution_list.unblockedEvent.clear()
+                else:
+                    unblocked.cancel()
+
+            for node_id, (task, lane) in list(running.items()):
+                if task not in done:
+                    continue
+                del running[node_id]
+                in_flight[lane] -= 1
+                result, error, ex = task.result()
+                # After a failure the remaining in-flight nodes are drained but their results are dropped.
+                if not stopped and not finish_node(node_id, result, error, ex):
+                    stopped = True
+
+        return not stopped, None, None
+
+    def shutdown(self):
+        for pool in self._pools.values():
+            pool.shutdown(wait=False)
+        self._pools = {}
 
 
 class NovaPromptExecutor:
-    """Wrapper around legacy PromptExecutor while NOVA scheduler is phased in."""
+    """Legacy PromptExecutor driven by the NOVA parallel node dispatcher."""
 
     def __init__(self, server: Any, cache_type=False, cache_args=None):
         from execution import PromptExecutor  # local import to avoid circular deps
+        from comfy.cli_args import args
 
         self._legacy = PromptExecutor(server, cache_type=cache_type, cache_args=cache_args)
-        self.server = server
-        self.residency = ResidencyGraph()
+        # Shared with the model manager, which reports model loads and unloads to it.
+        self.residency = MODEL_RESIDENCY
         self.telemetry = ExecutionTelemetry(server)
+        self.server = server
+        self.dispatcher = ParallelNodeDispatcher(io_workers=args.nova_io_workers, cpu_workers=args.nova_cpu_workers)
+        self._legacy.node_dispatcher = self.dispatcher
+
+    @property
+    def server(self):
+        return self._legacy.server
+
+    @server.setter
+    def server(self, server):
+        # The prompt worker swaps the server (e.g. for a prompt_batching.BatchServer): the messages
+        # are sent by the legacy executor.
+        self._legacy.server = server
+        self.telemetry.server = server
 
     @property
     def history_result(self):
@@ -49,10 +227,6 @@ class NovaPromptExecutor:
             },
         )
 
-        # Read-only residency observations for phase 2 bootstrap.
-        for node_id in prompt.keys():
-            self.residency.touch(f"node:{node_id}")
-
         self._legacy.execute(prompt, prompt_id, extra_data, execute_outputs)
 
         self.telemetry.emit(
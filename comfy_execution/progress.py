@@ -1,9 +1,12 @@
 from __future__ import annotations
 
+import threading
+import time
 from typing import TypedDict, Dict, Optional, Tuple
 from typing_extensions import override
 from PIL import Image
 from enum import Enum
+from contextvars import ContextVar, copy_context
 from abc import ABC
 from tqdm import tqdm
 from typing import TYPE_CHECKING
@@ -11,6 +14,7 @@ if TYPE_CHECKING:
     from comfy_execution.graph import DynamicPrompt
 from protocol import BinaryEventTypes
 from comfy_api import feature_flags
+from comfy.cli_args import args
 
 PreviewImageTuple = Tuple[str, Image.Image, Optional[int]]
 
@@ -150,47 +154,107 @@ class CLIProgressHandler(ProgressHandler):
 class WebUIProgressHandler(ProgressHandler):
     """
     Handler that sends progress updates to the WebUI via WebSockets.
+
+    progress_state messages are rate limited per client (--progress-state-hz, or the client's
+    progress_state_hz feature flag): value updates arriving faster are folded into the next message,
+    sent at the end of the interval at the latest. Node start and finish are always sent. Clients
+    with the supports_progress_state_delta feature flag only get the nodes that changed since the
+    previous message, marked with "delta": true. A full snapshot is sent to a client that
+    (re)connects or asks for it with a progress_resync message.
     """
 
     def __init__(self, server_instance):
         super().__init__("webui")
         self.server_instance = server_instance
+        self.changed: set[str] = set()
+        self.synced_socket = None
+        self.last_sent = 0.0
+        # The send of the updates folded by the rate limit, pending until the end of the interval.
+        self.trailing: Optional[threading.Timer] = None
+        self.lock = threading.RLock()
 
     def set_registry(self, registry: "ProgressRegistry"):
         self.registry = registry
 
-    def _send_progress_state(self, prompt_id: str, nodes: Dict[str, NodeProgressState]):
-        """Send the current progress state to the client"""
+    @override
+    def reset(self):
+        with self.lock:
+            if self.trailing is not None:
+                self.trailing.cancel()
+                self.trailing = None
+            self.changed.clear()
+
+    def _progress_hz(self, sid) -> float:
+        hz = feature_flags.get_connection_feature(self.server_instance.sockets_metadata, sid, "progress_state_hz", None)
+        if isinstance(hz, (int, float)) and not isinstance(hz, bool) and hz >= 0:
+            return hz
+        return args.progress_state_hz
+
+    def _send_progress_state(self, prompt_id: str, nodes: Dict[str, NodeProgressState], node_id: str, force: bool = False):
+        """Send the progress state of the nodes that changed, or of all nodes, to the client"""
         if self.server_instance is None:
             return
+        with self.lock:
+            self.changed.add(node_id)
+            self._send_changed(prompt_id, nodes, force)
+
+    def _send_trailing(self, prompt_id: str):
+        with self.lock:
+            self.trailing = None
+            if self.enabled and len(self.changed) > 0 and self.registry.prompt_id == prompt_id:
+                self._send_changed(prompt_id, self.registry.nodes, force=True)
+
+    def _send_changed(self, prompt_id: str, nodes: Dict[str, NodeProgressState], force: bool):
+        sid = self.server_instance.client_id
+        socket = self.server_instance.sockets.get(sid, None) if sid is not None else None
+        metadata = self.server_instance.sockets_metadata.get(sid, {})
+        resync = socket is not self.synced_socket or metadata.get("progress_resync", False)
+
+        now = time.monotonic()
+        hz = self._progress_hz(sid)
+        if not (force or resync) and hz > 0 and now - self.last_sent < 1.0 / hz:
+            if self.trailing is None:
+                context = copy_context()
+                self.trailing = threading.Timer(self.last_sent + 1.0 / hz - now, context.run, args=(self._send_trailing, prompt_id))
+                self.trailing.daemon = True
+                self.trailing.start()
+            return
+        if self.trailing is not None:
+            self.trailing.cancel()
+            self.trailing = None
 
+        delta = not resync and feature_flags.supports_feature(self.server_instance.sockets_metadata, sid, "supports_progress_state_delta")
         # Only send info for non-pending nodes
         active_nodes = {
             node_id: {
-                "value": state["value"],
-                "max": state["max"],
-                "state": state["state"].value,
+                "value": nodes[node_id]["value"],
+                "max": nodes[node_id]["max"],
+                "state": nodes[node_id]["state"].value,
                 "node_id": node_id,
                 "prompt_id": prompt_id,
                 "display_node_id": self.registry.dynprompt.get_display_node_id(node_id),
                 "parent_node_id": self.registry.dynprompt.get_parent_node_id(node_id),
                 "real_node_id": self.registry.dynprompt.get_real_node_id(node_id),
             }
-            for node_id, state in nodes.items()
-            if state["state"] != NodeState.Pending
+            for node_id in (self.changed if delta else nodes)
+            if node_id in nodes and nodes[node_id]["state"] != NodeState.Pending
         }
+        self.changed.clear()
+        self.synced_socket = socket
+        metadata.pop("progress_resync", None)
+        self.last_sent = now
 
-        # Send a combined progress_state message with all node states
+        # Send a combined progress_state message with the node states
         # Include client_id to ensure message is only sent to the initiating client
-        self.server_instance.send_sync(
-            "progress_state", {"prompt_id": prompt_id, "nodes": active_nodes}, self.server_instance.client_id
-        )
+        message = {"prompt_id": prompt_id, "nodes": active_nodes}
+        if delta:
+            message["delta"] = True
+        self.server_instance.send_sync("progress_state", message, sid)
 
     @override
     def start_handler(self, node_id: str, state: NodeProgressState, prompt_id: str):
-        # Send progress state of all nodes
         if self.registry:
-            self._send_progress_state(prompt_id, self.registry.nodes)
+            self._send_progress_state(prompt_id, self.registry.nodes, node_id, force=True)
 
     @override
     def update_handler(
@@ -202,9 +266,8 @@ class WebUIProgressHandler(ProgressHandler):
         prompt_id: str,
         image: PreviewImageTuple | None = None,
     ):
-        # Send progress state of all nodes
         if self.registry:
-            self._send_progress_state(prompt_id, self.registry.nodes)
+            self._send_progress_state(prompt_id, self.registry.nodes, node_id)
         if image:
             # Only send new format if client supports it
             if feature_flags.supports_feature(
@@ -231,9 +294,8 @@ class WebUIProgressHandler(ProgressHandler):
 
     @override
     def finish_handler(self, node_id: str, state: NodeProgressState, prompt_id: str):
-        # Send progress state of all nodes
         if self.registry:
-            self._send_progress_state(prompt_id, self.registry.nodes)
+            self._send_progress_state(prompt_id, self.registry.nodes, node_id, force=True)
 
 class ProgressRegistry:
     """
@@ -322,15 +384,27 @@ class ProgressRegistry:
 # Global registry instance
 global_progress_registry: ProgressRegistry | None = None
 
+# When several prompt workers run at once each of them keeps its registry in this slot instead.
+worker_progress_registry: ContextVar[Optional[list]] = ContextVar("worker_progress_registry", default=None)
+
+def use_worker_progress_registry() -> None:
+    """Give the calling prompt worker (thread) its own progress registry."""
+    worker_progress_registry.set([None])
+
 def reset_progress_state(prompt_id: str, dynprompt: "DynamicPrompt") -> None:
     global global_progress_registry
 
+    slot = worker_progress_registry.get()
+    previous = slot[0] if slot is not None else global_progress_registry
+
     # Reset existing handlers if registry exists
-    if global_progress_registry is not None:
-        global_progress_registry.reset_handlers()
+    if previous is not None:
+        previous.reset_handlers()
 
     # Create new registry
     global_progress_registry = ProgressRegistry(prompt_id, dynprompt)
+    if slot is not None:
+        slot[0] = global_progress_registry
 
 
 def add_progress_handler(handler: ProgressHandler) -> None:
@@ -341,6 +415,9 @@ def add_progress_handler(handler: ProgressHandler) -> None:
 
 def get_progress_state() -> ProgressRegistry:
     global global_progress_registry
+    slot = worker_progress_registry.get()
+    if slot is not None and slot[0] is not None:
+        return slot[0]
     if global_progress_registry is None:
         from comfy_execution.graph import DynamicPrompt
 
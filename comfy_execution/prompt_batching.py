@@ -0,0 +1,519 @@
+"""
+Cross-prompt batching (--batch-prompts).
+
+Queued prompts that have the same graph and only differ in per-prompt widgets (the sampler seed and
+the prompt text) are merged into a single prompt. Nodes that are identical in every prompt are kept
+once, samplers and VAE decodes that differ are replaced by a batched node that stacks the latents and
+conditioning of every prompt, and everything downstream is copied per prompt. A batched node outputs
+a list with one value per prompt, which the copies of each prompt read through a PromptBatchItem
+node. Messages about the merged prompt are sent to each queued prompt under its own prompt id
+(see BatchServer), and after execution the history is split back into one entry per queued prompt.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Optional
+
+from comfy_execution.graph_utils import is_link
+
+MAX_PROMPT_BATCH = 16
+
+# class_type -> widgets allowed to differ between prompts of a batch. Filled by register_batched_nodes().
+PER_PROMPT_WIDGETS: dict[str, tuple[str, ...]] = {}
+
+# class_type -> (batched class_type, per prompt link inputs, per prompt widgets)
+BATCHED_NODES: dict[str, tuple[str, tuple[str, ...], tuple[str, ...]]] = {}
+
+# Samplers known not to draw noise during sampling. Any other sampler (including ones added by
+# custom nodes) runs once per prompt: its noise would be seeded once per batch instead of once per
+# prompt, which changes the results.
+DETERMINISTIC_SAMPLERS = frozenset((
+    "euler", "euler_cfg_pp", "heun", "heunpp2", "dpm_2", "lms", "dpmpp_2m", "dpmpp_2m_cfg_pp",
+    "ipndm", "ipndm_v", "deis", "res_multistep", "res_multistep_cfg_pp", "gradient_estimation",
+    "gradient_estimation_cfg_pp", "ddim", "uni_pc", "uni_pc_bh2",
+))
+
+# Message fields holding node ids of the merged prompt
+NODE_ID_FIELDS = ("node", "display_node", "node_id", "parent_node", "real_node_id", "display_node_id", "parent_node_id")
+NODE_LIST_FIELDS = ("nodes", "executed", "current_outputs")
+
+
+def _copy_suffix(index: int) -> str:
+    return f".b{index}"
+
+
+def _batched_suffix() -> str:
+    return ".batch"
+
+
+class PromptBatchItem:
+    """The value of one prompt in the output list of a batched node."""
+    DEV_ONLY = True
+    CATEGORY = "_for_testing"
+    FUNCTION = "select"
+    INPUT_IS_LIST = True
+    RETURN_TYPES = ("*",)
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "batch": ("*",),
+                "index": ("INT", {"default": 0, "min": 0, "max": MAX_PROMPT_BATCH - 1}),
+            },
+        }
+
+    def select(self, batch, index):
+        return (batch[index[0]],)
+
+
+class BatchedKSampler:
+    DEV_ONLY = True
+    CATEGORY = "_for_testing"
+    FUNCTION = "sample"
+    RETURN_TYPES = ("LATENT",)
+    OUTPUT_IS_LIST = (True,)
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        optional = {}
+        for i in range(MAX_PROMPT_BATCH):
+            optional[f"seed_{i}"] = ("INT", {"default": 0, "min": 0, "max": 0xffffffffffffffff})
+            optional[f"positive_{i}"] = ("CONDITIONING",)
+            optional[f"negative_{i}"] = ("CONDITIONING",)
+            optional[f"latent_image_{i}"] = ("LATENT",)
+        return {
+            "required": {
+                "model": ("MODEL",),
+                "steps": ("INT",),
+                "cfg": ("FLOAT",),
+                "sampler_name": ("STRING",),
+                "scheduler": ("STRING",),
+                "denoise": ("FLOAT",),
+            },
+            "optional": optional,
+        }
+
+    def sample(self, model, steps, cfg, sampler_name, scheduler, denoise=1.0, **kwargs):
+        import nodes
+        count = sum(1 for i in range(MAX_PROMPT_BATCH) if f"latent_image_{i}" in kwargs)
+        seed_list = [kwargs[f"seed_{i}"] for i in range(count)]
+        latents = [kwargs[f"latent_image_{i}"] for i in range(count)]
+        positives = [kwargs[f"positive_{i}"] for i in range(count)]
+        negatives = [kwargs[f"negative_{i}"] for i in range(count)]
+
+        out = None
+        if sampler_name in DETERMINISTIC_SAMPLERS:
+            out = _sample_batched(model, seed_list, steps, cfg, sampler_name, scheduler, positives, negatives, latents, denoise)
+        if out is None:
+            out = [nodes.common_ksampler(model, seed_list[i], steps, cfg, sampler_name, scheduler, positives[i], negatives[i], latents[i], denoise=denoise)[0] for i in range(count)]
+        return (out,)
+
+
+class BatchedVAEDecode:
+    DEV_ONLY = True
+    CATEGORY = "_for_testing"
+    FUNCTION = "decode"
+    RETURN_TYPES = ("IMAGE",)
+    OUTPUT_IS_LIST = (True,)
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {"vae": ("VAE",)},
+            "optional": {f"samples_{i}": ("LATENT",) for i in range(MAX_PROMPT_BATCH)},
+        }
+
+    def decode(self, vae, **kwargs):
+        import torch
+        import nodes
+        latents = [kwargs[f"samples_{i}"] for i in range(MAX_PROMPT_BATCH) if f"samples_{i}" in kwargs]
+        decoder = nodes.VAEDecode()
+        samples = [latent["samples"] for latent in latents]
+
+        out = None
+        if not any(s.is_nested for s in samples) and all(s.shape[1:] == samples[0].shape[1:] for s in samples):
+            sizes = [s.shape[0] for s in samples]
+            images = decoder.decode(vae, {"samples": torch.cat(samples)})[0]
+            if images.shape[0] % sum(sizes) == 0:
+                per_latent = images.shape[0] // sum(sizes)
+                out = list(torch.split(images, [s * per_latent for s in sizes]))
+        if out is None:
+            out = [decoder.decode(vae, latent)[0] for latent in latents]
+        return (out,)
+
+
+def _stack_batch(tensors, sizes):
+    import torch
+    import comfy.utils
+    parts = []
+    for t, size in zip(tensors, sizes):
+        if t.shape[1:] != tensors[0].shape[1:]:
+            return None
+        if t.shape[0] == size:
+            parts.append(t)
+        elif t.shape[0] == 1:
+            parts.append(comfy.utils.repeat_to_batch_size(t, size))
+        else:
+            return None
+    return torch.cat(parts)
+
+
+def stack_conditioning(conds, sizes):
+    """Stack one CONDITIONING per prompt along the batch dimension, or None if they don't line up."""
+    import torch
+    first = conds[0]
+    if any(len(c) != len(first) for c in conds):
+        return None
+    out = []
+    for j in range(len(first)):
+        cond = _stack_batch([c[j][0] for c in conds], sizes)
+        if cond is None:
+            return None
+        keys = first[j][1].keys()
+        if any(c[j][1].keys() != keys for c in conds):
+            return None
+        options = {}
+        for k in keys:
+            values = [c[j][1][k] for c in conds]
+            if all(isinstance(v, torch.Tensor) for v in values):
+                stacked = _stack_batch(values, sizes)
+                if stacked is None:
+                    return None
+                options[k] = stacked
+                continue
+            for v in values[1:]:
+                if v is values[0]:
+                    continue
+                try:
+                    if isinstance(v, torch.Tensor) or not (v == values[0]):
+                        return None
+                except Exception:
+                    return None
+            options[k] = values[0]
+        out.append([cond, options])
+    return out
+
+
+def _sample_batched(model, seeds, steps, cfg, sampler_name, scheduler, positives, negatives, latents, denoise):
+    import torch
+    import comfy.sample
+    import comfy.utils
+    import latent_preview
+
+    items = []
+    for latent in latents:
+        if "noise_mask" in latent or latent["samples"].is_nested:
+            return None
+        items.append(comfy.sample.fix_empty_latent_channels(model, latent["samples"], latent.get("downscale_ratio_spacial", None)))
+    if any(s.shape[1:] != items[0].shape[1:] or s.dtype != items[0].dtype for s in items):
+        return None
+    sizes = [s.shape[0] for s in items]
+    positive = stack_conditioning(positives, sizes)
+    negative = stack_conditioning(negatives, sizes)
+    if positive is None or negative is None:
+        return None
+
+    # Noise of each prompt is generated exactly like an unbatched run with its own seed.
+    noise = torch.cat([comfy.sample.prepare_noise(s, seed, latent.get("batch_index", None)) for s, seed, latent in zip(items, seeds, latents)])
+    callback = latent_preview.prepare_callback(model, steps)
+    samples = comfy.sample.sample(model, noise, steps, cfg, sampler_name, scheduler, positive, negative, torch.cat(items),
+                                  denoise=denoise, callback=callback, disable_pbar=not comfy.utils.PROGRESS_BAR_ENABLED, seed=seeds[0])
+    out = []
+    for latent, chunk in zip(latents, torch.split(samples, sizes)):
+        result = latent.copy()
+        result.pop("downscale_ratio_spacial", None)
+        result["samples"] = chunk
+        out.append(result)
+    return out
+
+
+def register_batched_nodes():
+    """Enable batching for the core nodes, unless a custom node has replaced them."""
+    import nodes
+    mappings = nodes.NODE_CLASS_MAPPINGS
+    mappings["PromptBatchItem"] = PromptBatchItem
+    if mappings.get("KSampler") is nodes.KSampler:
+        mappings["BatchedKSampler"] = BatchedKSampler
+        BATCHED_NODES["KSampler"] = ("BatchedKSampler", ("positive", "negative", "latent_image"), ("seed",))
+        PER_PROMPT_WIDGETS["KSampler"] = ("seed",)
+    if mappings.get("VAEDecode") is nodes.VAEDecode:
+        mappings["BatchedVAEDecode"] = BatchedVAEDecode
+        BATCHED_NODES["VAEDecode"] = ("BatchedVAEDecode", ("samples",), ())
+    if mappings.get("CLIPTextEncode") is nodes.CLIPTextEncode:
+        PER_PROMPT_WIDGETS["CLIPTextEncode"] = ("text",)
+
+
+_signatures: OrderedDict[str, Optional[str]] = OrderedDict()
+
+
+def batch_signature(item) -> Optional[str]:
+    """
+    Key under which a queue item can be batched with others, or None if it can't be batched.
+    Items with equal keys have the same graph, outputs and extra data, and only differ in PER_PROMPT_WIDGETS.
+    """
+    prompt_id = item[1]
+    if prompt_id in _signatures:
+        return _signatures[prompt_id]
+    prompt, extra_data, outputs, sensitive = item[2], item[3], item[4], item[5]
+
+    signature = None
+    if any(node["class_type"] in BATCHED_NODES for node in prompt.values()):
+        nodes_shape = []
+        for node_id in sorted(prompt.keys()):
+            node = prompt[node_id]
+            per_prompt = PER_PROMPT_WIDGETS.get(node["class_type"], ())
+            inputs = []
+            for name in sorted(node["inputs"].keys()):
+                value = node["inputs"][name]
+                if name in per_prompt and not is_link(value):
+                    value = "*"
+                inputs.append([name, value])
+            nodes_shape.append([node_id, node["class_type"], inputs])
+        # extra_pnginfo carries the UI workflow which has the per prompt widget values in it. The rest,
+        # client_id included, has to match: a batch only ever reports to one client.
+        extra = {k: v for k, v in extra_data.items() if k != "extra_pnginfo"}
+        data = json.dumps([nodes_shape, sorted(outputs), extra, sensitive], sort_keys=True, default=str)
+        signature = hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    _signatures[prompt_id] = signature
+    if len(_signatures) > 65536:
+        _signatures.popitem(last=False)
+    return signature
+
+
+class PromptBatch:
+    """A merged prompt built from compatible queue items (see batch_signature)."""
+
+    def __init__(self, items):
+        self.items = items
+        self.prompt_id = items[0][1]
+        self.prompts = [item[2] for item in items]
+        self.extra_pnginfo = [item[3].get("extra_pnginfo", None) for item in items]
+        # merged node id -> (original node id, prompt index or None when shared by every prompt)
+        self.owners: dict[str, tuple[str, Optional[int]]] = {}
+        self.prompt = {}
+        self.execute_outputs = []
+        # Nodes of the merged prompt each queued prompt needs executed
+        self.item_outputs: list[list[str]] = [[] for _ in items]
+        self._build(items[0][4])
+
+    def _tainted_nodes(self):
+        first = self.prompts[0]
+        tainted = set()
+        order = _topological_order(first)
+        for node_id in order:
+            node = first[node_id]
+            for name in PER_PROMPT_WIDGETS.get(node["class_type"], ()):
+                value = node["inputs"].get(name)
+                if not is_link(value) and any(p[node_id]["inputs"].get(name) != value for p in self.prompts[1:]):
+                    tainted.add(node_id)
+            for value in node["inputs"].values():
+                if is_link(value) and value[0] in tainted:
+                    tainted.add(node_id)
+        return order, tainted
+
+    def _build(self, outputs):
+        first = self.prompts[0]
+        order, tainted = self._tainted_nodes()
+        count = len(self.prompts)
+        batched = set()
+
+        def ref(link, index):
+            source, socket = link[0], link[1]
+            if source not in tainted:
+                return [source, socket]
+            if source in batched:
+                item_id = source + _batched_suffix() + _copy_suffix(index)
+                if socket != 0:
+                    item_id += f".{socket}"
+                if item_id not in self.prompt:
+                    self.prompt[item_id] = {"class_type": "PromptBatchItem", "inputs": {"batch": [source + _batched_suffix(), socket], "index": index}}
+                    self.owners[item_id] = (source, index)
+                return [item_id, 0]
+            return [source + _copy_suffix(index), socket]
+
+        for node_id in order:
+            node = first[node_id]
+            class_type = node["class_type"]
+            if node_id not in tainted:
+                self.prompt[node_id] = {"class_type": class_type, "inputs": dict(node["inputs"])}
+                self.owners[node_id] = (node_id, None)
+                continue
+
+            spec = BATCHED_NODES.get(class_type)
+            if spec is not None:
+                batched_class, per_prompt_links, per_prompt_widgets = spec
+                shared_ok = all(
+                    not (is_link(v) and v[0] in tainted) for k, v in node["inputs"].items() if k not in per_prompt_links
+                ) and all(not is_link(node["inputs"].get(w)) for w in per_prompt_widgets)
+                if shared_ok:
+                    inputs = {k: v for k, v in node["inputs"].items() if k not in per_prompt_links and k not in per_prompt_widgets}
+                    for w in per_prompt_widgets:
+                        for i in range(count):
+                            inputs[f"{w}_{i}"] = self.prompts[i][node_id]["inputs"][w]
+                    for name in per_prompt_links:
+                        if name not in node["inputs"]:
+                            continue
+                        for i in range(count):
+                            value = self.prompts[i][node_id]["inputs"][name]
+                            inputs[f"{name}_{i}"] = ref(value, i) if is_link(value) else value
+                    merged_id = node_id + _batched_suffix()
+                    self.prompt[merged_id] = {"class_type": batched_class, "inputs": inputs}
+                    self.owners[merged_id] = (node_id, None)
+                    batched.add(node_id)
+                    continue
+
+            for i in range(count):
+                inputs = {}
+                for name, value in self.prompts[i][node_id]["inputs"].items():
+                    inputs[name] = ref(value, i) if is_link(value) else value
+                merged_id = node_id + _copy_suffix(i)
+                self.prompt[merged_id] = {"class_type": class_type, "inputs": inputs}
+                self.owners[merged_id] = (node_id, i)
+
+        for node_id in outputs:
+            if node_id in tainted:
+                self.execute_outputs += [node_id + _copy_suffix(i) for i in range(count)]
+                for i in range(count):
+                    self.item_outputs[i].append(node_id + _copy_suffix(i))
+            else:
+                self.execute_outputs.append(node_id)
+                for i in range(count):
+                    self.item_outputs[i].append(node_id)
+
+    def get_prompt_info(self, real_node_id, default_prompt, default_extra_pnginfo):
+        """The original prompt and extra_pnginfo a node of the merged prompt belongs to (for PROMPT/EXTRA_PNGINFO hidden inputs)."""
+        owner = self.owners.get(real_node_id)
+        if owner is None:
+            return default_prompt, default_extra_pnginfo
+        index = owner[1] if owner[1] is not None else 0
+        return self.prompts[index], self.extra_pnginfo[index]
+
+    def _to_original(self, node_id):
+        owner = self.owners.get(node_id)
+        return owner[0] if owner is not None else node_id
+
+    def _owned_by(self, node_id, index):
+        owner = self.owners.get(node_id)
+        return owner is None or owner[1] is None or owner[1] == index
+
+    def _for_item(self, data: dict, index: int) -> dict:
+        out = dict(data)
+        if "prompt_id" in out:
+            out["prompt_id"] = self.items[index][1]
+        for field in NODE_ID_FIELDS:
+            if isinstance(out.get(field), str):
+                out[field] = self._to_original(out[field])
+        for field in NODE_LIST_FIELDS:
+            value = out.get(field)
+            if isinstance(value, list):
+                out[field] = [self._to_original(n) for n in value if self._owned_by(n, index)]
+            elif isinstance(value, dict):
+                out[field] = {
+                    self._to_original(n): self._for_item(state, index) if isinstance(state, dict) else state
+                    for n, state in value.items()
+                    if self._owned_by(state.get("real_node_id", n) if isinstance(state, dict) else n, index)
+                }
+        return out
+
+    def split_message(self, event, data) -> list[tuple[Optional[int], str, object]]:
+        """
+        (prompt index, event, data) for each queued prompt a message about the merged prompt concerns,
+        with its own prompt id and node ids. A message about a node copied per prompt only goes to its
+        prompt. When execution stops with an error, prompts whose outputs were all executed get
+        execution_success instead. Other messages are returned as they are, with index None.
+        """
+        if not isinstance(data, dict) or data.get("prompt_id") != self.prompt_id:
+            return [(None, event, data)]
+        if event in ("execution_error", "execution_interrupted"):
+            executed = set(data.get("executed", ()))
+            out = []
+            for i in range(len(self.items)):
+                if all(node_id in executed for node_id in self.item_outputs[i]):
+                    success = {k: v for k, v in data.items() if k == "timestamp"}
+                    out.append((i, "execution_success", {"prompt_id": self.items[i][1], **success}))
+                else:
+                    out.append((i, event, self._for_item(data, i)))
+            return out
+        owner = None
+        for field in ("real_node_id", "node", "node_id", "display_node"):
+            value = data.get(field)
+            if isinstance(value, str) and value in self.owners:
+                owner = self.owners[value]
+                break
+        indices = range(len(self.items)) if owner is None or owner[1] is None else [owner[1]]
+        return [(i, event, self._for_item(data, i)) for i in indices]
+
+    def item_messages(self, messages, index) -> list[tuple[str, object]]:
+        """The status messages of one queued prompt, from the status messages of the merged prompt."""
+        out = []
+        for event, data in messages:
+            for i, item_event, item_data in self.split_message(event, data):
+                if i is None or i == index:
+                    out.append((item_event, item_data))
+        return out
+
+    def split_history(self, history_result, index):
+        outputs = {}
+        meta = {}
+        for node_id, output in history_result.get("outputs", {}).items():
+            node_meta = history_result.get("meta", {}).get(node_id, {})
+            real_node_id = node_meta.get("real_node_id", node_id)
+            owner = self.owners.get(real_node_id)
+            if owner is not None and owner[1] is not None and owner[1] != index:
+                continue
+            original_id = self._to_original(node_id)
+            outputs[original_id] = output
+            meta[original_id] = {k: self._to_original(v) if isinstance(v, str) else v for k, v in node_meta.items()}
+        return {"outputs": outputs, "meta": meta}
+
+
+def _topological_order(prompt):
+    order = []
+    visited = set()
+    for root in sorted(prompt.keys()):
+        if root in visited:
+            continue
+        stack = [(root, False)]
+        while stack:
+            node_id, expanded = stack.pop()
+            if expanded:
+                order.append(node_id)
+                continue
+            if node_id in visited or node_id not in prompt:
+                continue
+            visited.add(node_id)
+            stack.append((node_id, True))
+            for value in prompt[node_id]["inputs"].values():
+                if is_link(value) and value[0] not in visited:
+                    stack.append((value[0], False))
+    return order
+
+
+class BatchServer:
+    """
+    PromptServer as seen by the executor running a PromptBatch: messages about the merged prompt are
+    sent to the client of each queued prompt it concerns, under that prompt's id (see
+    PromptBatch.split_message). Everything else is the wrapped server.
+    """
+
+    def __init__(self, server, batch: PromptBatch):
+        object.__setattr__(self, "_server", server)
+        object.__setattr__(self, "_batch", batch)
+
+    def __getattr__(self, name):
+        return getattr(self._server, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._server, name, value)
+
+    def send_sync(self, event, data, sid=None):
+        for index, item_event, item_data in self._batch.split_message(event, data):
+            item_sid = sid
+            if index is not None and sid is not None:
+                item_sid = self._batch.items[index][3].get("client_id", sid)
+            self._server.send_sync(item_event, item_data, item_sid)
@@ -0,0 +1,204 @@
+"""
+Data structures behind PromptQueue.
+
+Queue items are (number, prompt_id, prompt, extra_data, outputs_to_execute, sensitive) tuples and are
+treated as immutable: nothing that holds one (the queue, currently running, history, API responses)
+modifies it, so they are shared instead of deep copied.
+"""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+from collections import OrderedDict
+from typing import Any, Callable, Iterator, Optional
+
+
+def item_workflow_id(item) -> Optional[str]:
+    extra_pnginfo = item[3].get("extra_pnginfo") or {}
+    workflow = extra_pnginfo.get("workflow") if isinstance(extra_pnginfo, dict) else None
+    if isinstance(workflow, dict):
+        return workflow.get("id")
+    return None
+
+
+class IndexedQueue:
+    """
+    Priority queue of queue items ordered by number (then insertion order), indexed by prompt_id.
+
+    Insert, pop, delete by id and priority changes are O(log n): deleted entries stay in the heap
+    marked as removed and are skipped when they reach the top. The heap is rebuilt once more than
+    half of it is removed entries.
+    """
+
+    _REMOVED = None
+
+    def __init__(self):
+        self._heap: list[list] = []
+        self._entries: dict[str, list] = {}
+        self._counter = itertools.count()
+        self._snapshot: Optional[tuple] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, prompt_id) -> bool:
+        return prompt_id in self._entries
+
+    def get(self, prompt_id):
+        entry = self._entries.get(prompt_id)
+        return entry[2] if entry is not None else None
+
+    def push(self, item):
+        prompt_id = item[1]
+        if prompt_id in self._entries:
+            self._mark_removed(prompt_id)
+        entry = [item[0], next(self._counter), item]
+        self._entries[prompt_id] = entry
+        heapq.heappush(self._heap, entry)
+        self._snapshot = None
+
+    def _mark_removed(self, prompt_id):
+        entry = self._entries.pop(prompt_id)
+        entry[2] = self._REMOVED
+        self._snapshot = None
+        if len(self._heap) > 64 and len(self._entries) < len(self._heap) // 2:
+            self._heap = [e for e in self._heap if e[2] is not self._REMOVED]
+            heapq.heapify(self._heap)
+
+    def _discard_removed_top(self):
+        while len(self._heap) > 0 and self._heap[0][2] is self._REMOVED:
+            heapq.heappop(self._heap)
+
+    def pop(self):
+        self._discard_removed_top()
+        entry = heapq.heappop(self._heap)
+        del self._entries[entry[2][1]]
+        self._snapshot = None
+        return entry[2]
+
+    def smallest(self, n: int) -> list:
+        """The first n items in priority order, without removing them."""
+        taken = []
+        while len(taken) < n:
+            self._discard_removed_top()
+            if len(self._heap) == 0:
+                break
+            taken.append(heapq.heappop(self._heap))
+        for entry in taken:
+            heapq.heappush(self._heap, entry)
+        return [entry[2] for entry in taken]
+
+    def remove(self, prompt_id) -> bool:
+        if prompt_id not in self._entries:
+            return False
+        self._mark_removed(prompt_id)
+        return True
+
+    def set_priority(self, prompt_id, number) -> bool:
+        entry = self._entries.get(prompt_id)
+        if entry is None:
+            return False
+        item = entry[2]
+        self.push((number,) + tuple(item[1:]))
+        return True
+
+    def clear(self):
+        self._heap = []
+        self._entries = {}
+        self._snapshot = None
+
+    def items(self) -> tuple:
+        """Immutable snapshot of the queued items (in no particular order), reused until the queue changes."""
+        if self._snapshot is None:
+            self._snapshot = tuple(entry[2] for entry in self._entries.values())
+        return self._snapshot
+
+    def find(self, function: Callable[[Any], bool]):
+        for entry in self._entries.values():
+            if function(entry[2]):
+                return entry[2]
+        return None
+
+
+class HistoryRing:
+    """
+    Insertion ordered, size bounded prompt history with secondary indexes by status and workflow id.
+    Adding an entry past max_size drops the oldest one.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self._by_status: dict[Optional[str], dict[str, None]] = {}
+        self._by_workflow: dict[str, dict[str, None]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, prompt_id) -> bool:
+        return prompt_id in self._entries
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._entries)
+
+    def __getitem__(self, prompt_id) -> dict:
+        return self._entries[prompt_id]
+
+    def get(self, prompt_id, default=None):
+        return self._entries.get(prompt_id, default)
+
+    def items(self):
+        return self._entries.items()
+
+    @staticmethod
+    def _keys(entry):
+        status = entry.get("status")
+        status_str = status.get("status_str") if isinstance(status, dict) else None
+        return status_str, item_workflow_id(entry["prompt"])
+
+    def add(self, prompt_id, entry: dict):
+        if prompt_id in self._entries:
+            self.pop(prompt_id)
+        while len(self._entries) >= self.max_size:
+            self.pop(next(iter(self._entries)))
+        self._entries[prompt_id] = entry
+        status_str, workflow_id = self._keys(entry)
+        self._by_status.setdefault(status_str, {})[prompt_id] = None
+        if workflow_id is not None:
+            self._by_workflow.setdefault(workflow_id, {})[prompt_id] = None
+
+    def pop(self, prompt_id, default=None):
+        entry = self._entries.pop(prompt_id, None)
+        if entry is None:
+            return default
+        status_str, workflow_id = self._keys(entry)
+        self._unindex(self._by_status, status_str, prompt_id)
+        if workflow_id is not None:
+            self._unindex(self._by_workflow, workflow_id, prompt_id)
+        return entry
+
+    @staticmethod
+    def _unindex(index, key, prompt_id):
+        ids = index.get(key)
+        if ids is not None:
+            ids.pop(prompt_id, None)
+            if len(ids) == 0:
+                del index[key]
+
+    def clear(self):
+        self._entries.clear()
+        self._by_status = {}
+        self._by_workflow = {}
+
+    def slice(self, offset: int = 0, max_items: Optional[int] = None, ids=None) -> OrderedDict:
+        """Entries in insertion order, starting at offset. ids restricts the result to an index."""
+        keys = self._entries.keys() if ids is None else ids
+        stop = None if max_items is None else offset + max_items
+        return OrderedDict((k, self._entries[k]) for k in itertools.islice(keys, max(offset, 0), stop))
+
+    def ids_with_status(self, status_str: Optional[str]):
+        return self._by_status.get(status_str, {}).keys()
+
+    def ids_with_workflow(self, workflow_id: str):
+        return self._by_workflow.get(workflow_id, {}).keys()
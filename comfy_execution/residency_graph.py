@@ -1,9 +1,10 @@
-"""Read-only residency graph scaffolding for NOVA migration phases."""
+"""Residency graph: where model files and loaded models live (disk, RAM, GPU) and how they got there."""
 
 from __future__ import annotations
 
 from dataclasses import dataclass, asdict
 from enum import Enum
+import threading
 import time
 from typing import Dict
 
@@ -16,6 +17,21 @@ class AssetState(str, Enum):
     GPU_PARTIAL = "gpu_partial"
 
 
+# Events counted by ResidencyGraph.record(), per asset and in total -> ResidencyAsset counter.
+EVENTS = {
+    "load": "loads",
+    "partial_load": "partial_loads",
+    "unload": "unloads",
+    "partial_unload": "partial_unloads",
+    "ram_unload": "ram_unloads",
+    "hit": "hits",
+    "miss": "misses",
+}
+
+# Unloaded assets beyond this many are forgotten, least recently used first.
+MAX_ASSETS = 1024
+
+
 @dataclass
 class ResidencyAsset:
     asset_id: str
@@ -24,15 +40,35 @@ class ResidencyAsset:
     bytes_gpu_resident: int = 0
     last_used_ts_ms: int = 0
     pin_priority: int = 0
+    label: str = ""
+    device: str = ""
+    bytes_cpu_resident: int = 0
+    load_seconds: float = 0.0
+    last_load_seconds: float = 0.0
+    loads: int = 0
+    partial_loads: int = 0
+    unloads: int = 0
+    partial_unloads: int = 0
+    ram_unloads: int = 0
+    hits: int = 0
+    misses: int = 0
 
 
 class ResidencyGraph:
-    """Lightweight, thread-safe enough for current single worker usage."""
+    """Thread-safe: fed by the model manager on the execution thread and read by the server."""
 
     def __init__(self):
         self._assets: Dict[str, ResidencyAsset] = {}
+        # Reentrant: assets are marked unloaded from weakref finalizers, which can run during touch().
+        self._lock = threading.RLock()
+        self.totals: Dict[str, float] = {event: 0 for event in EVENTS}
+        self.totals["load_seconds"] = 0.0
+
+    def touch(self, asset_id: str, *, state: AssetState | None = None, bytes_total: int | None = None, bytes_gpu_resident: int | None = None, **fields) -> None:
+        with self._lock:
+            self._touch(asset_id, state=state, bytes_total=bytes_total, bytes_gpu_resident=bytes_gpu_resident, **fields)
 
-    def touch(self, asset_id: str, *, state: AssetState | None = None, bytes_total: int | None = None, bytes_gpu_resident: int | None = None) -> None:
+    def _touch(self, asset_id, state=None, bytes_total=None, bytes_gpu_resident=None, **fields) -> ResidencyAsset:
         now = int(time.time() * 1000)
         asset = self._assets.get(asset_id)
         if asset is None:
@@ -44,10 +80,73 @@ class ResidencyGraph:
             asset.bytes_total = bytes_total
         if bytes_gpu_resident is not None:
             asset.bytes_gpu_resident = bytes_gpu_resident
+        for name, value in fields.items():
+            if value is not None:
+                setattr(asset, name, value)
         asset.last_used_ts_ms = now
+        if len(self._assets) > MAX_ASSETS:
+            self._forget_unloaded(asset_id)
+        return asset
+
+    def _forget_unloaded(self, keep):
+        unloaded = sorted((a.last_used_ts_ms, a.asset_id) for a in self._assets.values() if a.state == AssetState.UNLOADED and a.asset_id != keep)
+        for _, asset_id in unloaded[:len(self._assets) - MAX_ASSETS]:
+            del self._assets[asset_id]
+
+    def record(self, asset_id: str, event: str, *, seconds: float | None = None, **fields) -> None:
+        """Count an event (one of EVENTS) for an asset and update it with the touch() fields."""
+        if event not in EVENTS:
+            raise ValueError(f"Unknown residency event: {event}")
+        with self._lock:
+            asset = self._touch(asset_id, **fields)
+            setattr(asset, EVENTS[event], getattr(asset, EVENTS[event]) + 1)
+            self.totals[event] += 1
+            if seconds is not None:
+                asset.load_seconds += seconds
+                asset.last_load_seconds = seconds
+                self.totals["load_seconds"] += seconds
 
     def snapshot(self) -> dict:
-        return {
-            "assets": [asdict(asset) for asset in self._assets.values()],
-            "asset_count": len(self._assets),
-        }
+        with self._lock:
+            return {
+                "assets": [asdict(asset) for asset in self._assets.values()],
+                "asset_count": len(self._assets),
+                "totals": dict(self.totals),
+            }
+
+    def prometheus(self, prefix: str = "comfy_residency") -> list[str]:
+        """Prometheus text exposition lines: event counters and the bytes each asset holds on each device."""
+        snapshot = self.snapshot()
+        lines = [f"# TYPE {prefix}_events_total counter"]
+        for event in EVENTS:
+            lines.append(f'{prefix}_events_total{{event="{event}"}} {snapshot["totals"][event]}')
+        lines.append(f"# TYPE {prefix}_load_seconds_total counter")
+        lines.append(f'{prefix}_load_seconds_total {snapshot["totals"]["load_seconds"]}')
+        lines.append(f"# TYPE {prefix}_bytes gauge")
+        for asset in snapshot["assets"]:
+            if asset["bytes_total"] == 0:
+                continue
+            labels = 'asset="{}",name="{}"'.format(_escape(asset["asset_id"]), _escape(asset["label"]))
+            lines.append(f'{prefix}_bytes{{{labels},location="gpu"}} {asset["bytes_gpu_resident"]}')
+            lines.append(f'{prefix}_bytes{{{labels},location="cpu"}} {asset["bytes_cpu_resident"]}')
+        return lines
+
+
+# The process wide graph: the model manager (comfy.model_management) reports every model load and
+# unload to it.
+MODEL_RESIDENCY = ResidencyGraph()
+
+
+def prometheus_gauges(prefix: str, stats: dict) -> list[str]:
+    """Prometheus text exposition lines for the numeric values of a stats() dict."""
+    lines = []
+    for key, value in stats.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        lines.append(f"# TYPE {prefix}_{key} gauge")
+        lines.append(f"{prefix}_{key} {value}")
+    return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
@@ -1,4 +1,5 @@
 import contextvars
+from concurrent.futures import Executor
 from typing import Optional, NamedTuple
 
 class ExecutionContext(NamedTuple):
@@ -18,6 +19,12 @@ current_executing_context: contextvars.ContextVar[Optional[ExecutionContext]] =
 def get_executing_context() -> Optional[ExecutionContext]:
     return current_executing_context.get(None)
 
+# When set, synchronous node functions are run on this executor instead of the event loop thread.
+current_node_executor: contextvars.ContextVar[Optional[Executor]] = contextvars.ContextVar("current_node_executor", default=None)
+
+def get_node_executor() -> Optional[Executor]:
+    return current_node_executor.get(None)
+
 class CurrentNodeContext:
     """
     Context manager for setting the current executing node context.
@@ -0,0 +1,182 @@
+"""
+Multi-device prompt workers (--worker-devices).
+
+One prompt worker thread runs per torch device, each with its own PromptExecutor (and so its own
+cache set) and with get_torch_device() pointing at its device. All workers pull from the shared
+PromptQueue, which uses DeviceAffinity to hand a worker the queued prompts whose models it already
+has loaded.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Sequence
+
+MODEL_FILE_EXTENSIONS = (".safetensors", ".sft", ".ckpt", ".pt", ".pt2", ".pth", ".bin", ".gguf", ".onnx")
+
+# How many queued prompts a worker looks at when picking the one that fits its loaded models best.
+AFFINITY_LOOKAHEAD = 8
+# Longest a queued prompt can be held back (in seconds) by prompts that were moved ahead of it.
+AFFINITY_MAX_DELAY = 120.0
+
+
+def prompt_model_keys(prompt: dict) -> frozenset:
+    """The model files referenced by the widgets of a prompt, e.g. ("ckpt_name", "sd_xl_base_1.0.safetensors")."""
+    keys = set()
+    for node in prompt.values():
+        for name, value in node.get("inputs", {}).items():
+            if isinstance(value, str) and value.lower().endswith(MODEL_FILE_EXTENSIONS):
+                keys.add((name, value))
+    return frozenset(keys)
+
+
+def parse_worker_devices(spec: Optional[str]) -> list:
+    """
+    Devices from the --worker-devices value: "all" for every visible GPU, or a comma separated list of
+    torch devices such as "cuda:0,cuda:1". Returns an empty list when a single worker should be used.
+    """
+    if spec is None or spec == "":
+        return []
+    import torch
+    if spec == "all":
+        import comfy.model_management
+        device = comfy.model_management.get_torch_device()
+        if device.type == "cuda":
+            return [torch.device("cuda", i) for i in range(torch.cuda.device_count())]
+        if device.type == "xpu":
+            return [torch.device("xpu", i) for i in range(torch.xpu.device_count())]
+        return [device]
+    return [torch.device(x.strip()) for x in spec.split(",") if x.strip() != ""]
+
+
+class DeviceAffinity:
+    """
+    Tracks which models each worker has recently run so queued prompts can be routed to it. With a
+    single worker (worker None) this groups queued prompts that use the same checkpoints and LoRAs.
+
+    A prompt that was passed over is taken first once it has been held back for max_delay seconds.
+    """
+
+    def __init__(self, max_models_per_worker: int = 64, lookahead: int = AFFINITY_LOOKAHEAD, max_delay: float = AFFINITY_MAX_DELAY):
+        self.max_models_per_worker = max_models_per_worker
+        self.lookahead = lookahead
+        self.max_delay = max_delay
+        self.lock = threading.Lock()
+        self.resident: dict[Optional[str], OrderedDict] = {}
+        self.last: dict[Optional[str], frozenset] = {}
+        self.bypassed: dict[str, float] = {}
+        self._keys: OrderedDict[str, frozenset] = OrderedDict()
+
+    def model_keys(self, item) -> frozenset:
+        prompt_id = item[1]
+        keys = self._keys.get(prompt_id)
+        if keys is None:
+            keys = prompt_model_keys(item[2])
+            self._keys[prompt_id] = keys
+            if len(self._keys) > 65536:
+                self._keys.popitem(last=False)
+        return keys
+
+    def record(self, worker: Optional[str], prompt: dict):
+        keys = prompt_model_keys(prompt)
+        with self.lock:
+            self.last[worker] = keys
+            resident = self.resident.setdefault(worker, OrderedDict())
+            for key in keys:
+                resident[key] = None
+                resident.move_to_end(key)
+            while len(resident) > self.max_models_per_worker:
+                resident.popitem(last=False)
+
+    def forget(self, worker: Optional[str]):
+        with self.lock:
+            self.resident.pop(worker, None)
+            self.last.pop(worker, None)
+
+    def score(self, worker: Optional[str], keys: frozenset) -> tuple:
+        """
+        Higher is better. Prompts that need exactly the models of the last prompt come first, then the ones
+        sharing the most models with it (those are the models still loaded), then the ones sharing the most
+        models the worker ran recently. Prompts whose models are only loaded on other workers are left to them.
+        """
+        with self.lock:
+            last = self.last.get(worker, frozenset())
+            mine = self.resident.get(worker, {})
+            hits = sum(1 for k in keys if k in mine)
+            if hits == 0 and any(k in resident for w, resident in self.resident.items() if w != worker for k in keys):
+                return (-1, 0, 0)
+            return (1 if len(keys) > 0 and keys == last else 0, len(keys & last), hits)
+
+    def overdue(self, now: Optional[float] = None) -> list:
+        """
+        Ids of the prompts that were passed over at least max_delay seconds ago, longest waiting first.
+        The queue takes these first even if newer prompts have pushed them out of the lookahead window.
+        """
+        if now is None:
+            now = time.monotonic()
+        return [prompt_id for prompt_id, since in sorted(self.bypassed.items(), key=lambda x: x[1]) if now - since >= self.max_delay]
+
+    def discard(self, prompt_id: str):
+        """Stop tracking a prompt that was taken or deleted from the queue."""
+        self.bypassed.pop(prompt_id, None)
+
+    def pick(self, worker: Optional[str], candidates: Sequence[Any], now: Optional[float] = None) -> int:
+        """Index of the candidate (queue items in priority order) that worker should run next."""
+        if now is None:
+            now = time.monotonic()
+        best = None
+        for i, item in enumerate(candidates):
+            since = self.bypassed.get(item[1])
+            if since is not None and now - since >= self.max_delay:
+                best = i
+                break
+        if best is None:
+            best = 0
+            best_score = None
+            for i, item in enumerate(candidates):
+                s = self.score(worker, self.model_keys(item))
+                if best_score is None or s > best_score:
+                    best, best_score = i, s
+
+        for item in candidates[:best]:
+            self.bypassed.setdefault(item[1], now)
+        self.bypassed.pop(candidates[best][1], None)
+        if len(self.bypassed) > 65536:
+            # Prompts deleted from the queue while passed over.
+            self.bypassed = dict(list(self.bypassed.items())[-32768:])
+        return best
+
+
+# PromptServer view of the prompt worker running in this context, see WorkerServer.
+current_worker_server: contextvars.ContextVar = contextvars.ContextVar("current_worker_server", default=None)
+
+
+def get_worker_server(server):
+    worker_server = current_worker_server.get()
+    return worker_server if worker_server is not None else server
+
+
+class WorkerServer:
+    """
+    PromptServer as seen by one of several prompt workers. The state the executor keeps on the server
+    about the prompt it's running is kept per worker (and written through for code that reads it from
+    the shared server), everything else is the shared server.
+    """
+
+    LOCAL_ATTRIBUTES = ("client_id", "last_node_id", "last_prompt_id")
+
+    def __init__(self, server):
+        object.__setattr__(self, "_server", server)
+        for name in self.LOCAL_ATTRIBUTES:
+            object.__setattr__(self, name, getattr(server, name, None))
+
+    def __getattr__(self, name):
+        return getattr(self._server, name)
+
+    def __setattr__(self, name, value):
+        if name in self.LOCAL_ATTRIBUTES:
+            object.__setattr__(self, name, value)
+        setattr(self._server, name, value)
@@ -6,7 +6,6 @@ import torch
 import comfy.model_management
 import folder_paths
 import os
-import hashlib
 import node_helpers
 import logging
 from typing_extensions import override
@@ -316,10 +315,7 @@ class LoadAudio(IO.ComfyNode):
     @classmethod
     def fingerprint_inputs(cls, audio):
         image_path = folder_paths.get_annotated_filepath(audio)
-        m = hashlib.sha256()
-        with open(image_path, 'rb') as f:
-            m.update(f.read())
-        return m.digest().hex()
+        return folder_paths.get_file_hash(image_path)
 
     @classmethod
     def validate_inputs(cls, audio):
@@ -1,11 +1,14 @@
+import contextvars
 import copy
 import heapq
 import inspect
 import logging
+import os
 import sys
 import threading
 import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 from typing import List, Literal, NamedTuple, Optional, Union
 import asyncio
@@ -15,7 +18,9 @@ import torch
 
 from comfy.cli_args import args
 import comfy.memory_management
+import comfy.model_eviction
 import comfy.model_management
+import comfy.model_patcher
 import comfy_aimdo.model_vbar
 
 from latent_preview import set_preview_method
@@ -28,7 +33,9 @@ from comfy_execution.caching import (
     HierarchicalCache,
     LRUCache,
     RAMPressureCache,
+    ByteBudgetCache,
 )
+from comfy_execution.disk_cache import shared_disk_cache
 from comfy_execution.graph import (
     DynamicPrompt,
     ExecutionBlocker,
@@ -38,8 +45,12 @@ from comfy_execution.graph import (
 from comfy_execution.graph_utils import GraphBuilder, is_link
 from comfy_execution.validation import validate_node_input
 from comfy_execution.progress import get_progress_state, reset_progress_state, add_progress_handler, WebUIProgressHandler
-from comfy_execution.utils import CurrentNodeContext
+from comfy_execution.utils import CurrentNodeContext, current_node_executor, get_node_executor
 from comfy_execution.telemetry import ExecutionTelemetry
+from comfy_execution.queue_index import HistoryRing, IndexedQueue
+from comfy_execution.model_prefetch import ModelPrefetcher
+from comfy_execution.residency_graph import MODEL_RESIDENCY
+from comfy_execution.worker_pool import prompt_model_keys
 from comfy_api.internal import _ComfyNodeInternal, _NodeOutputInternal, first_real_override, is_class, make_locked_method_func
 from comfy_api.latest import io, _io
 
@@ -52,6 +63,14 @@ class ExecutionResult(Enum):
 class DuplicateNodeError(Exception):
     pass
 
+_is_changed_executor = None
+
+def get_is_changed_executor():
+    global _is_changed_executor
+    if _is_changed_executor is None:
+        _is_changed_executor = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1), thread_name_prefix="is-changed")
+    return _is_changed_executor
+
 class IsChangedCache:
     def __init__(self, prompt_id: str, dynprompt: DynamicPrompt, outputs_cache: BasicCache):
         self.prompt_id = prompt_id
@@ -59,6 +78,19 @@ class IsChangedCache:
         self.outputs_cache = outputs_cache
         self.is_changed = {}
 
+    async def prefetch(self, node_ids):
+        """Evaluate IS_CHANGED of all node_ids concurrently. Synchronous implementations run on a thread pool."""
+        missing = [node_id for node_id in node_ids if node_id not in self.is_changed and self.dynprompt.has_node(node_id)]
+        if len(missing) < 2:
+            return
+        token = current_node_executor.set(get_is_changed_executor())
+        try:
+            # get() records IS_CHANGED failures as NaN, which makes the node's key unhashable. Anything
+            # else it raises (an unknown node class, say) is raised again when the key is computed.
+            await asyncio.gather(*(self.get(node_id) for node_id in missing), return_exceptions=True)
+        finally:
+            current_node_executor.reset(token)
+
     async def get(self, node_id):
         if node_id in self.is_changed:
             return self.is_changed[node_id]
@@ -78,21 +110,16 @@ class IsChangedCache:
             self.is_changed[node_id] = False
             return self.is_changed[node_id]
 
-        if "is_changed" in node:
-            self.is_changed[node_id] = node["is_changed"]
-            return self.is_changed[node_id]
-
         # Intentionally do not use cached outputs here. We only want constants in IS_CHANGED
         input_data_all, _, v3_data = get_input_data(node["inputs"], class_def, node_id, None)
+        # The result is kept here rather than on the node: the prompt is the (shared, immutable) queue item.
         try:
             is_changed = await _async_map_node_over_list(self.prompt_id, node_id, class_def, input_data_all, is_changed_name, v3_data=v3_data)
             is_changed = await resolve_map_node_over_list_results(is_changed)
-            node["is_changed"] = [None if isinstance(x, ExecutionBlocker) else x for x in is_changed]
+            self.is_changed[node_id] = [None if isinstance(x, ExecutionBlocker) else x for x in is_changed]
         except Exception as e:
             logging.warning("WARNING: {}".format(e))
-            node["is_changed"] = float("NaN")
-        finally:
-            self.is_changed[node_id] = node["is_changed"]
+            self.is_changed[node_id] = float("NaN")
         return self.is_changed[node_id]
 
 
@@ -106,10 +133,17 @@ class CacheType(Enum):
     LRU = 1
     NONE = 2
     RAM_PRESSURE = 3
+    BYTES = 4
 
 
 class CacheSet:
     def __init__(self, cache_type=None, cache_args={}):
+        self.disk_cache = None
+        disk_size = (cache_args or {}).get("disk", 0)
+        if disk_size > 0 and cache_type != CacheType.NONE:
+            self.disk_cache = shared_disk_cache(cache_args["disk_directory"], int(disk_size * (1024 ** 3)), CacheEntry)
+            logging.info("Using disk cache tier ({} GB).".format(disk_size))
+
         if cache_type == CacheType.NONE:
             self.init_null_cache()
             logging.info("Disabling intermediate node cache.")
@@ -121,22 +155,37 @@ class CacheSet:
             cache_size = cache_args.get("lru", 0)
             self.init_lru_cache(cache_size)
             logging.info("Using LRU cache")
+        elif cache_type == CacheType.BYTES:
+            cache_gb = cache_args.get("bytes", 0)
+            self.init_byte_budget_cache(int(cache_gb * (1024 ** 3)))
+            logging.info("Using byte budgeted cache ({} GB).".format(cache_gb))
         else:
             self.init_classic_cache()
 
         self.all = [self.outputs, self.objects]
+        if self.disk_cache is not None:
+            self.disk_cache.register(self.outputs)
+
+    def persist(self):
+        """Write the outputs held in memory to the disk tier, if there is one."""
+        if self.disk_cache is not None:
+            self.outputs.persist()
 
     # Performs like the old cache -- dump data ASAP
     def init_classic_cache(self):
-        self.outputs = HierarchicalCache(CacheKeySetInputSignature)
+        self.outputs = HierarchicalCache(CacheKeySetInputSignature, disk_cache=self.disk_cache)
         self.objects = HierarchicalCache(CacheKeySetID)
 
     def init_lru_cache(self, cache_size):
-        self.outputs = LRUCache(CacheKeySetInputSignature, max_size=cache_size)
+        self.outputs = LRUCache(CacheKeySetInputSignature, max_size=cache_size, disk_cache=self.disk_cache)
+        self.objects = HierarchicalCache(CacheKeySetID)
+
+    def init_byte_budget_cache(self, max_bytes):
+        self.outputs = ByteBudgetCache(CacheKeySetInputSignature, max_bytes, disk_cache=self.disk_cache)
         self.objects = HierarchicalCache(CacheKeySetID)
 
     def init_ram_cache(self, min_headroom):
-        self.outputs = RAMPressureCache(CacheKeySetInputSignature)
+        self.outputs = RAMPressureCache(CacheKeySetInputSignature, disk_cache=self.disk_cache)
         self.objects = HierarchicalCache(CacheKeySetID)
 
     def init_null_cache(self):
@@ -184,14 +233,21 @@ def get_input_data(inputs, class_def, unique_id, execution_list=None, dynprompt=
         elif input_category is not None or (is_v3 and class_def.ACCEPT_ALL_INPUTS):
             input_data_all[x] = [input_data]
 
+    original_prompt = dynprompt.get_original_prompt() if dynprompt is not None else {}
+    extra_pnginfo = extra_data.get('extra_pnginfo', None)
+    prompt_batch = extra_data.get("prompt_batch", None)
+    if prompt_batch is not None and dynprompt is not None:
+        # Merged prompt (--batch-prompts): report the prompt this node was queued with.
+        original_prompt, extra_pnginfo = prompt_batch.get_prompt_info(dynprompt.get_real_node_id(unique_id), original_prompt, extra_pnginfo)
+
     if is_v3:
         if hidden is not None:
             if io.Hidden.prompt.name in hidden:
-                hidden_inputs_v3[io.Hidden.prompt] = dynprompt.get_original_prompt() if dynprompt is not None else {}
+                hidden_inputs_v3[io.Hidden.prompt] = original_prompt
             if io.Hidden.dynprompt.name in hidden:
                 hidden_inputs_v3[io.Hidden.dynprompt] = dynprompt
             if io.Hidden.extra_pnginfo.name in hidden:
-                hidden_inputs_v3[io.Hidden.extra_pnginfo] = extra_data.get('extra_pnginfo', None)
+                hidden_inputs_v3[io.Hidden.extra_pnginfo] = extra_pnginfo
             if io.Hidden.unique_id.name in hidden:
                 hidden_inputs_v3[io.Hidden.unique_id] = unique_id
             if io.Hidden.auth_token_comfy_org.name in hidden:
@@ -203,11 +259,11 @@ def get_input_data(inputs, class_def, unique_id, execution_list=None, dynprompt=
             h = valid_inputs["hidden"]
             for x in h:
                 if h[x] == "PROMPT":
-                    input_data_all[x] = [dynprompt.get_original_prompt() if dynprompt is not None else {}]
+                    input_data_all[x] = [original_prompt]
                 if h[x] == "DYNPROMPT":
                     input_data_all[x] = [dynprompt]
                 if h[x] == "EXTRA_PNGINFO":
-                    input_data_all[x] = [extra_data.get('extra_pnginfo', None)]
+                    input_data_all[x] = [extra_pnginfo]
                 if h[x] == "UNIQUE_ID":
                     input_data_all[x] = [unique_id]
                 if h[x] == "AUTH_TOKEN_COMFY_ORG":
@@ -259,8 +315,6 @@ async def _async_map_node_over_list(prompt_id, unique_id, obj, input_data_all, f
                 execution_block = execution_block_cb(v) if execution_block_cb else v
                 break
         if execution_block is None:
-            if pre_execute_cb is not None and index is not None:
-                pre_execute_cb(index)
             # V3
             if isinstance(obj, _ComfyNodeInternal) or (is_class(obj) and issubclass(obj, _ComfyNodeInternal)):
                 # if is just a class, then assign no state, just create clone
@@ -280,6 +334,9 @@ async def _async_map_node_over_list(prompt_id, unique_id, obj, input_data_all, f
             # V1
             else:
                 f = getattr(obj, func)
+            node_executor = get_node_executor() if not inspect.iscoroutinefunction(f) else None
+            if pre_execute_cb is not None and index is not None and node_executor is None:
+                pre_execute_cb(index)
             if inspect.iscoroutinefunction(f):
                 async def async_wrapper(f, prompt_id, unique_id, list_index, args):
                     with CurrentNodeContext(prompt_id, unique_id, list_index):
@@ -292,6 +349,16 @@ async def _async_map_node_over_list(prompt_id, unique_id, obj, input_data_all, f
                     results.append(result)
                 else:
                     results.append(task)
+            elif node_executor is not None:
+                # inference_mode and the GraphBuilder prefix are thread local, so set them up on the worker
+                def run_on_worker(f, prompt_id, unique_id, list_index, args):
+                    with torch.inference_mode(), CurrentNodeContext(prompt_id, unique_id, list_index):
+                        if pre_execute_cb is not None and list_index is not None:
+                            pre_execute_cb(list_index)
+                        return f(**args)
+                context = contextvars.copy_context()
+                result = await asyncio.get_running_loop().run_in_executor(node_executor, context.run, run_on_worker, f, prompt_id, unique_id, index, inputs)
+                results.append(result)
             else:
                 with CurrentNodeContext(prompt_id, unique_id, index):
                     result = f(**inputs)
@@ -412,6 +479,17 @@ def format_value(x):
     else:
         return str(x)
 
+def tag_loaded_models(inputs, output_data):
+    """Record the model files a loader node read on the ModelPatchers it returned, for the eviction policy."""
+    keys = prompt_model_keys({"": {"inputs": inputs}})
+    if len(keys) == 0:
+        return
+    for output in output_data:
+        for value in output:
+            patcher = value if isinstance(value, comfy.model_patcher.ModelPatcher) else getattr(value, "patcher", None)
+            if isinstance(patcher, comfy.model_patcher.ModelPatcher):
+                comfy.model_eviction.tag_model(patcher, keys)
+
 async def execute(server, dynprompt, caches, current_item, extra_data, executed, prompt_id, execution_list, pending_subgraph_results, pending_async_nodes, ui_outputs):
     unique_id = current_item
     real_node_id = dynprompt.get_real_node_id(unique_id)
@@ -593,6 +671,7 @@ async def execute(server, dynprompt, caches, current_item, extra_data, executed,
             pending_subgraph_results[unique_id] = cached_outputs
             return (ExecutionResult.PENDING, None, None)
 
+        tag_loaded_models(inputs, output_data)
         cache_entry = CacheEntry(ui=ui_outputs.get(unique_id), outputs=output_data)
         execution_list.cache_update(unique_id, cache_entry)
         caches.outputs.set(unique_id, cache_entry)
@@ -647,9 +726,17 @@ class PromptExecutor:
         self.cache_args = cache_args
         self.cache_type = cache_type
         self.server = server
+        # Optional scheduler that runs independent ready nodes concurrently (see comfy_execution/nova_scheduler.py)
+        self.node_dispatcher = None
+        # Reads the model files of upcoming loader nodes ahead of time (see comfy_execution/model_prefetch.py)
+        self.model_prefetcher = ModelPrefetcher(residency=MODEL_RESIDENCY, threads=max(1, args.model_read_threads)) if args.prefetch_models else None
+        self.caches = None
         self.reset()
 
     def reset(self):
+        if self.caches is not None:
+            # Outputs dropped with the old caches stay available from the disk tier.
+            self.caches.persist()
         self.caches = CacheSet(cache_type=self.cache_type, cache_args=self.cache_args)
         self.status_messages = []
         self.success = True
@@ -717,6 +804,8 @@ class PromptExecutor:
             reset_progress_state(prompt_id, dynamic_prompt)
             add_progress_handler(WebUIProgressHandler(self.server))
             is_changed_cache = IsChangedCache(prompt_id, dynamic_prompt, self.caches.outputs)
+            if self.cache_type != CacheType.NONE:
+                await is_changed_cache.prefetch(list(prompt.keys()))
             for cache in self.caches.all:
                 await cache.set_prompt(dynamic_prompt, prompt.keys(), is_changed_cache)
                 cache.clean_unused()
@@ -739,13 +828,13 @@ class PromptExecutor:
             for node_id in list(execute_outputs):
                 execution_list.add_node(node_id)
 
-            while not execution_list.is_empty():
-                node_id, error, ex = await execution_list.stage_node_execution()
-                if error is not None:
-                    self.handle_execution_error(prompt_id, dynamic_prompt.original_prompt, current_outputs, executed, error, ex)
-                    break
-
-                assert node_id is not None, "Node ID should not be None at this point"
+            async def execute_node(node_id):
+                if self.model_prefetcher is not None:
+                    if execution_list.has_pending_order():
+                        # Only finished nodes left the pending order since the plan was made
+                        self.model_prefetcher.node_started(dynamic_prompt, node_id)
+                    else:
+                        self.model_prefetcher.schedule(dynamic_prompt, [n for n in execution_list.get_pending_order() if n != node_id])
                 telemetry.emit("telemetry.node_start", {"prompt_id": prompt_id, "node_id": node_id})
                 node_start = time.perf_counter()
                 result, error, ex = await execute(self.server, dynamic_prompt, self.caches, node_id, extra_data, executed, prompt_id, execution_list, pending_subgraph_results, pending_async_nodes, ui_node_outputs)
@@ -755,18 +844,41 @@ class PromptExecutor:
                     "duration_ms": round((time.perf_counter() - node_start) * 1000.0, 3),
                     "result": result.name,
                 })
+                return result, error, ex
+
+            # Returns False when execution of the prompt has to stop.
+            def finish_node(node_id, result, error, ex):
                 self.success = result != ExecutionResult.FAILURE
                 if result == ExecutionResult.FAILURE:
                     self.handle_execution_error(prompt_id, dynamic_prompt.original_prompt, current_outputs, executed, error, ex)
-                    break
+                    return False
                 elif result == ExecutionResult.PENDING:
-                    execution_list.unstage_node_execution()
+                    execution_list.unstage_node_execution(node_id)
                 else: # result == ExecutionResult.SUCCESS:
-                    execution_list.complete_node_execution()
+                    execution_list.complete_node_execution(node_id)
                 self.caches.outputs.poll(ram_headroom=self.cache_args["ram"])
+                return True
+
+            if self.node_dispatcher is not None:
+                completed, error, ex = await self.node_dispatcher.run(dynamic_prompt, execution_list, execute_node, finish_node)
+                if error is not None:
+                    self.handle_execution_error(prompt_id, dynamic_prompt.original_prompt, current_outputs, executed, error, ex)
+                elif completed:
+                    self.add_message("execution_success", { "prompt_id": prompt_id }, broadcast=False)
             else:
-                # Only execute when the while-loop ends without break
-                self.add_message("execution_success", { "prompt_id": prompt_id }, broadcast=False)
+                while not execution_list.is_empty():
+                    node_id, error, ex = await execution_list.stage_node_execution()
+                    if error is not None:
+                        self.handle_execution_error(prompt_id, dynamic_prompt.original_prompt, current_outputs, executed, error, ex)
+                        break
+
+                    assert node_id is not None, "Node ID should not be None at this point"
+                    result, error, ex = await execute_node(node_id)
+                    if not finish_node(None, result, error, ex):
+                        break
+                else:
+                    # Only execute when the while-loop ends without break
+                    self.add_message("execution_success", { "prompt_id": prompt_id }, broadcast=False)
 
             ui_outputs = {}
             meta_outputs = {}
@@ -778,6 +890,8 @@ class PromptExecutor:
                 "meta": meta_outputs,
             }
             self.server.last_node_id = None
+            if self.model_prefetcher is not None:
+                self.model_prefetcher.cancel()
             if comfy.model_management.DISABLE_SMART_MEMORY:
                 comfy.model_management.unload_all_models()
 
@@ -1160,29 +1274,104 @@ class PromptQueue:
         self.mutex = threading.RLock()
         self.not_empty = threading.Condition(self.mutex)
         self.task_counter = 0
-        self.queue = []
+        self.queue = IndexedQueue()
         self.currently_running = {}
-        self.history = {}
+        self.history = HistoryRing(MAXIMUM_HISTORY_SIZE)
         self.flags = {}
+        # Multi-device workers (--worker-devices): flags are delivered to every worker and queued prompts
+        # are routed by the models each worker has loaded.
+        self.worker_flags = {}
+        # prompt_id -> worker running it, for interrupting only that worker
+        self.running_workers = {}
+        self.affinity = None
+        # app.prompt_store.store.PromptStore when the queue is persisted (--persistent-queue)
+        self.store = None
+        self._model_keys = (None, frozenset())
+
+    def attach_store(self, store):
+        """Load the queue and history saved by store and save every change to it from now on."""
+        pending, history = store.load()
+        with self.mutex:
+            for prompt_id, entry in history:
+                self.history.add(prompt_id, entry)
+            for item in pending:
+                self.queue.push(item)
+            self.store = store
+            if len(pending) > 0:
+                logging.info("Restored {} queued prompts.".format(len(pending)))
+                self.server.queue_updated()
+                self.not_empty.notify_all()
+        return pending
 
     def put(self, item):
         with self.mutex:
-            heapq.heappush(self.queue, item)
+            self.queue.push(item)
+            if self.store is not None:
+                self.store.put(item)
             self.server.queue_updated()
             self.not_empty.notify()
 
-    def get(self, timeout=None):
+    def register_worker(self, worker, affinity=None):
+        with self.mutex:
+            self.worker_flags[worker] = {}
+            if affinity is not None:
+                self.affinity = affinity
+
+    def _pop(self, worker=None):
+        if self.affinity is None or len(self.queue) == 1:
+            return self.queue.pop()
+        for prompt_id in self.affinity.overdue():
+            item = self.queue.get(prompt_id)
+            self.affinity.discard(prompt_id)
+            if item is not None:
+                self.queue.remove(prompt_id)
+                return item
+        candidates = self.queue.smallest(self.affinity.lookahead)
+        picked = candidates[self.affinity.pick(worker, candidates)]
+        self.queue.remove(picked[1])
+        return picked
+
+    def _start(self, item, worker=None):
+        # Queue items are immutable so the running copy is the item itself.
+        i = self.task_counter
+        self.currently_running[i] = item
+        if worker is not None:
+            self.running_workers[item[1]] = worker
+        self.task_counter += 1
+        if self.store is not None:
+            self.store.started(item[1])
+        return (item, i)
+
+    def get(self, timeout=None, worker=None):
+        with self.not_empty:
+            while len(self.queue) == 0:
+                self.not_empty.wait(timeout=timeout)
+                if timeout is not None and len(self.queue) == 0:
+                    return None
+            out = self._start(self._pop(worker), worker)
+            self.server.queue_updated()
+            return out
+
+    def get_batch(self, timeout=None, max_items=1, batch_key=None, worker=None):
+        """
+        Like get(), but also pops up to max_items - 1 queued items for which batch_key returns the same
+        (not None) key as the first one. Returns a list of (item, item_id) or None on timeout.
+        """
         with self.not_empty:
             while len(self.queue) == 0:
                 self.not_empty.wait(timeout=timeout)
                 if timeout is not None and len(self.queue) == 0:
                     return None
-            item = heapq.heappop(self.queue)
-            i = self.task_counter
-            self.currently_running[i] = copy.deepcopy(item)
-            self.task_counter += 1
+            items = [self._pop(worker)]
+            key = batch_key(items[0]) if batch_key is not None and max_items > 1 else None
+            if key is not None:
+                matches = [x for x in self.queue.items() if batch_key(x) == key]
+                for match in heapq.nsmallest(max_items - 1, matches, key=lambda x: x[0]):
+                    self.queue.remove(match[1])
+                    items.append(match)
+            out = [self._start(item, worker) for item in items]
             self.server.queue_updated()
-            return (item, i)
+            return out
 
     class ExecutionStatus(NamedTuple):
         status_str: Literal['success', 'error']
@@ -1193,8 +1382,7 @@ class PromptQueue:
                   status: Optional['PromptQueue.ExecutionStatus'], process_item=None):
         with self.mutex:
             prompt = self.currently_running.pop(item_id)
-            if len(self.history) > MAXIMUM_HISTORY_SIZE:
-                self.history.pop(next(iter(self.history)))
+            self.running_workers.pop(prompt[1], None)
 
             status_dict: Optional[dict] = None
             if status is not None:
@@ -1203,68 +1391,97 @@ class PromptQueue:
             if process_item is not None:
                 prompt = process_item(prompt)
 
-            self.history[prompt[1]] = {
+            entry = {
                 "prompt": prompt,
                 "outputs": {},
                 'status': status_dict,
             }
-            self.history[prompt[1]].update(history_result)
+            entry.update(history_result)
+            self.history.add(prompt[1], entry)
+            if self.store is not None:
+                self.store.finished(prompt[1], entry)
             self.server.queue_updated()
 
-    # Note: slow
+    def get_running_worker(self, prompt_id):
+        """The worker running prompt_id (--worker-devices), None with a single worker or if it isn't running."""
+        with self.mutex:
+            return self.running_workers.get(prompt_id)
+
     def get_current_queue(self):
         with self.mutex:
-            out = []
-            for x in self.currently_running.values():
-                out += [x]
-            return (out, copy.deepcopy(self.queue))
+            return (list(self.currently_running.values()), list(self.queue.items()))
 
     # read-safe as long as queue items are immutable
     def get_current_queue_volatile(self):
         with self.mutex:
             running = [x for x in self.currently_running.values()]
-            queued = copy.copy(self.queue)
+            queued = self.queue.items()
             return (running, queued)
 
+    def queued_model_keys(self) -> frozenset:
+        """The model files referenced by the queued prompts (see worker_pool.prompt_model_keys)."""
+        with self.mutex:
+            items = self.queue.items()
+            if self._model_keys[0] is not items:
+                keys = frozenset()
+                for item in items:
+                    keys |= prompt_model_keys(item[2])
+                self._model_keys = (items, keys)
+            return self._model_keys[1]
+
     def get_tasks_remaining(self):
         with self.mutex:
             return len(self.queue) + len(self.currently_running)
 
     def wipe_queue(self):
         with self.mutex:
-            self.queue = []
+            self.queue.clear()
+            if self.store is not None:
+                self.store.clear_queue()
             self.server.queue_updated()
 
     def delete_queue_item(self, function):
         with self.mutex:
-            for x in range(len(self.queue)):
-                if function(self.queue[x]):
-                    if len(self.queue) == 1:
-                        self.wipe_queue()
-                    else:
-                        self.queue.pop(x)
-                        heapq.heapify(self.queue)
-                    self.server.queue_updated()
-                    return True
+            item = self.queue.find(function)
+            if item is not None:
+                return self.delete_queue_item_by_id(item[1])
+        return False
+
+    def delete_queue_item_by_id(self, prompt_id):
+        with self.mutex:
+            if self.queue.remove(prompt_id):
+                if self.store is not None:
+                    self.store.delete(prompt_id)
+                self.server.queue_updated()
+                return True
+        return False
+
+    def set_priority(self, prompt_id, number):
+        """Move a queued prompt by changing its number (lower runs first)."""
+        with self.mutex:
+            if self.queue.set_priority(prompt_id, number):
+                if self.store is not None:
+                    self.store.put(self.queue.get(prompt_id))
+                self.server.queue_updated()
+                return True
         return False
 
-    def get_history(self, prompt_id=None, max_items=None, offset=-1, map_function=None):
+    def get_history(self, prompt_id=None, max_items=None, offset=-1, map_function=None, status=None, workflow_id=None):
         with self.mutex:
             if prompt_id is None:
-                out = {}
-                i = 0
+                ids = None
+                if workflow_id is not None:
+                    ids = self.history.ids_with_workflow(workflow_id)
+                if status is not None:
+                    status_ids = self.history.ids_with_status(status)
+                    ids = status_ids if ids is None else [k for k in ids if k in status_ids]
+                total = len(self.history) if ids is None else len(ids)
                 if offset < 0 and max_items is not None:
-                    offset = len(self.history) - max_items
-                for k in self.history:
-                    if i >= offset:
-                        p = self.history[k]
-                        if map_function is not None:
-                            p = map_function(p)
-                        out[k] = p
-                        if max_items is not None and len(out) >= max_items:
-                            break
-                    i += 1
-                return out
+                    offset = total - max_items
+                out = self.history.slice(offset, max_items, ids)
+                if map_function is not None:
+                    out = {k: map_function(v) for k, v in out.items()}
+                return dict(out)
             elif prompt_id in self.history:
                 p = self.history[prompt_id]
                 if map_function is None:
@@ -1277,19 +1494,31 @@ class PromptQueue:
 
     def wipe_history(self):
         with self.mutex:
-            self.history = {}
+            self.history.clear()
+            if self.store is not None:
+                self.store.clear_history()
 
     def delete_history_item(self, id_to_delete):
         with self.mutex:
             self.history.pop(id_to_delete, None)
+            if self.store is not None:
+                self.store.delete_history(id_to_delete)
 
     def set_flag(self, name, data):
         with self.mutex:
             self.flags[name] = data
-            self.not_empty.notify()
+            for flags in self.worker_flags.values():
+                flags[name] = data
+            self.not_empty.notify_all()
 
-    def get_flags(self, reset=True):
+    def get_flags(self, reset=True, worker=None):
         with self.mutex:
+            if worker is not None and worker in self.worker_flags:
+                ret = self.worker_flags[worker]
+                if reset:
+                    self.worker_flags[worker] = {}
+                    return ret
+                return ret.copy()
             if reset:
                 ret = self.flags
                 self.flags = {}
@@ -2,6 +2,8 @@ from __future__ import annotations
 
 import os
 import time
+import hashlib
+import threading
 import mimetypes
 import logging
 from typing import Literal, List
@@ -268,6 +270,38 @@ def get_annotated_filepath(name: str, default_dir: str | None=None) -> str:
     return os.path.join(base_dir, name)
 
 
+_file_hash_cache: dict[str, tuple[int, int, str]] = {}
+_file_hash_lock = threading.Lock()
+MAX_FILE_HASH_CACHE = 16384
+
+
+def get_file_hash(path: str) -> str:
+    """
+    SHA-256 hex digest of the contents of a file. Digests are remembered by (path, size, mtime_ns),
+    so a file that hasn't changed is only read once.
+    """
+    key = os.path.abspath(path)
+    st = os.stat(key)
+    with _file_hash_lock:
+        cached = _file_hash_cache.get(key)
+    if cached is not None and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+        return cached[2]
+
+    m = hashlib.sha256()
+    with open(key, 'rb') as f:
+        for chunk in iter(lambda: f.read(4 * 1024 * 1024), b""):
+            m.update(chunk)
+    digest = m.hexdigest()
+
+    after = os.stat(key)
+    if after.st_size == st.st_size and after.st_mtime_ns == st.st_mtime_ns:
+        with _file_hash_lock:
+            if len(_file_hash_cache) >= MAX_FILE_HASH_CACHE:
+                _file_hash_cache.pop(next(iter(_file_hash_cache)))
+            _file_hash_cache[key] = (st.st_size, st.st_mtime_ns, digest)
+    return digest
+
+
 def exists_annotated_filepath(name) -> bool:
     name, base_dir = annotated_filepath(name)
 
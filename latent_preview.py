@@ -13,7 +13,7 @@ default_preview_method = args.preview_method
 MAX_PREVIEW_RESOLUTION = args.preview_size
 VIDEO_TAES = ["taehv", "lighttaew2_2", "lighttaew2_1", "lighttaehy1_5", "taeltx_2"]
 
-def preview_to_image(latent_image, do_scale=True):
+def preview_to_ubyte(latent_image, do_scale=True):
         if do_scale:
             latents_ubyte = (((latent_image + 1.0) / 2.0).clamp(0, 1)  # change scale from -1..1 to 0..1
                                 .mul(0xFF)  # to 0..255
@@ -22,32 +22,87 @@ def preview_to_image(latent_image, do_scale=True):
             latents_ubyte = (latent_image.clamp(0, 1)
                                 .mul(0xFF)  # to 0..255
                                 )
-        if comfy.model_management.directml_enabled:
-                latents_ubyte = latents_ubyte.to(dtype=torch.uint8)
-        latents_ubyte = latents_ubyte.to(device="cpu", dtype=torch.uint8, non_blocking=comfy.model_management.device_supports_non_blocking(latent_image.device))
+        return latents_ubyte.to(dtype=torch.uint8)
 
-        return Image.fromarray(latents_ubyte.numpy())
+def preview_to_image(latent_image, do_scale=True):
+        latents_ubyte = preview_to_ubyte(latent_image, do_scale=do_scale)
+        return Image.fromarray(latents_ubyte.to(device="cpu").numpy())
+
+class PreviewReadback:
+    """
+    Copies preview frames to the CPU without making the sampler wait for them. Each frame is copied
+    with a non blocking copy into one of two reused pinned buffers, and the previous frame is turned
+    into an image if its copy is done by then. Frames whose copy isn't done are dropped.
+    """
+    def __init__(self):
+        self.buffers = [None, None]
+        self.index = 0
+        self.pending = None
+
+    def read(self, latents_ubyte, wait=False):
+        device = latents_ubyte.device
+        if not comfy.model_management.is_device_cuda(device) or not comfy.model_management.device_supports_non_blocking(device):
+            return Image.fromarray(latents_ubyte.to(device="cpu").numpy())
+
+        buffer = self.buffers[self.index]
+        if buffer is None or buffer.numel() < latents_ubyte.numel():
+            buffer = torch.empty((latents_ubyte.numel(),), dtype=torch.uint8, pin_memory=True)
+            self.buffers[self.index] = buffer
+        self.index = (self.index + 1) % len(self.buffers)
+        frame = buffer[:latents_ubyte.numel()].view(latents_ubyte.shape)
+        frame.copy_(latents_ubyte, non_blocking=True)
+        event = torch.cuda.Event()
+        event.record(torch.cuda.current_stream(device))
+
+        previous = self.pending
+        self.pending = (frame, event)
+        if wait:
+            event.synchronize()
+            self.pending = None
+            return Image.fromarray(frame.numpy().copy())
+        if previous is not None and previous[1].query():
+            return Image.fromarray(previous[0].numpy().copy())
+        return None
 
 class LatentPreviewer:
+    readback = None
+
     def decode_latent_to_preview(self, x0):
-        pass
+        return Image.fromarray(self.decode_latent_to_ubyte(x0).to(device="cpu").numpy())
 
     def decode_latent_to_preview_image(self, preview_format, x0):
         preview_image = self.decode_latent_to_preview(x0)
         return ("JPEG", preview_image, MAX_PREVIEW_RESOLUTION)
 
+    def decode_latent_to_preview_image_async(self, preview_format, x0, last=False):
+        """
+        Like decode_latent_to_preview_image but doesn't wait for the GPU for previewers that implement
+        decode_latent_to_ubyte: returns an earlier frame that is ready, or None. The last frame is
+        waited for.
+        """
+        cls = type(self)
+        overridden = cls.decode_latent_to_preview_image is not LatentPreviewer.decode_latent_to_preview_image or cls.decode_latent_to_preview is not LatentPreviewer.decode_latent_to_preview
+        if overridden or not hasattr(self, "decode_latent_to_ubyte"):
+            return self.decode_latent_to_preview_image(preview_format, x0)
+        if self.readback is None:
+            self.readback = PreviewReadback()
+        preview_image = self.readback.read(self.decode_latent_to_ubyte(x0), wait=last)
+        if preview_image is None:
+            return None
+        return ("JPEG", preview_image, MAX_PREVIEW_RESOLUTION)
+
 class TAESDPreviewerImpl(LatentPreviewer):
     def __init__(self, taesd):
         self.taesd = taesd
 
-    def decode_latent_to_preview(self, x0):
+    def decode_latent_to_ubyte(self, x0):
         x_sample = self.taesd.decode(x0[:1])[0].movedim(0, 2)
-        return preview_to_image(x_sample)
+        return preview_to_ubyte(x_sample)
 
 class TAEHVPreviewerImpl(TAESDPreviewerImpl):
-    def decode_latent_to_preview(self, x0):
+    def decode_latent_to_ubyte(self, x0):
         x_sample = self.taesd.decode(x0[:1, :, :1])[0][0]
-        return preview_to_image(x_sample, do_scale=False)
+        return preview_to_ubyte(x_sample, do_scale=False)
 
 class Latent2RGBPreviewer(LatentPreviewer):
     def __init__(self, latent_rgb_factors, latent_rgb_factors_bias=None, latent_rgb_factors_reshape=None):
@@ -57,7 +112,7 @@ class Latent2RGBPreviewer(LatentPreviewer):
             self.latent_rgb_factors_bias = torch.tensor(latent_rgb_factors_bias, device="cpu")
         self.latent_rgb_factors_reshape = latent_rgb_factors_reshape
 
-    def decode_latent_to_preview(self, x0):
+    def decode_latent_to_ubyte(self, x0):
         if self.latent_rgb_factors_reshape is not None:
             x0 = self.latent_rgb_factors_reshape(x0)
         self.latent_rgb_factors = self.latent_rgb_factors.to(dtype=x0.dtype, device=x0.device)
@@ -72,7 +127,7 @@ class Latent2RGBPreviewer(LatentPreviewer):
         latent_image = torch.nn.functional.linear(x0.movedim(0, -1), self.latent_rgb_factors, bias=self.latent_rgb_factors_bias)
         # latent_image = x0[0].permute(1, 2, 0) @ self.latent_rgb_factors
 
-        return preview_to_image(latent_image)
+        return preview_to_ubyte(latent_image)
 
 
 def get_previewer(device, latent_format):
@@ -123,7 +178,7 @@ def prepare_callback(model, steps, x0_output_dict=None):
 
         preview_bytes = None
         if previewer:
-            preview_bytes = previewer.decode_latent_to_preview_image(preview_format, x0)
+            preview_bytes = previewer.decode_latent_to_preview_image_async(preview_format, x0, last=step + 1 >= total_steps)
         pbar.update_absolute(step + 1, total_steps, preview_bytes)
     return callback
 
@@ -2,6 +2,7 @@ import comfy.options
 comfy.options.enable_args_parsing()
 
 import os
+import atexit
 import importlib.util
 import folder_paths
 import time
@@ -9,10 +10,11 @@ from comfy.cli_args import args, enables_dynamic_vram
 from app.logger import setup_logger
 from app.assets.scanner import seed_assets
 import itertools
+import signal
 import utils.extra_config
 import logging
 import sys
-from comfy_execution.progress import get_progress_state
+from comfy_execution.progress import get_progress_state, use_worker_progress_registry
 from comfy_execution.utils import get_executing_context
 from comfy_api import feature_flags
 
@@ -179,9 +181,12 @@ import comfy.utils
 import execution
 from comfy_execution.telemetry import ExecutionTelemetry
 from comfy_execution.nova_scheduler import NovaPromptExecutor
+from comfy_execution import prompt_batching, worker_pool
 import server
 from protocol import BinaryEventTypes
 import nodes
+import comfy.model_eviction
+import comfy.offload_compression
 import comfy.model_management
 import comfyui_version
 import app.logger
@@ -229,20 +234,36 @@ def cuda_malloc_warning():
             logging.warning("\nWARNING: this card most likely does not support cuda-malloc, if you get \"CUDA error\" please run ComfyUI with: --disable-cuda-malloc\n")
 
 
-def prompt_worker(q, server_instance):
+def prompt_worker(q, server_instance, device=None, worker=None):
     current_time: float = 0.0
+    if device is not None:
+        # One of several workers, each running prompts on its own device (--worker-devices).
+        comfy.model_management.set_torch_device_override(device)
+        comfy.model_management.set_interrupt_worker(worker)
+        server_instance = worker_pool.WorkerServer(server_instance)
+        worker_pool.current_worker_server.set(server_instance)
+        use_worker_progress_registry()
+
     cache_type = execution.CacheType.CLASSIC
     if args.cache_lru > 0:
         cache_type = execution.CacheType.LRU
     elif args.cache_ram > 0:
         cache_type = execution.CacheType.RAM_PRESSURE
+    elif args.cache_bytes > 0:
+        cache_type = execution.CacheType.BYTES
     elif args.cache_none:
         cache_type = execution.CacheType.NONE
 
+    cache_disk_directory = args.cache_disk_directory
+    if cache_disk_directory is None:
+        cache_disk_directory = os.path.join(folder_paths.get_user_directory(), "node_output_cache")
+
     executor_cls = NovaPromptExecutor if args.executor == "nova" else execution.PromptExecutor
-    e = executor_cls(server_instance, cache_type=cache_type, cache_args={ "lru" : args.cache_lru, "ram" : args.cache_ram } )
-    e = execution.PromptExecutor(server_instance, cache_type=cache_type, cache_args={ "lru" : args.cache_lru, "ram" : args.cache_ram } )
+    e = executor_cls(server_instance, cache_type=cache_type, cache_args={ "lru" : args.cache_lru, "ram" : args.cache_ram, "bytes" : args.cache_bytes, "disk" : args.cache_disk, "disk_directory" : cache_disk_directory } )
     telemetry = ExecutionTelemetry(server_instance)
+    batch_prompts = min(args.batch_prompts, prompt_batching.MAX_PROMPT_BATCH)
+    if batch_prompts > 1:
+        prompt_batching.register_batched_nodes()
     last_gc_collect = 0
     need_gc = False
     gc_collect_interval = 10.0
@@ -252,9 +273,13 @@ def prompt_worker(q, server_instance):
         if need_gc:
             timeout = max(gc_collect_interval - (current_time - last_gc_collect), 0.0)
 
-        queue_item = q.get(timeout=timeout)
-        if queue_item is not None:
-            item, item_id = queue_item
+        if batch_prompts > 1:
+            queue_batch = q.get_batch(timeout=timeout, max_items=batch_prompts, batch_key=prompt_batching.batch_signature, worker=worker)
+        else:
+            queue_item = q.get(timeout=timeout, worker=worker)
+            queue_batch = [queue_item] if queue_item is not None else None
+        if queue_batch is not None:
+            item, item_id = queue_batch[0]
             execution_start_time = time.perf_counter()
             prompt_id = item[1]
             server_instance.last_prompt_id = prompt_id
@@ -265,25 +290,52 @@ def prompt_worker(q, server_instance):
             for k in sensitive:
                 extra_data[k] = sensitive[k]
 
+            prompt, execute_outputs = item[2], item[4]
+            batch = None
+            if len(queue_batch) > 1:
+                batch = prompt_batching.PromptBatch([x for x, _ in queue_batch])
+                prompt, execute_outputs = batch.prompt, batch.execute_outputs
+                extra_data["prompt_batch"] = batch
+                logging.info("Executing {} queued prompts as one batch.".format(len(queue_batch)))
+
             with telemetry.track_duration(
                 "telemetry.prompt_compute_start",
                 "telemetry.prompt_compute_end",
                 {"prompt_id": prompt_id},
             ):
-                e.execute(item[2], prompt_id, extra_data, item[4])
+                if batch is None:
+                    e.execute(prompt, prompt_id, extra_data, execute_outputs)
+                else:
+                    # Every queued prompt of the batch gets the messages about its own nodes
+                    e.server = prompt_batching.BatchServer(server_instance, batch)
+                    token = worker_pool.current_worker_server.set(e.server)
+                    try:
+                        e.execute(prompt, prompt_id, extra_data, execute_outputs)
+                    finally:
+                        worker_pool.current_worker_server.reset(token)
+                        e.server = server_instance
             need_gc = True
+            if q.affinity is not None:
+                q.affinity.record(worker, item[2])
 
             remove_sensitive = lambda prompt: prompt[:5] + prompt[6:]
-            q.task_done(item_id,
-                        e.history_result,
-                        status=execution.PromptQueue.ExecutionStatus(
-                            status_str='success' if e.success else 'error',
-                            completed=e.success,
-                            messages=e.status_messages), process_item=remove_sensitive)
-            if server_instance.client_id is not None:
-                server_instance.send_sync("executing", {"node": None, "prompt_id": prompt_id}, server_instance.client_id)
-            if hasattr(server_instance, "nova_prompt_plans"):
-                server_instance.nova_prompt_plans.pop(prompt_id, None)
+            for index, (batch_item, batch_item_id) in enumerate(queue_batch):
+                if batch is None:
+                    history_result, messages, success = e.history_result, e.status_messages, e.success
+                else:
+                    history_result = batch.split_history(e.history_result, index)
+                    messages = batch.item_messages(e.status_messages, index)
+                    success = not any(event in ("execution_error", "execution_interrupted") for event, _ in messages)
+                status = execution.PromptQueue.ExecutionStatus(
+                    status_str='success' if success else 'error',
+                    completed=success,
+                    messages=messages)
+                q.task_done(batch_item_id, history_result, status=status, process_item=remove_sensitive)
+                client_id = batch_item[3].get("client_id", None)
+                if client_id is not None:
+                    server_instance.send_sync("executing", {"node": None, "prompt_id": batch_item[1]}, client_id)
+                if hasattr(server_instance, "nova_prompt_plans"):
+                    server_instance.nova_prompt_plans.pop(batch_item[1], None)
 
             current_time = time.perf_counter()
             execution_time = current_time - execution_start_time
@@ -295,11 +347,13 @@ def prompt_worker(q, server_instance):
             else:
                 logging.info("Prompt executed in {:.2f} seconds".format(execution_time))
 
-        flags = q.get_flags()
+        flags = q.get_flags(worker=worker)
         free_memory = flags.get("free_memory", False)
 
         if flags.get("unload_models", free_memory):
             comfy.model_management.unload_all_models()
+            if q.affinity is not None:
+                q.affinity.forget(worker)
             need_gc = True
             last_gc_collect = 0
 
@@ -327,7 +381,10 @@ async def run(server_instance, address='', port=8188, verbose=True, call_on_star
     )
 
 def hijack_progress(server_instance):
+    shared_server = server_instance
+
     def hook(value, total, preview_image, prompt_id=None, node_id=None):
+        server_instance = worker_pool.get_worker_server(shared_server)
         executing_context = get_executing_context()
         if prompt_id is None and executing_context is not None:
             prompt_id = executing_context.prompt_id
@@ -439,6 +496,24 @@ def setup_database():
         logging.error(f"Failed to initialize database. Please ensure you have installed the latest requirements. If the error persists, please report this as in future the database will be required: {e}")
 
 
+def setup_prompt_store(prompt_server):
+    try:
+        from app.database.db import can_create_session, create_prompt_store_session
+        if not can_create_session():
+            logging.warning("--persistent-queue needs the database, the prompt queue will not be saved.")
+            return
+        from app.prompt_store.store import PromptStore
+        store = PromptStore(create_prompt_store_session, execution.MAXIMUM_HISTORY_SIZE)
+        pending = prompt_server.prompt_queue.attach_store(store)
+        # Save the changes still waiting to be written however the process exits.
+        atexit.register(store.close)
+        if len(pending) > 0:
+            # New prompts are queued after the restored ones.
+            prompt_server.number = max(prompt_server.number, int(max(abs(x[0]) for x in pending)) + 1)
+    except Exception as e:
+        logging.error(f"Failed to restore the prompt queue from the database: {e}")
+
+
 def start_comfyui(asyncio_loop=None):
     """
     Starts the ComfyUI server using the provided asyncio event loop or creates a new one.
@@ -474,16 +549,35 @@ def start_comfyui(asyncio_loop=None):
 
     cuda_malloc_warning()
     setup_database()
+    if args.persistent_queue:
+        setup_prompt_store(prompt_server)
 
     prompt_server.add_routes()
     hijack_progress(prompt_server)
 
-    threading.Thread(target=prompt_worker, daemon=True, args=(prompt_server.prompt_queue, prompt_server,)).start()
+    if isinstance(comfy.model_management.eviction_policy, comfy.model_eviction.CostEvictionPolicy):
+        comfy.model_management.eviction_policy.queued_model_keys = prompt_server.prompt_queue.queued_model_keys
+
+    worker_devices = worker_pool.parse_worker_devices(args.worker_devices)
+    affinity = None
+    if args.queue_affinity_window > 0 or len(worker_devices) > 1:
+        affinity = worker_pool.DeviceAffinity(lookahead=args.queue_affinity_window or worker_pool.AFFINITY_LOOKAHEAD, max_delay=args.queue_affinity_max_delay)
+    if len(worker_devices) > 1:
+        for i, device in enumerate(worker_devices):
+            worker = "{}:{}".format(i, device)
+            prompt_server.prompt_queue.register_worker(worker, affinity)
+            threading.Thread(target=prompt_worker, daemon=True, args=(prompt_server.prompt_queue, prompt_server, device, worker)).start()
+        logging.info("Started {} prompt workers on devices: {}".format(len(worker_devices), ", ".join(str(d) for d in worker_devices)))
+    else:
+        prompt_server.prompt_queue.affinity = affinity
+        threading.Thread(target=prompt_worker, daemon=True, args=(prompt_server.prompt_queue, prompt_server,)).start()
 
     if args.quick_test_for_ci:
         exit(0)
 
     os.makedirs(folder_paths.get_temp_directory(), exist_ok=True)
+    if args.offload_compression is not None:
+        comfy.offload_compression.spill_directory = os.path.join(folder_paths.get_temp_directory(), "offload")
     call_on_start = None
     if args.auto_launch:
         def startup_server(scheme, address, port):
@@ -512,6 +606,9 @@ if __name__ == "__main__":
         logging.warning("WARNING: You are using a python version older than 3.10, please upgrade to a newer one. 3.12 and above is recommended.")
 
     event_loop, _, start_all_func = start_comfyui()
+    if server.PromptServer.instance.prompt_queue.store is not None:
+        # Exit normally on SIGTERM so the prompt queue changes not written yet are saved.
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     try:
         x = start_all_func()
         app.logger.print_startup_warnings()
@@ -6,7 +6,6 @@ import os
 import sys
 import json
 import glob
-import hashlib
 import inspect
 import traceback
 import math
@@ -50,8 +49,8 @@ if args.enable_manager:
 def before_node_execution():
     comfy.model_management.throw_exception_if_processing_interrupted()
 
-def interrupt_processing(value=True):
-    comfy.model_management.interrupt_current_processing(value)
+def interrupt_processing(value=True, worker=None):
+    comfy.model_management.interrupt_current_processing(value, worker=worker)
 
 MAX_RESOLUTION=16384
 
@@ -553,10 +552,7 @@ class LoadLatent:
     @classmethod
     def IS_CHANGED(s, latent):
         image_path = folder_paths.get_annotated_filepath(latent)
-        m = hashlib.sha256()
-        with open(image_path, 'rb') as f:
-            m.update(f.read())
-        return m.digest().hex()
+        return folder_paths.get_file_hash(image_path)
 
     @classmethod
     def VALIDATE_INPUTS(s, latent):
@@ -1761,10 +1757,7 @@ class LoadImage:
     @classmethod
     def IS_CHANGED(s, image):
         image_path = folder_paths.get_annotated_filepath(image)
-        m = hashlib.sha256()
-        with open(image_path, 'rb') as f:
-            m.update(f.read())
-        return m.digest().hex()
+        return folder_paths.get_file_hash(image_path)
 
     @classmethod
     def VALIDATE_INPUTS(s, image):
@@ -1812,10 +1805,7 @@ class LoadImageMask:
     @classmethod
     def IS_CHANGED(s, image, channel):
         image_path = folder_paths.get_annotated_filepath(image)
-        m = hashlib.sha256()
-        with open(image_path, 'rb') as f:
-            m.update(f.read())
-        return m.digest().hex()
+        return folder_paths.get_file_hash(image_path)
 
     @classmethod
     def VALIDATE_INPUTS(s, image):
@@ -3,6 +3,7 @@ import sys
 import asyncio
 import traceback
 import time
+import math
 
 import nodes
 import folder_paths
@@ -16,7 +17,7 @@ import struct
 import ssl
 import socket
 import ipaddress
-from PIL import Image, ImageOps
+from PIL import Image
 from PIL.PngImagePlugin import PngInfo
 from io import BytesIO
 
@@ -38,12 +39,16 @@ from app.assets.api.routes import register_assets_system
 
 from app.user_manager import UserManager
 from app.model_manager import ModelFileManager
+from app.object_info_cache import ObjectInfoCache, etag_matches, preferred_encoding
+from app.websocket_outbox import WebSocketFanout, coalesce_key
+from app.preview_encoder import PreviewEncoder, preview_settings
 from app.custom_node_manager import CustomNodeManager
 from app.subgraph_manager import SubgraphManager
 from typing import Optional, Union
 from api_server.routes.internal.internal_routes import InternalRoutes
 from protocol import BinaryEventTypes
 from comfy_execution.profile_policy import detect_profile, auto_optimize_hint
+from comfy_execution.residency_graph import prometheus_gauges
 
 # Import cache control middleware
 from middleware.cache_middleware import cache_control
@@ -57,12 +62,6 @@ def _remove_sensitive_from_queue(queue: list) -> list:
     return [item[:5] for item in queue]
 
 
-async def send_socket_catch_exception(function, message):
-    try:
-        await function(message)
-    except (aiohttp.ClientError, aiohttp.ClientPayloadError, ConnectionResetError, BrokenPipeError, ConnectionError) as err:
-        logging.warning("send error: {}".format(err))
-
 # Track deprecated paths that have been warned about to only warn once per file
 _deprecated_paths_warned = set()
 
@@ -93,6 +92,8 @@ async def compress_body(request: web.Request, handler):
         return response
     if response.content_type not in ["application/json", "text/plain"]:
         return response
+    if "Content-Encoding" in response.headers: # already compressed
+        return response
     if response.body and "gzip" in accept_encoding:
         response.enable_compression()
     return response
@@ -232,6 +233,8 @@ class PromptServer():
         self.app = web.Application(client_max_size=max_upload_size, middlewares=middlewares)
         self.sockets = dict()
         self.sockets_metadata = dict()
+        self.fanout = WebSocketFanout()
+        self.preview_encoder = PreviewEncoder()
         self.web_root = (
             FrontendManager.init_frontend(args.front_end_version)
             if args.front_end_root is None
@@ -260,6 +263,7 @@ class PromptServer():
 
             # Store WebSocket for backward compatibility
             self.sockets[sid] = ws
+            self.fanout.add(sid, ws)
             # Store metadata separately
             self.sockets_metadata[sid] = {"feature_flags": {}}
 
@@ -295,6 +299,9 @@ class PromptServer():
                                 logging.debug(
                                     f"Feature flags negotiated for client {sid}: {client_flags}"
                                 )
+                            elif data.get("type") == "progress_resync":
+                                # The next progress_state message is a full snapshot
+                                self.sockets_metadata[sid]["progress_resync"] = True
                             first_message = False
                         except json.JSONDecodeError:
                             logging.warning(
@@ -303,8 +310,10 @@ class PromptServer():
                         except Exception as e:
                             logging.error(f"Error processing WebSocket message: {e}")
             finally:
-                self.sockets.pop(sid, None)
-                self.sockets_metadata.pop(sid, None)
+                if self.sockets.get(sid) is ws:
+                    self.sockets.pop(sid, None)
+                    self.sockets_metadata.pop(sid, None)
+                    self.fanout.remove(sid)
             return ws
 
         @routes.get("/")
@@ -660,6 +669,21 @@ class PromptServer():
                 json_data = {}
             return web.json_response(auto_optimize_hint(json_data))
 
+        @routes.get("/nova/residency")
+        async def get_nova_residency(request):
+            residency = comfy.model_management.model_residency.snapshot()
+            residency["memory"] = comfy.model_management.memory_stats()
+            return web.json_response(residency)
+
+        @routes.get("/nova/metrics")
+        async def get_nova_metrics(request):
+            lines = comfy.model_management.model_residency.prometheus()
+            for name, stats in comfy.model_management.memory_stats().items():
+                lines += prometheus_gauges(f"comfy_{name}", stats)
+            lines += prometheus_gauges("comfy_websocket", self.fanout.stats())
+            lines += prometheus_gauges("comfy_preview_encoder", self.preview_encoder.stats())
+            return web.Response(text="\n".join(lines) + "\n", content_type="text/plain")
+
         @routes.get("/prompt")
         async def get_prompt(request):
             return web.json_response(self.get_queue_info())
@@ -718,29 +742,37 @@ class PromptServer():
             }
             return info
 
+        self.object_info = ObjectInfoCache(node_info, nodes.NODE_CLASS_MAPPINGS, nodes.NODE_DISPLAY_NAME_MAPPINGS, on_folders_changed=lambda: seed_assets(["models"]))
+
         @routes.get("/object_info")
         async def get_object_info(request):
-            try:
-                seed_assets(["models"])
-            except Exception as e:
-                logging.error(f"Failed to seed assets: {e}")
-            with folder_paths.cache_helper:
-                out = {}
-                for x in nodes.NODE_CLASS_MAPPINGS:
-                    try:
-                        out[x] = node_info(x)
-                    except Exception:
-                        logging.error(f"[ERROR] An error occurred while retrieving information for the '{x}' node.")
-                        logging.error(traceback.format_exc())
-                return web.json_response(out)
+            since = request.rel_url.query.get("since", None)
+            if since is not None:
+                try:
+                    since = int(since)
+                except ValueError:
+                    return web.json_response({"error": "since must be an integer version"}, status=400)
+                return web.Response(body=self.object_info.changed_since(since), content_type="application/json")
+
+            snapshot = self.object_info.get()
+            encoding = preferred_encoding(request.headers.get("Accept-Encoding", ""))
+            headers = {"ETag": snapshot.etag_for(encoding), "Cache-Control": "no-cache", "Vary": "Accept-Encoding", "X-Object-Info-Version": str(snapshot.version)}
+            if etag_matches(request.headers.get("If-None-Match", ""), headers["ETag"]):
+                return web.Response(status=304, headers=headers)
+
+            body = snapshot.body
+            if encoding is not None:
+                body = snapshot.encoded(encoding)
+                headers["Content-Encoding"] = encoding
+            return web.Response(body=body, headers=headers, content_type="application/json")
 
         @routes.get("/object_info/{node_class}")
         async def get_object_info_node(request):
             node_class = request.match_info.get("node_class", None)
-            out = {}
-            if (node_class is not None) and (node_class in nodes.NODE_CLASS_MAPPINGS):
-                out[node_class] = node_info(node_class)
-            return web.json_response(out)
+            data = self.object_info.get_class(node_class) if node_class is not None else None
+            if data is None:
+                return web.json_response({})
+            return web.Response(body=b"{" + json.dumps(node_class).encode("utf-8") + b": " + data + b"}", content_type="application/json")
 
         @routes.get("/api/jobs")
         async def get_jobs(request):
@@ -813,7 +845,7 @@ class PromptServer():
                     )
 
             running, queued = self.prompt_queue.get_current_queue_volatile()
-            history = self.prompt_queue.get_history()
+            history = self.prompt_queue.get_history(workflow_id=workflow_id or None)
 
             running = _remove_sensitive_from_queue(running)
             queued = _remove_sensitive_from_queue(queued)
@@ -948,14 +980,18 @@ class PromptServer():
         @routes.post("/queue")
         async def post_queue(request):
             json_data =  await request.json()
+            priority = json_data.get("priority", {})
+            if not isinstance(priority, dict) or not all(isinstance(n, (int, float)) and not isinstance(n, bool) and math.isfinite(n) for n in priority.values()):
+                return web.json_response({"error": "priority must map prompt ids to finite numbers"}, status=400)
             if "clear" in json_data:
                 if json_data["clear"]:
                     self.prompt_queue.wipe_queue()
             if "delete" in json_data:
                 to_delete = json_data['delete']
                 for id_to_delete in to_delete:
-                    delete_func = lambda a: a[1] == id_to_delete
-                    self.prompt_queue.delete_queue_item(delete_func)
+                    self.prompt_queue.delete_queue_item_by_id(id_to_delete)
+            for prompt_id, number in priority.items():
+                self.prompt_queue.set_priority(prompt_id, float(number))
 
             return web.Response(status=200)
 
@@ -981,7 +1017,8 @@ class PromptServer():
                         break
 
                 if should_interrupt:
-                    nodes.interrupt_processing()
+                    # Only the worker running it when several run at once (--worker-devices)
+                    nodes.interrupt_processing(worker=self.prompt_queue.get_running_worker(prompt_id))
                 else:
                     logging.info(f"Prompt {prompt_id} is not currently running, skipping interrupt")
             else:
@@ -1089,6 +1126,8 @@ class PromptServer():
         return prompt_info
 
     async def send(self, event, data, sid=None):
+        if event == "executing":
+            self.preview_encoder.node_started(sid)
         if event == BinaryEventTypes.UNENCODED_PREVIEW_IMAGE:
             await self.send_image(data, sid=sid)
         elif event == BinaryEventTypes.PREVIEW_IMAGE_WITH_METADATA:
@@ -1109,86 +1148,58 @@ class PromptServer():
         message.extend(data)
         return message
 
+    def _preview_targets(self, sid, image_type, with_metadata):
+        """The clients a preview goes to, grouped by the (format, quality) they get it in."""
+        sids = list(self.sockets) if sid is None else [sid] if sid in self.sockets else []
+        targets = {}
+        for client_id in sids:
+            client_flags = self.sockets_metadata.get(client_id, {}).get("feature_flags", {})
+            targets.setdefault(preview_settings(client_flags, image_type, with_metadata), []).append(client_id)
+        return targets
+
+    async def _send_encoded_preview(self, event, image_data, metadata, sid, key):
+        image_type, image, max_size = image_data
+        targets = self._preview_targets(sid, image_type, metadata is not None)
+        if len(targets) == 0:
+            return
+        frame, epoch = self.preview_encoder.new_frame(sid)
+        future = self.preview_encoder.submit(image, max_size, list(targets), metadata)
+        if future is None:
+            return
+
+        async def deliver():
+            try:
+                encoded = await asyncio.wrap_future(future)
+            except Exception as e:
+                logging.warning("Failed to encode preview: {}".format(e))
+                return
+            # An older frame finishing after a newer one is not sent, see PreviewEncoder.
+            if not self.preview_encoder.deliverable((key, sid), sid, frame, epoch, metadata is not None and metadata.get("node_id") is not None):
+                return
+            for settings, client_ids in targets.items():
+                message = bytes(self.encode_bytes(event, encoded[settings]))
+                for client_id in client_ids:
+                    self.fanout.send(message, True, client_id, key=key)
+        self.loop.create_task(deliver())
+
     async def send_image(self, image_data, sid=None):
-        image_type = image_data[0]
-        image = image_data[1]
-        max_size = image_data[2]
-        if max_size is not None:
-            if hasattr(Image, 'Resampling'):
-                resampling = Image.Resampling.BILINEAR
-            else:
-                resampling = Image.Resampling.LANCZOS
-
-            image = ImageOps.contain(image, (max_size, max_size), resampling)
-        type_num = 1
-        if image_type == "JPEG":
-            type_num = 1
-        elif image_type == "PNG":
-            type_num = 2
-
-        bytesIO = BytesIO()
-        header = struct.pack(">I", type_num)
-        bytesIO.write(header)
-        image.save(bytesIO, format=image_type, quality=95, compress_level=1)
-        preview_bytes = bytesIO.getvalue()
-        await self.send_bytes(BinaryEventTypes.PREVIEW_IMAGE, preview_bytes, sid=sid)
+        await self._send_encoded_preview(BinaryEventTypes.PREVIEW_IMAGE, image_data, None, sid, ("preview",))
 
     async def send_image_with_metadata(self, image_data, metadata=None, sid=None):
-        image_type = image_data[0]
-        image = image_data[1]
-        max_size = image_data[2]
-        if max_size is not None:
-            if hasattr(Image, 'Resampling'):
-                resampling = Image.Resampling.BILINEAR
-            else:
-                resampling = Image.Resampling.LANCZOS
-
-            image = ImageOps.contain(image, (max_size, max_size), resampling)
-
-        mimetype = "image/png" if image_type == "PNG" else "image/jpeg"
-
-        # Prepare metadata
-        if metadata is None:
-            metadata = {}
-        metadata["image_type"] = mimetype
-
-        # Serialize metadata as JSON
-        import json
-        metadata_json = json.dumps(metadata).encode('utf-8')
-        metadata_length = len(metadata_json)
-
-        # Prepare image data
-        bytesIO = BytesIO()
-        image.save(bytesIO, format=image_type, quality=95, compress_level=1)
-        image_bytes = bytesIO.getvalue()
-
-        # Combine metadata and image
-        combined_data = bytearray()
-        combined_data.extend(struct.pack(">I", metadata_length))
-        combined_data.extend(metadata_json)
-        combined_data.extend(image_bytes)
-
-        await self.send_bytes(BinaryEventTypes.PREVIEW_IMAGE_WITH_METADATA, combined_data, sid=sid)
-
-    async def send_bytes(self, event, data, sid=None):
-        message = self.encode_bytes(event, data)
+        metadata = dict(metadata) if metadata is not None else {}
+        await self._send_encoded_preview(BinaryEventTypes.PREVIEW_IMAGE_WITH_METADATA, image_data, metadata, sid, ("preview", metadata.get("node_id")))
 
-        if sid is None:
-            sockets = list(self.sockets.values())
-            for ws in sockets:
-                await send_socket_catch_exception(ws.send_bytes, message)
-        elif sid in self.sockets:
-            await send_socket_catch_exception(self.sockets[sid].send_bytes, message)
+    async def send_bytes(self, event, data, sid=None, key=None):
+        """
+        Queue a binary message for one client or all of them. Messages with the same key replace
+        each other while they wait for a slow client, and may be dropped.
+        """
+        message = bytes(self.encode_bytes(event, data))
+        self.fanout.send(message, True, sid, key=key)
 
     async def send_json(self, event, data, sid=None):
-        message = {"type": event, "data": data}
-
-        if sid is None:
-            sockets = list(self.sockets.values())
-            for ws in sockets:
-                await send_socket_catch_exception(ws.send_json, message)
-        elif sid in self.sockets:
-            await send_socket_catch_exception(self.sockets[sid].send_json, message)
+        message = json.dumps({"type": event, "data": data})
+        self.fanout.send(message, False, sid, key=coalesce_key(event, data))
 
     def send_sync(self, event, data, sid=None):
         self.loop.call_soon_threadsafe(
@@ -0,0 +1,114 @@
+import gzip
+import json
+
+import pytest
+
+import folder_paths
+from app.object_info_cache import ObjectInfoCache, etag_matches, preferred_encoding
+
+
+class NodeA:
+    pass
+
+
+class NodeB:
+    pass
+
+
+@pytest.fixture
+def input_dir(tmp_path):
+    previous = folder_paths.get_input_directory()
+    folder_paths.set_input_directory(str(tmp_path))
+    yield tmp_path
+    folder_paths.set_input_directory(previous)
+
+
+@pytest.fixture
+def registry(input_dir):
+    calls = []
+    classes = {"NodeA": NodeA, "NodeB": NodeB}
+    display_names = {}
+    seeded = []
+
+    def node_info(name):
+        calls.append(name)
+        return {"name": name, "class": classes[name].__name__, "display_name": display_names.get(name, name), "files": sorted(p.name for p in input_dir.iterdir())}
+
+    cache = ObjectInfoCache(node_info, classes, display_names, on_folders_changed=lambda: seeded.append(True))
+    return cache, classes, display_names, calls, seeded
+
+
+def test_built_once_until_something_changes(registry):
+    cache, classes, display_names, calls, seeded = registry
+    snapshot = cache.get()
+    assert json.loads(snapshot.body) == {
+        "NodeA": {"name": "NodeA", "class": "NodeA", "display_name": "NodeA", "files": []},
+        "NodeB": {"name": "NodeB", "class": "NodeB", "display_name": "NodeB", "files": []},
+    }
+    assert sorted(calls) == ["NodeA", "NodeB"] and len(seeded) == 1
+    assert json.loads(gzip.decompress(snapshot.encoded("gzip"))) == json.loads(snapshot.body)
+
+    assert cache.get() is snapshot
+    assert sorted(calls) == ["NodeA", "NodeB"] and len(seeded) == 1
+
+    display_names["NodeB"] = "Node B"
+    snapshot = cache.get()
+    assert calls[2:] == ["NodeB"]
+    assert json.loads(cache.get_class("NodeB"))["display_name"] == "Node B"
+    assert len(seeded) == 1
+
+
+def test_input_directory_change_rebuilds_every_class(registry, input_dir):
+    cache, classes, display_names, calls, seeded = registry
+    first = cache.get()
+    (input_dir / "image.png").write_bytes(b"")
+    second = cache.get()
+    assert second.version > first.version and second.etag != first.etag
+    assert json.loads(second.body)["NodeA"]["files"] == ["image.png"]
+    assert len(seeded) == 2
+
+
+def test_changed_since(registry):
+    cache, classes, display_names, calls, seeded = registry
+    v1 = cache.get().version
+
+    classes["NodeC"] = NodeA
+    del classes["NodeB"]
+    v2 = cache.get().version
+    assert v2 > v1
+
+    out = json.loads(cache.changed_since(v1))
+    assert out["version"] == v2 and out["full"] is False
+    assert list(out["nodes"]) == ["NodeC"] and out["removed"] == ["NodeB"]
+
+    assert json.loads(cache.changed_since(v2))["nodes"] == {}
+
+    out = json.loads(cache.changed_since(0))
+    assert out["full"] is True and list(out["nodes"]) == ["NodeA", "NodeC"]
+
+
+def test_unchanged_rebuild_keeps_the_version(registry):
+    cache, classes, display_names, calls, seeded = registry
+    snapshot = cache.get()
+    cache.invalidate()
+    assert cache.get() is snapshot
+    assert len(calls) == 4
+
+
+def test_preferred_encoding():
+    assert preferred_encoding("gzip, deflate") == "gzip"
+    assert preferred_encoding("identity") is None
+    assert preferred_encoding("") is None
+
+
+def test_etags_differ_per_encoding_and_match_lists(registry):
+    snapshot = registry[0].get()
+    tags = {snapshot.etag_for(None), snapshot.etag_for("gzip"), snapshot.etag_for("br")}
+    assert len(tags) == 3 and all(t.startswith('"') and t.endswith('"') for t in tags)
+
+    etag = snapshot.etag_for("gzip")
+    assert etag_matches('"other", {}'.format(etag), etag)
+    assert etag_matches("W/" + etag, etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches(snapshot.etag, etag)
+    assert not etag_matches('"x{}"'.format(etag.strip('"')), etag)
@@ -0,0 +1,104 @@
+import pytest
+
+sqlalchemy = pytest.importorskip("sqlalchemy")
+
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.database.models import Base  # noqa: E402
+from app.prompt_store.store import PromptStore  # noqa: E402
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'queue.db'}")
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine)
+
+
+def make_item(number, prompt_id):
+    return (number, prompt_id, {"1": {"class_type": "SaveImage", "inputs": {}}}, {"client_id": "c"}, ["1"], {"api_key_comfy_org": "secret"})
+
+
+def test_pending_items_are_replayed_without_sensitive_data(session_factory):
+    store = PromptStore(session_factory, max_history=10)
+    store.put(make_item(2, "b"))
+    store.put(make_item(1, "a"))
+    store.put(make_item(3, "c"))
+    store.delete("c")
+    store.flush()
+
+    pending, history = PromptStore(session_factory, max_history=10).load()
+    assert [item[1] for item in pending] == ["a", "b"]
+    assert pending[0][5] == {}
+    assert history == []
+
+
+def test_finished_and_interrupted_prompts_end_up_in_history(session_factory):
+    store = PromptStore(session_factory, max_history=2)
+    for i in range(4):
+        item = make_item(i, f"p{i}")
+        store.put(item)
+        store.started(item[1])
+        if i < 3:
+            store.finished(item[1], {"prompt": item[:5], "outputs": {}, "status": {"status_str": "success", "completed": True, "messages": []}})
+    store.flush()
+
+    restored = PromptStore(session_factory, max_history=2)
+    pending, history = restored.load()
+    assert pending == []
+    assert [prompt_id for prompt_id, _ in history] == ["p1", "p2", "p3"]
+    assert history[-1][1]["status"]["status_str"] == "error"
+    assert history[0][1]["prompt"][1] == "p1"
+
+    restored.flush()
+    _, history = PromptStore(session_factory, max_history=2).load()
+    assert [prompt_id for prompt_id, _ in history] == ["p2", "p3"]
+
+
+def test_unserializable_changes_do_not_lose_the_others(session_factory):
+    store = PromptStore(session_factory, max_history=10)
+    store.put(make_item(1, "a"))
+    store.put((2, "bad", {"1": object()}, {}, [], {}))
+    store.put(make_item(3, "c"))
+    store.finished("a", {"prompt": make_item(1, "a")[:5], "outputs": {"1": object()}, "status": {"status_str": "success"}})
+    store.flush()
+
+    pending, history = PromptStore(session_factory, max_history=10).load()
+    assert [item[1] for item in pending] == ["c"]
+    assert history == []
+
+
+def test_a_failing_change_is_retried_alone(session_factory, monkeypatch):
+    store = PromptStore(session_factory, max_history=10)
+    write = store._write
+
+    def failing_write(ops):
+        if any(op[0] == "put" and op[1] == "b" for op in ops):
+            raise RuntimeError("constraint failed")
+        write(ops)
+    monkeypatch.setattr(store, "_write", failing_write)
+
+    for i, prompt_id in enumerate(["a", "b", "c"]):
+        store.put(make_item(i, prompt_id))
+    store.close()
+
+    pending, _ = PromptStore(session_factory, max_history=10).load()
+    assert [item[1] for item in pending] == ["a", "c"]
+
+
+def test_only_the_prompt_store_session_uses_wal(tmp_path, monkeypatch):
+    from app.database import db
+    from comfy.cli_args import args
+
+    url = f"sqlite:///{tmp_path / 'app.db'}"
+    monkeypatch.setattr(args, "database_url", url)
+    monkeypatch.setattr(db, "PromptStoreSession", None)
+    engine = sqlalchemy.create_engine(url)
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "delete"
+
+    with db.create_prompt_store_session() as session:
+        assert session.execute(sqlalchemy.text("PRAGMA journal_mode")).scalar() == "wal"
+        assert session.execute(sqlalchemy.text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == 2  # FULL
@@ -0,0 +1,103 @@
+import json
+import os
+import struct
+import time
+import types
+
+import pytest
+
+torch = pytest.importorskip("torch")
+safetensors_torch = pytest.importorskip("safetensors.torch")
+
+from comfy.cli_args import args  # noqa: E402
+if not torch.cuda.is_available():
+    args.cpu = True
+
+import comfy.compiled_models as compiled_models  # noqa: E402
+from comfy.compiled_models import CompiledModelCache, write_safetensors  # noqa: E402
+
+
+def test_write_safetensors_casts_and_aligns(tmp_path):
+    path = str(tmp_path / "model.safetensors")
+    tensors = {
+        "a": torch.randn(3, 5, dtype=torch.float32),
+        "b": torch.arange(7, dtype=torch.int8),
+        "c": torch.randn(4, dtype=torch.float32),
+        "empty": torch.zeros(0, dtype=torch.float16),
+    }
+    write_safetensors(path, tensors, {"key": "value"}, dtypes={"a": torch.float16})
+
+    loaded = safetensors_torch.load_file(path)
+    assert loaded["a"].dtype == torch.float16 and torch.equal(loaded["a"], tensors["a"].half())
+    assert torch.equal(loaded["b"], tensors["b"]) and torch.equal(loaded["c"], tensors["c"])
+    assert loaded["empty"].shape == (0,)
+
+    with open(path, "rb") as f:
+        header_size = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_size))
+    assert (header_size + 8) % compiled_models.HEADER_ALIGNMENT == 0
+    assert header["__metadata__"] == {"key": "value"}
+    for key, info in header.items():
+        if key != "__metadata__":
+            assert info["data_offsets"][0] % loaded[key].element_size() == 0
+
+
+def test_encode_decode_round_trip():
+    value = {"dtype": torch.bfloat16, "shape": (1, 2, [3, (4,)]), "name": None, "flag": True}
+    assert compiled_models._decode(json.loads(json.dumps(compiled_models._encode(value)))) == value
+    with pytest.raises(TypeError):
+        compiled_models._encode({"x": object()})
+
+
+def test_custom_operations_are_not_cached(tmp_path):
+    cache = CompiledModelCache(str(tmp_path))
+    assert cache.options_key({"custom_operations": object()}) is None
+    assert cache.options_key({"dtype": torch.float16}) == {"dtype": "torch.float16", "fp8_optimizations": False}
+    assert not CompiledModelCache(None).enabled
+
+
+class TinyConfig:
+    def __init__(self, unet_config):
+        self.unet_config = unet_config.copy()
+        self.quant_config = None
+
+    def set_inference_dtype(self, dtype, manual_cast_dtype):
+        self.unet_config["dtype"] = dtype
+
+
+def _store(cache, source, model_config, sd, precast):
+    patcher = types.SimpleNamespace(
+        is_dynamic=lambda: False,
+        model=types.SimpleNamespace(diffusion_model=types.SimpleNamespace(state_dict=lambda: {k: v.to(precast) for k, v in sd.items()})),
+    )
+    cache.store(source, {}, model_config, sd, 123, torch.float32, patcher)
+    deadline = time.monotonic() + 30
+    while cache.writing and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not cache.writing
+
+
+def test_store_then_load_until_the_source_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(compiled_models, "_model_config_class", lambda name: TinyConfig if name == "TinyConfig" else None)
+    source = str(tmp_path / "source.safetensors")
+    sd = {"input_blocks.0.0.weight": torch.randn(8, 4)}
+    safetensors_torch.save_file(sd, source)
+    cache = CompiledModelCache(str(tmp_path / "compiled"))
+
+    model_config = TinyConfig({"context_dim": 768, "model_channels": 320, "transformer_depth": (1, 2), "adm_in_channels": None})
+    model_config.set_inference_dtype(torch.float16, None)
+    _store(cache, source, model_config, sd, torch.float16)
+
+    loaded = cache.load(source, {})
+    assert loaded is not None
+    loaded_config, loaded_sd, parameters, weight_dtype, precast_dtype = loaded
+    assert type(loaded_config) is TinyConfig
+    assert "dtype" not in loaded_config.unet_config
+    assert loaded_config.unet_config == {k: v for k, v in model_config.unet_config.items() if k != "dtype"}
+    assert (parameters, weight_dtype, precast_dtype) == (123, torch.float32, torch.float16)
+    assert loaded_sd["input_blocks.0.0.weight"].dtype == torch.float16
+    assert cache.load(source, {"dtype": torch.bfloat16}) is None
+
+    st = os.stat(source)
+    os.utime(source, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    assert cache.load(source, {}) is None
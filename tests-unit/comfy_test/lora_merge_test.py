@@ -0,0 +1,104 @@
+import logging
+import time
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from comfy.cli_args import args  # noqa: E402
+if not torch.cuda.is_available():
+    args.cpu = True
+
+import comfy.lora  # noqa: E402
+import comfy.model_patcher  # noqa: E402
+from comfy.weight_adapter import LoRAAdapter  # noqa: E402
+
+
+def make_lora(out_features, in_features, rank, alpha=None, conv=False):
+    up = torch.randn(out_features, rank) * 0.1
+    down = torch.randn(rank, in_features) * 0.1
+    if conv:
+        up = up.reshape(out_features, rank, 1, 1)
+        down = torch.randn(rank, in_features, 3, 3) * 0.1
+    return LoRAAdapter(set(), (up, down, alpha, None, None, None))
+
+
+def per_patch_merge(patches, weight, key):
+    # The historical path: each adapter merges itself one patch at a time.
+    for strength, adapter, _, offset, function in patches:
+        weight = adapter.calculate_weight(weight, key, strength, 1.0, offset, lambda a: a)
+    return weight
+
+
+def test_stacked_loras_merge_with_one_matmul():
+    weight = torch.randn(64, 32)
+    patches = [(0.8, make_lora(64, 32, 4, alpha=2.0), 1.0, None, None), (0.5, make_lora(64, 32, 8), 1.0, None, None), (-1.0, make_lora(64, 32, 4, alpha=4.0), 1.0, None, None)]
+    expected = per_patch_merge(patches, weight.clone(), "w")
+    merged = comfy.lora.calculate_weight(patches, weight.clone(), "w")
+    assert torch.allclose(merged, expected, atol=1e-5)
+
+
+def test_batched_diffs_match_the_per_key_merge():
+    key_patches = {}
+    weights = {}
+    for i in range(5):
+        weights[f"attn.{i}.weight"] = torch.randn(48, 48)
+        key_patches[f"attn.{i}.weight"] = [(1.0, make_lora(48, 48, 4, alpha=4.0), 1.0, None, None), (0.3, make_lora(48, 48, 4), 1.0, None, None)]
+    weights["conv.weight"] = torch.randn(16, 8, 3, 3)
+    key_patches["conv.weight"] = [(0.7, make_lora(16, 8, 4, conv=True), 1.0, None, None)]
+    # Not a plain LoRA: left to the per patch path.
+    weights["scaled.weight"] = torch.randn(48, 48)
+    key_patches["scaled.weight"] = [(1.0, make_lora(48, 48, 4), 0.5, None, None)]
+
+    diffs = comfy.lora.batched_lora_diffs(key_patches, torch.device("cpu"), max_batch_bytes=3 * 48 * 48 * 4)
+    assert set(diffs) == set(weights) - {"scaled.weight"}
+    for key, weight in weights.items():
+        expected = per_patch_merge(key_patches[key], weight.clone(), key) if key != "scaled.weight" else None
+        merged = comfy.lora.calculate_weight(key_patches[key], weight.clone(), key, lora_diff=diffs.get(key))
+        if expected is not None:
+            assert torch.allclose(merged, expected, atol=1e-5), key
+
+
+def test_precomputed_diffs_are_bounded_and_counted():
+    model = torch.nn.Sequential(*[torch.nn.Linear(48, 48) for _ in range(3)])
+    patcher = comfy.model_patcher.ModelPatcher(model, load_device=torch.device("cpu"), offload_device=torch.device("cpu"))
+    patcher.add_patches({f"{i}.weight": make_lora(48, 48, 4) for i in range(3)})
+    patcher.add_patches({"0.bias": make_lora(48, 1, 4)}, strength_model=0.5)
+    diff_bytes = 48 * 48 * 4
+
+    assert patcher._lora_diff_reserve(torch.device("cpu")) == 0
+    assert patcher._lora_diff_reserve(torch.device("cuda")) == 3 * diff_bytes
+    modules = [(str(i), model[i], [f"{i}.weight", f"{i}.bias"]) for i in range(3)]
+    batches = [batch for batch, _ in patcher._lora_diff_batches(modules, torch.device("cpu"), 2 * diff_bytes)]
+    assert [[n for n, _, _ in batch] for batch in batches] == [["0", "1"], ["2"]]
+
+
+def benchmark(num_keys=1000, size=320, rank=8, loras=3, device="cpu"):
+    """Compare the per patch merge with the fused and batched ones: PYTHONPATH=. python tests-unit/comfy_test/lora_merge_test.py"""
+    device = torch.device(device)
+    key_patches = {f"k{i}": [(1.0, make_lora(size, size, rank, alpha=rank), 1.0, None, None) for _ in range(loras)] for i in range(num_keys)}
+    weights = {key: torch.randn(size, size, device=device) for key in key_patches}
+
+    def run(merge):
+        start = time.perf_counter()
+        merge()
+        if device.type == "cuda":
+            torch.cuda.synchronize()
+        return time.perf_counter() - start
+
+    def fused():
+        for key, patches in key_patches.items():
+            comfy.lora.calculate_weight(patches, weights[key].clone(), key)
+
+    def batched():
+        diffs = comfy.lora.batched_lora_diffs(key_patches, device)
+        for key, patches in key_patches.items():
+            comfy.lora.calculate_weight(patches, weights[key].clone(), key, lora_diff=diffs[key])
+
+    per_patch = run(lambda: [per_patch_merge(patches, weights[key].clone(), key) for key, patches in key_patches.items()])
+    logging.info("{} keys of {}x{} with {} rank {} LoRAs on {}: per patch {:.3f}s, fused {:.3f}s, batched {:.3f}s".format(
+        num_keys, size, size, loras, rank, device, per_patch, run(fused), run(batched)))
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    benchmark()
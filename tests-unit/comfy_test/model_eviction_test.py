@@ -0,0 +1,72 @@
+from comfy.model_eviction import CostEvictionPolicy, EvictionPolicy, model_keys, tag_model
+
+GB = 1024 * 1024 * 1024
+
+
+class Patcher:
+    def __init__(self, size, loaded, parent=None):
+        self.size = size
+        self.loaded = loaded
+        self.parent = parent
+
+
+class FakeLoadedModel:
+    def __init__(self, patcher, device="cuda:0"):
+        self.model = patcher
+        self.device = device
+
+    def model_memory(self):
+        return self.model.size
+
+    def model_loaded_memory(self):
+        return self.model.loaded
+
+    def model_offloaded_memory(self):
+        return self.model.size - self.model.loaded
+
+
+def eviction_order(policy, loaded_models):
+    return [m for _, m in sorted(((policy.sort_key(m), i), m) for i, m in enumerate(loaded_models))]
+
+
+def test_default_policy_unloads_offloaded_models_first():
+    full = FakeLoadedModel(Patcher(4 * GB, 4 * GB))
+    partial = FakeLoadedModel(Patcher(4 * GB, 1 * GB))
+    assert eviction_order(EvictionPolicy(), [full, partial]) == [partial, full]
+
+
+def test_model_keys_include_the_patchers_a_model_was_cloned_from():
+    base = Patcher(GB, GB)
+    lora = Patcher(GB, GB, parent=base)
+    tag_model(base, [("ckpt_name", "base.safetensors")])
+    tag_model(lora, [("lora_name", "detail.safetensors")])
+    assert model_keys(lora) == {("ckpt_name", "base.safetensors"), ("lora_name", "detail.safetensors")}
+    assert model_keys(base) == {("ckpt_name", "base.safetensors")}
+
+
+def test_cost_policy_keeps_expensive_frequent_and_queued_models():
+    queued = set()
+    policy = CostEvictionPolicy(queued_model_keys=lambda: queued)
+    small = FakeLoadedModel(Patcher(1 * GB, 1 * GB))
+    large = FakeLoadedModel(Patcher(6 * GB, 6 * GB))
+    assert eviction_order(policy, [large, small]) == [small, large]
+
+    # A model used over and over costs more to drop than a bigger one used once.
+    for _ in range(10):
+        policy.model_used(small)
+    assert eviction_order(policy, [large, small]) == [large, small]
+
+    tag_model(large.model, [("ckpt_name", "refiner.safetensors")])
+    queued.add(("ckpt_name", "refiner.safetensors"))
+    assert eviction_order(policy, [large, small]) == [small, large]
+
+
+def test_cost_policy_measures_load_bandwidth_per_device():
+    policy = CostEvictionPolicy()
+    model = FakeLoadedModel(Patcher(4 * GB, 4 * GB), device="cuda:1")
+    policy.model_loaded(model, 4 * GB, 4.0)
+    assert policy.load_bandwidth("cuda:1") == GB
+    assert policy.reload_seconds(model) == 4.0
+    # Tiny loads are not timed.
+    policy.model_loaded(model, 1024, 1.0)
+    assert policy.load_bandwidth("cuda:1") == GB
@@ -0,0 +1,30 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from comfy.cli_args import args  # noqa: E402
+if not torch.cuda.is_available():
+    args.cpu = True
+
+import comfy.model_management  # noqa: E402
+import comfy.model_patcher  # noqa: E402
+from comfy_execution.residency_graph import AssetState  # noqa: E402
+
+
+def test_model_loads_and_unloads_are_reported():
+    model = torch.nn.Linear(32, 32)
+    device = comfy.model_management.get_torch_device()
+    patcher = comfy.model_patcher.ModelPatcher(model, load_device=device, offload_device=torch.device("cpu"))
+
+    comfy.model_management.load_models_gpu([patcher])
+    comfy.model_management.load_models_gpu([patcher])
+    asset = next(a for a in comfy.model_management.model_residency.snapshot()["assets"] if a["asset_id"] == model.comfy_residency_id)
+    assert (asset["misses"], asset["hits"], asset["loads"]) == (1, 1, 1)
+    assert asset["state"] == AssetState.GPU_FULL
+    assert asset["bytes_total"] == asset["bytes_gpu_resident"] == patcher.model_size()
+    assert asset["label"] == "Linear"
+
+    comfy.model_management.unload_all_models()
+    asset = next(a for a in comfy.model_management.model_residency.snapshot()["assets"] if a["asset_id"] == model.comfy_residency_id)
+    assert asset["unloads"] == 1
+    assert asset["state"] == AssetState.CPU_HOT and asset["bytes_gpu_resident"] == 0
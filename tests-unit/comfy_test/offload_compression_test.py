@@ -0,0 +1,92 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from comfy.cli_args import args  # noqa: E402
+if not torch.cuda.is_available():
+    args.cpu = True
+
+import comfy.model_patcher  # noqa: E402
+import comfy.offload_compression  # noqa: E402
+from comfy import ops  # noqa: E402
+from comfy.quant_ops import BlockINT8Layout, QuantizedTensor, ck_available  # noqa: E402
+
+pytestmark = pytest.mark.skipif(not ck_available(), reason="comfy_kitchen is not installed")
+
+
+class SimpleModel(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.layer1 = ops.manual_cast.Linear(64, 96, device="cpu", dtype=torch.bfloat16)
+        self.layer2 = ops.manual_cast.Linear(96, 32, device="cpu", dtype=torch.bfloat16)
+        for p in self.parameters():
+            torch.nn.init.normal_(p, std=0.1)
+
+    def forward(self, x):
+        return self.layer2(torch.nn.functional.relu(self.layer1(x)))
+
+
+def test_block_int8_round_trip():
+    w = torch.randn(33, 70, dtype=torch.float16)
+    qdata, params = BlockINT8Layout.quantize(w)
+    assert qdata.dtype == torch.int8
+    out = BlockINT8Layout.dequantize(qdata, params)
+    assert out.shape == w.shape and out.dtype == w.dtype
+    assert (out.float() - w.float()).abs().max() <= w.float().abs().max() / 127 + 1e-3
+
+
+@pytest.mark.parametrize("mode", ["fp8", "int8"])
+def test_compressed_module_is_dequantized_in_the_cast(mode):
+    torch.manual_seed(0)
+    model = SimpleModel()
+    x = torch.randn(4, 64, dtype=torch.bfloat16)
+    expected = model(x)
+    original = model.layer1.weight.detach().clone()
+    size = comfy.offload_compression.module_size(model.layer1)
+
+    assert comfy.offload_compression.compress_module(model.layer1, mode) > 0
+    assert isinstance(model.layer1.weight, QuantizedTensor)
+    assert sorted(name for name, _ in model.layer1.named_parameters()) == ["bias", "weight"]
+    assert comfy.offload_compression.module_size(model.layer1) == size
+    assert torch.allclose(model(x).float(), expected.float(), atol=0.1, rtol=0.1)
+
+    comfy.offload_compression.decompress_module(model.layer1)
+    assert not isinstance(model.layer1.weight, QuantizedTensor)
+    assert model.layer1.weight.dtype == torch.bfloat16
+    assert torch.equal(model.layer1.weight, original)
+    assert not comfy.offload_compression.is_compressed(model.layer1)
+
+
+def test_full_precision_weight_is_only_kept_in_the_spill_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(comfy.offload_compression, "spill_directory", str(tmp_path))
+    model = SimpleModel()
+    original = model.layer1.weight.detach().clone()
+    ram_weight = model.layer1.weight.data
+
+    assert comfy.offload_compression.compress_module(model.layer1, "fp8") > 0
+    source = model.layer1.comfy_offload_source
+    assert source.data_ptr() != ram_weight.data_ptr()
+    assert source.untyped_storage().filename is not None
+    assert torch.equal(source, original)
+
+    comfy.offload_compression.decompress_module(model.layer1)
+    assert torch.equal(model.layer1.weight, original)
+    assert model.layer1.weight.untyped_storage().filename is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_partially_unloaded_modules_are_compressed_until_unpatched(monkeypatch):
+    monkeypatch.setattr(args, "offload_compression", "int8")
+    model = SimpleModel()
+    original = {k: v.clone() for k, v in model.state_dict().items()}
+    patcher = comfy.model_patcher.ModelPatcher(model, load_device=torch.device("cpu"), offload_device=torch.device("cpu"))
+    patcher.load(torch.device("cpu"), full_load=True)
+    patcher.partially_unload(torch.device("cpu"), memory_to_free=patcher.model_size())
+    assert comfy.offload_compression.is_compressed(model.layer1)
+    assert comfy.offload_compression.is_compressed(model.layer2)
+    model(torch.randn(2, 64, dtype=torch.bfloat16))
+
+    patcher.unpatch_model(torch.device("cpu"))
+    assert not isinstance(model.layer1.weight, QuantizedTensor)
+    assert not comfy.offload_compression.is_compressed(model.layer2)
+    assert all(torch.equal(v, original[k]) for k, v in model.state_dict().items())
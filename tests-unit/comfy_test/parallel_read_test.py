@@ -0,0 +1,26 @@
+import os
+
+from comfy.parallel_read import readahead
+
+
+def test_readahead_reads_the_whole_file_with_several_threads(tmp_path):
+    path = tmp_path / "model.safetensors"
+    path.write_bytes(os.urandom(10 * 4096 + 123))
+    num_bytes, seconds = readahead(str(path), threads=3, chunk_size=4096)
+    assert num_bytes == 10 * 4096 + 123
+    assert seconds >= 0
+
+
+def test_readahead_range_is_aligned_to_chunks(tmp_path):
+    path = tmp_path / "model.safetensors"
+    path.write_bytes(b"\0" * 8192)
+    # The range starts in the middle of the first chunk, which is read from its start.
+    num_bytes, _ = readahead(str(path), threads=2, offset=100, length=5000, chunk_size=4096)
+    assert num_bytes == 5100
+
+
+def test_readahead_stops_when_asked(tmp_path):
+    path = tmp_path / "model.safetensors"
+    path.write_bytes(b"\0" * 4096 * 8)
+    num_bytes, _ = readahead(str(path), threads=1, chunk_size=4096, should_stop=lambda: True)
+    assert num_bytes == 0
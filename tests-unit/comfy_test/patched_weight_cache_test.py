@@ -0,0 +1,86 @@
+import gc
+
+import pytest
+
+from comfy.patched_weight_cache import PatchedWeightCache
+
+
+class FakeTensor:
+    def __init__(self, nbytes=100):
+        self.nbytes = nbytes
+
+
+class Adapter:
+    def __init__(self, weights):
+        self.weights = weights
+
+
+class Model:
+    pass
+
+
+def lora_patch(adapter, strength=1.0):
+    return (strength, adapter, 1.0, None, None)
+
+
+def test_identical_patch_sets_hit_across_adapter_objects():
+    cache = PatchedWeightCache(max_bytes=1000)
+    model = Model()
+    up, down = FakeTensor(), FakeTensor()
+    key = cache.key(model, "w", [lora_patch(Adapter((up, down, 8.0)))], "fp16")
+    merged = FakeTensor()
+    cache.put(key, merged)
+
+    # Loading the same LoRA again builds new adapters over the same tensors.
+    assert cache.get(cache.key(model, "w", [lora_patch(Adapter((up, down, 8.0)))], "fp16")) is merged
+    assert cache.get(cache.key(model, "w", [lora_patch(Adapter((up, down, 8.0)), strength=0.5)], "fp16")) is None
+    assert cache.get(cache.key(model, "w", [lora_patch(Adapter((up, down, 8.0)))], "bf16")) is None
+    assert cache.get(cache.key(model, "other", [lora_patch(Adapter((up, down, 8.0)))], "fp16")) is None
+    assert cache.get(cache.key(Model(), "w", [lora_patch(Adapter((up, down, 8.0)))], "fp16")) is None
+    other = FakeTensor()
+    assert cache.get(cache.key(model, "w", [lora_patch(Adapter((up, other, 8.0)))], "fp16")) is None
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 5
+
+
+def test_entries_are_dropped_when_a_patch_tensor_is_freed():
+    cache = PatchedWeightCache(max_bytes=1000)
+    model = Model()
+    up = FakeTensor()
+    cache.put(cache.key(model, "w", [lora_patch(Adapter((up,)))]), FakeTensor())
+    assert cache.stats()["entries"] == 1
+    del up
+    gc.collect()
+    assert cache.stats() == {"entries": 0, "bytes": 0, "spilled_entries": 0, "spilled_bytes": 0, "hits": 0, "misses": 0}
+
+
+def test_least_recently_used_entries_are_evicted_and_disabled_cache_does_nothing():
+    cache = PatchedWeightCache(max_bytes=250)
+    model = Model()
+    tensors = [FakeTensor() for _ in range(3)]
+    keys = [cache.key(model, str(i), [lora_patch(Adapter((t,)))]) for i, t in enumerate(tensors)]
+    cache.put(keys[0], FakeTensor())
+    cache.put(keys[1], FakeTensor())
+    cache.get(keys[0])
+    cache.put(keys[2], FakeTensor())
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None
+
+    disabled = PatchedWeightCache(max_bytes=0)
+    assert disabled.key(model, "0", []) is None
+    disabled.put(None, FakeTensor())
+    assert disabled.get(None) is None
+
+
+def test_evicted_entries_spill_to_disk(tmp_path):
+    torch = pytest.importorskip("torch")
+    pytest.importorskip("safetensors")
+    cache = PatchedWeightCache(max_bytes=16, disk_dir=str(tmp_path), max_disk_bytes=1024)
+    model = Model()
+    lora = torch.ones(2)
+    keys = [cache.key(model, str(i), [lora_patch(Adapter((lora,)))]) for i in range(2)]
+    cache.put(keys[0], torch.full((4,), 1.0))
+    cache.put(keys[1], torch.full((4,), 2.0))
+    assert cache.stats()["spilled_entries"] == 1
+    assert torch.equal(cache.get(keys[0]), torch.full((4,), 1.0))
+    assert cache.stats()["entries"] == 1 and cache.stats()["spilled_entries"] == 1
@@ -0,0 +1,102 @@
+from comfy.pinned_pool import MIN_BLOCK_SIZE, PinnedPool, size_class
+
+MB = 1024 * 1024
+
+
+class MockBackend:
+    """Stands in for cudaHostRegister: tracks registrations and can run out of pinnable memory."""
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.registered = {}
+        self.register_calls = 0
+        self.unregister_calls = 0
+
+    def allocate(self, nbytes):
+        if self.limit is not None and sum(len(b) for b in self.registered.values()) + nbytes > self.limit:
+            return None
+        self.register_calls += 1
+        handle = self.register_calls
+        self.registered[handle] = bytearray(nbytes)
+        return handle
+
+    def free(self, handle):
+        self.unregister_calls += 1
+        del self.registered[handle]
+
+    def view(self, handle, offset, nbytes):
+        return memoryview(self.registered[handle])[offset:offset + nbytes]
+
+
+def test_size_classes_waste_at_most_a_quarter():
+    assert size_class(1) == MIN_BLOCK_SIZE
+    for nbytes in (MIN_BLOCK_SIZE + 1, 100_000, 3 * MB + 7, 77 * MB):
+        block = size_class(nbytes)
+        assert nbytes <= block <= nbytes * 1.25 + 1
+        assert block % 4096 == 0
+
+
+def test_blocks_share_slabs_and_are_reused_across_models():
+    backend = MockBackend()
+    pool = PinnedPool(backend, slab_size=4 * MB)
+    first_model = [pool.acquire(100_000) for _ in range(20)]
+    assert backend.register_calls == 1
+    assert len({b.slab for b in first_model}) == 1
+    assert all(len(b.buffer) == 100_000 for b in first_model)
+
+    first_model[0].buffer[:3] = b"abc"
+    assert bytes(first_model[1].buffer[:3]) != b"abc"
+
+    for block in first_model:
+        pool.release(block)
+    # The empty slab is retained for the next model, no registration needed.
+    second_model = [pool.acquire(100_000) for _ in range(20)]
+    assert backend.register_calls == 1
+    assert backend.unregister_calls == 0
+    stats = pool.stats()
+    assert stats["in_use_bytes"] == 20 * size_class(100_000)
+    assert stats["requested_bytes"] == 20 * 100_000
+    assert stats["slabs"] == 1
+
+    for block in second_model:
+        pool.release(block)
+    assert pool.trim() == stats["registered_bytes"]
+    assert backend.registered == {}
+
+
+def test_large_blocks_get_their_own_slab():
+    backend = MockBackend()
+    pool = PinnedPool(backend, slab_size=4 * MB)
+    block = pool.acquire(9 * MB)
+    assert len(backend.registered[block.slab.handle]) == size_class(9 * MB)
+
+
+def test_pool_respects_the_cap_and_gives_back_empty_slabs_when_full():
+    backend = MockBackend(limit=8 * MB)
+    pool = PinnedPool(backend, slab_size=4 * MB)
+    small = pool.acquire(MIN_BLOCK_SIZE)
+    medium = pool.acquire(1 * MB)
+    assert pool.acquire(6 * MB) is None
+    assert pool.stats()["failed"] == 1
+
+    pool.release(small)
+    # The empty small block slab is unregistered to make room.
+    big = pool.acquire(3 * MB)
+    assert big is not None
+    assert pool.stats()["slabs"] == 2
+    pool.release(medium)
+    pool.release(big)
+
+    capped = PinnedPool(MockBackend(), max_bytes=4 * MB, slab_size=4 * MB)
+    assert capped.acquire(MB) is not None
+    assert capped.acquire(2 * MB) is None
+
+
+def test_release_past_the_retained_amount_unregisters():
+    backend = MockBackend()
+    pool = PinnedPool(backend, retain_bytes=4 * MB, slab_size=4 * MB)
+    blocks = [pool.acquire(3 * MB) for _ in range(3)]
+    for block in blocks:
+        pool.release(block)
+    assert pool.stats()["registered_bytes"] <= 4 * MB
+    assert backend.unregister_calls == 2
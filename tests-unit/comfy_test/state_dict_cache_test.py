@@ -0,0 +1,116 @@
+import gc
+import os
+import threading
+
+import pytest
+
+from comfy.state_dict_cache import StateDictRegistry
+
+
+class FakeTensor:
+    def __init__(self, nbytes):
+        self.nbytes = nbytes
+
+
+def make_file(tmp_path, name):
+    path = tmp_path / name
+    path.write_bytes(b"weights")
+    return str(path)
+
+
+def test_same_file_is_loaded_once_and_shared(tmp_path):
+    path = make_file(tmp_path, "lora.safetensors")
+    registry = StateDictRegistry(max_bytes=1000)
+    loads = []
+
+    def load():
+        loads.append(path)
+        return {"a": FakeTensor(100), "b": FakeTensor(100)}, {"format": "pt"}
+
+    sd1, metadata = registry.get(path, None, load)
+    sd2, _ = registry.get(os.path.join(str(tmp_path), ".", "lora.safetensors"), None, load)
+    assert loads == [path]
+    assert metadata == {"format": "pt"}
+    assert sd1["a"] is sd2["a"]
+    # Each caller gets its own dict to pop keys from.
+    sd1.pop("a")
+    assert "a" in sd2
+    assert registry.stats()["referenced"] == 1
+
+    # Different load options are a different entry.
+    registry.get(path, "safe", load)
+    assert len(loads) == 2
+
+
+def test_changed_files_are_read_again(tmp_path):
+    path = make_file(tmp_path, "model.safetensors")
+    registry = StateDictRegistry(max_bytes=1000)
+    registry.get(path, None, lambda: ({"w": FakeTensor(1)}, None))
+    with open(path, "ab") as f:
+        f.write(b"more")
+    sd, _ = registry.get(path, None, lambda: ({"w": FakeTensor(2)}, None))
+    assert sd["w"].nbytes == 2
+
+
+def test_unreferenced_files_are_evicted_least_recently_used_first(tmp_path):
+    registry = StateDictRegistry(max_bytes=250)
+    paths = [make_file(tmp_path, f"{i}.safetensors") for i in range(3)]
+
+    held, _ = registry.get(paths[0], None, lambda: ({"w": FakeTensor(100)}, None))
+    registry.get(paths[1], None, lambda: ({"w": FakeTensor(100)}, None))
+    gc.collect()
+    registry.get(paths[2], None, lambda: ({"w": FakeTensor(100)}, None))
+    gc.collect()
+    # paths[0] is still held by a caller so paths[1] goes instead.
+    assert registry.stats()["files"] == 2
+    sd, _ = registry.get(paths[0], None, lambda: ({"w": FakeTensor(100)}, None))
+    assert sd["w"] is held["w"]
+    assert registry.stats()["misses"] == 3
+
+    del held, sd
+    gc.collect()
+    assert registry.trim(150) == 200
+    assert registry.stats()["files"] == 0
+
+
+def test_concurrent_loads_of_a_file_read_it_once(tmp_path):
+    path = make_file(tmp_path, "ckpt.safetensors")
+    registry = StateDictRegistry(max_bytes=1000)
+    started = threading.Event()
+    release = threading.Event()
+    loads = []
+
+    def slow_load():
+        loads.append(1)
+        started.set()
+        release.wait(5)
+        return {"w": FakeTensor(10)}, None
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.get(path, None, slow_load)[0])) for _ in range(3)]
+    threads[0].start()
+    started.wait(5)
+    for t in threads[1:]:
+        t.start()
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert len(loads) == 1
+    assert len(results) == 3 and all(r["w"] is results[0]["w"] for r in results)
+
+
+def test_only_read_only_safetensors_mmaps_are_shared(monkeypatch):
+    pytest.importorskip("torch")
+    import comfy.utils
+
+    monkeypatch.setattr(comfy.utils, "STATE_DICT_REGISTRY", StateDictRegistry(max_bytes=1000))
+    monkeypatch.setattr(comfy.utils, "enables_dynamic_vram", lambda: True)
+    assert comfy.utils._shares_state_dict("model.safetensors")
+    assert not comfy.utils._shares_state_dict("model.ckpt")
+
+    monkeypatch.setattr(comfy.utils, "enables_dynamic_vram", lambda: False)
+    assert not comfy.utils._shares_state_dict("model.safetensors")
+
+    monkeypatch.setattr(comfy.utils, "STATE_DICT_REGISTRY", StateDictRegistry(max_bytes=0))
+    monkeypatch.setattr(comfy.utils, "enables_dynamic_vram", lambda: True)
+    assert not comfy.utils._shares_state_dict("model.safetensors")
@@ -0,0 +1,68 @@
+import asyncio
+from typing import NamedTuple
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from comfy_execution import caching
+from comfy_execution.graph import DynamicPrompt
+
+
+class PlainNode:
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {"required": {}}
+
+
+class NoIsChanged:
+    async def get(self, node_id):
+        return False
+
+
+class Entry(NamedTuple):
+    ui: dict
+    outputs: list
+
+
+@pytest.fixture(autouse=True)
+def fake_nodes(monkeypatch):
+    monkeypatch.setattr(caching.nodes, "NODE_CLASS_MAPPINGS", {"PlainNode": PlainNode})
+    monkeypatch.setattr(caching, "NODE_CLASS_CONTAINS_UNIQUE_ID", {})
+
+
+def _set_prompt(cache, count):
+    prompt = {str(i): {"class_type": "PlainNode", "inputs": {"seed": i}} for i in range(count)}
+    asyncio.run(cache.set_prompt(DynamicPrompt(prompt), list(prompt.keys()), NoIsChanged()))
+
+
+def _entry(numel):
+    return Entry(ui={}, outputs=[[torch.zeros(numel, dtype=torch.uint8)]])
+
+
+def test_entry_size_counts_shared_storage_once():
+    t = torch.zeros(1000, dtype=torch.uint8)
+    size = caching.cache_entry_size(Entry(ui={}, outputs=[[t, t[:10]], [{"samples": t}]]))
+    assert size == caching.CacheEntrySize(cpu=1000, gpu=0, pinned=0)
+
+
+def test_evicts_least_recently_used_to_stay_under_budget():
+    cache = caching.ByteBudgetCache(caching.CacheKeySetInputSignature, max_bytes=2500)
+    _set_prompt(cache, 4)
+    cache.set("0", _entry(1000))
+    cache.set("1", _entry(1000))
+    assert cache.get("0") is not None  # "1" is now the least recently used
+    cache.set("2", _entry(1000))
+
+    assert cache.get("1") is None
+    assert cache.get("0") is not None
+    assert cache.get("2") is not None
+    assert cache.total_size.total == 2000
+
+
+def test_replacing_an_entry_updates_accounting():
+    cache = caching.ByteBudgetCache(caching.CacheKeySetInputSignature, max_bytes=10_000)
+    _set_prompt(cache, 1)
+    cache.set("0", _entry(1000))
+    cache.set("0", _entry(3000))
+    assert cache.total_size.cpu == 3000
@@ -0,0 +1,174 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("torch")
+
+from comfy_execution import caching
+from comfy_execution.graph import DynamicPrompt
+
+
+class PlainNode:
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {"required": {}}
+
+
+class NoIsChanged:
+    async def get(self, node_id):
+        return False
+
+
+def _prompt(seed):
+    return {
+        "1": {"class_type": "PlainNode", "inputs": {"seed": seed}},
+        "2": {"class_type": "PlainNode", "inputs": {"x": ["1", 0], "text": "hi"}},
+        "3": {"class_type": "PlainNode", "inputs": {"x": ["2", 0], "y": ["1", 0], "v": [1, 2, {"a": 1}]}},
+    }
+
+
+@pytest.fixture(autouse=True)
+def fake_nodes(monkeypatch):
+    monkeypatch.setattr(caching.nodes, "NODE_CLASS_MAPPINGS", {"PlainNode": PlainNode})
+    monkeypatch.setattr(caching, "NODE_CLASS_CONTAINS_UNIQUE_ID", {})
+
+
+async def _keys(cache, prompt):
+    await cache.set_prompt(DynamicPrompt(prompt), list(prompt.keys()), NoIsChanged())
+    return dict(cache.cache_key_set.keys)
+
+
+def test_signatures_are_compact_and_stable_across_prompts():
+    cache = caching.HierarchicalCache(caching.CacheKeySetInputSignature)
+
+    async def run():
+        first = await _keys(cache, _prompt(1))
+        cache.set("3", "value")
+        second = await _keys(cache, _prompt(1))
+        return first, second, cache.get("3")
+
+    first, second, value = asyncio.run(run())
+    assert all(isinstance(k, bytes) and len(k) == caching.SIGNATURE_DIGEST_SIZE for k in first.values())
+    assert first == second
+    assert value == "value"
+
+
+def test_upstream_change_propagates_to_descendants():
+    cache = caching.HierarchicalCache(caching.CacheKeySetInputSignature)
+
+    async def run():
+        return await _keys(cache, _prompt(1)), await _keys(cache, _prompt(2))
+
+    first, second = asyncio.run(run())
+    assert all(first[node_id] != second[node_id] for node_id in first)
+
+
+@pytest.mark.parametrize("reverse_inputs", [False, True])
+def test_diamond_graphs_hash_in_any_input_order(reverse_inputs):
+    # A sampler using a checkpoint and two text encoders of the same checkpoint, hashed starting
+    # from the sampler: the checkpoint is still waiting on the stack when the encoders reach it.
+    inputs = [("model", ["4", 0]), ("positive", ["5", 0]), ("negative", ["6", 0])]
+    if reverse_inputs:
+        inputs.reverse()
+    prompt = {
+        "9": {"class_type": "PlainNode", "inputs": dict(inputs)},
+        "5": {"class_type": "PlainNode", "inputs": {"clip": ["4", 1], "text": "a cat"}},
+        "6": {"class_type": "PlainNode", "inputs": {"clip": ["4", 1], "text": "blurry"}},
+        "4": {"class_type": "PlainNode", "inputs": {"ckpt_name": "model.safetensors"}},
+    }
+    keys = asyncio.run(_keys(caching.HierarchicalCache(caching.CacheKeySetInputSignature), prompt))
+    assert all(isinstance(k, bytes) for k in keys.values()), keys
+
+
+def test_cycles_terminate_as_unhashable():
+    prompt = {
+        "1": {"class_type": "PlainNode", "inputs": {"x": ["2", 0]}},
+        "2": {"class_type": "PlainNode", "inputs": {"x": ["1", 0], "y": ["3", 0]}},
+        "3": {"class_type": "PlainNode", "inputs": {"seed": 1}},
+    }
+    keys = asyncio.run(_keys(caching.HierarchicalCache(caching.CacheKeySetInputSignature), prompt))
+    assert isinstance(keys["1"], caching.Unhashable) and isinstance(keys["2"], caching.Unhashable)
+    assert isinstance(keys["3"], bytes)
+
+
+def test_unhashable_inputs_never_match():
+    cache = caching.HierarchicalCache(caching.CacheKeySetInputSignature)
+
+    async def run():
+        return await _keys(cache, _prompt(float("nan"))), await _keys(cache, _prompt(float("nan")))
+
+    first, second = asyncio.run(run())
+    assert isinstance(first["3"], caching.Unhashable)
+    assert first["3"] != second["3"]
+
+
+class KeyedObject:
+    def __init__(self, name):
+        self.name = name
+
+    def __comfy_cache_key__(self):
+        return ("keyed", self.name)
+
+
+def _object_prompt(value):
+    return {"1": {"class_type": "PlainNode", "inputs": {"value": value}}}
+
+
+def test_tensor_inputs_hash_by_content():
+    import torch
+
+    cache = caching.HierarchicalCache(caching.CacheKeySetInputSignature)
+    a = torch.arange(16, dtype=torch.float32)
+
+    async def run():
+        return [(await _keys(cache, _object_prompt(t)))["1"] for t in (a, a.clone(), a + 1)]
+
+    first, same_content, other_content = asyncio.run(run())
+    assert isinstance(first, bytes)
+    assert first == same_content
+    assert first != other_content
+
+
+def test_tensor_digest_tracks_in_place_updates():
+    import torch
+
+    t = torch.zeros(8)
+    before = caching.TENSOR_DIGESTS.digest(t)
+    assert caching.TENSOR_DIGESTS.digest(t) == before
+    t.add_(1)
+    assert caching.TENSOR_DIGESTS.digest(t) != before
+
+
+def test_comfy_cache_key_protocol():
+    cache = caching.HierarchicalCache(caching.CacheKeySetInputSignature)
+
+    async def run():
+        return [(await _keys(cache, _object_prompt(v)))["1"] for v in (KeyedObject("a"), KeyedObject("a"), KeyedObject("b"), object())]
+
+    a, a_again, b, unknown = asyncio.run(run())
+    assert a == a_again
+    assert a != b
+    assert isinstance(unknown, caching.Unhashable)
+
+
+def test_reuse_sees_in_place_edits_and_value_types():
+    import torch
+
+    cache = caching.HierarchicalCache(caching.CacheKeySetInputSignature)
+    values = [1, 2]
+    t = torch.zeros(4)
+    prompt = {"1": {"class_type": "PlainNode", "inputs": {"values": values, "tensor": t, "n": 1}}}
+
+    async def run():
+        keys = [(await _keys(cache, prompt))["1"]]
+        values.append(3)
+        keys.append((await _keys(cache, prompt))["1"])
+        t.add_(1)
+        keys.append((await _keys(cache, prompt))["1"])
+        for n in (1.0, True):
+            prompt["1"]["inputs"]["n"] = n
+            keys.append((await _keys(cache, prompt))["1"])
+        return keys
+
+    keys = asyncio.run(run())
+    assert len(set(keys)) == len(keys)
@@ -0,0 +1,191 @@
+from typing import NamedTuple
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("safetensors")
+
+from comfy_execution.disk_cache import DiskCache, cache_key_digest
+
+
+class Entry(NamedTuple):
+    ui: dict
+    outputs: list
+
+
+def _key(seed):
+    return frozenset([(0, frozenset([("seed", seed), ("class_type", "KSampler")]))])
+
+
+def test_digest_is_stable_and_rejects_nan():
+    assert cache_key_digest(_key(1)) == cache_key_digest(_key(1))
+    assert cache_key_digest(_key(1)) != cache_key_digest(_key(2))
+    assert cache_key_digest(frozenset([(0, float("NaN"))])) is None
+
+
+def test_round_trip_survives_restart(tmp_path):
+    latent = torch.randn(1, 4, 8, 8)
+    entry = Entry(ui={"images": [{"filename": "a.png"}]}, outputs=[[{"samples": latent, "batch_index": (0,)}], ["text"]])
+
+    cache = DiskCache(str(tmp_path), 1 << 30, Entry)
+    assert cache.put(_key(1), entry)
+    cache.flush()
+
+    restarted = DiskCache(str(tmp_path), 1 << 30, Entry)
+    loaded = restarted.get(_key(1))
+    assert loaded.ui == entry.ui
+    assert loaded.outputs[1] == ["text"]
+    assert loaded.outputs[0][0]["batch_index"] == (0,)
+    assert torch.equal(loaded.outputs[0][0]["samples"], latent)
+
+
+def test_unpersistable_outputs_are_skipped(tmp_path):
+    cache = DiskCache(str(tmp_path), 1 << 30, Entry)
+    assert not cache.put(_key(1), Entry(ui={}, outputs=[[object()]]))
+    assert cache.get(_key(1)) is None
+
+
+def test_lru_eviction_respects_byte_budget(tmp_path):
+    cache = DiskCache(str(tmp_path), 1 << 30, Entry)
+    for seed in range(3):
+        cache.put(_key(seed), Entry(ui={}, outputs=[[torch.zeros(64 * 1024)]]))
+        cache.flush()
+    one_entry = cache.total_bytes // 3
+    cache.get(_key(0))  # refresh seed 0 so seed 1 is the oldest
+    cache.max_bytes = one_entry * 2
+    cache._evict()
+    assert cache.get(_key(1)) is None
+    assert cache.get(_key(0)) is not None
+    assert cache.get(_key(2)) is not None
+
+
+def test_tensors_come_back_on_their_device(tmp_path, monkeypatch):
+    from comfy_execution import disk_cache
+
+    moved = []
+    monkeypatch.setattr(disk_cache, "_restore_device", lambda t, device: moved.append(device) or t)
+    shared = torch.ones(4)
+    cache = DiskCache(str(tmp_path), 1 << 30, Entry)
+    cache.put(_key(1), Entry(ui={}, outputs=[[shared, shared]]))
+    cache.flush()
+    loaded = cache.get(_key(1))
+    assert moved == ["cpu", "cpu"]
+    assert loaded.outputs[0][0] is loaded.outputs[0][1]
+
+
+@pytest.mark.skipif(torch.cuda.is_available(), reason="needs a machine without cuda")
+def test_missing_device_falls_back_to_cpu():
+    from comfy_execution import disk_cache
+
+    assert disk_cache._restore_device(torch.ones(2), "cuda:0").device.type == "cpu"
+
+
+class PlainNode:
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {"required": {}}
+
+
+class NoIsChanged:
+    async def get(self, node_id):
+        return False
+
+
+@pytest.fixture
+def output_cache(tmp_path, monkeypatch):
+    import asyncio
+
+    import folder_paths
+    from comfy_execution import caching
+    from comfy_execution.graph import DynamicPrompt
+
+    monkeypatch.setattr(caching.nodes, "NODE_CLASS_MAPPINGS", {"PlainNode": PlainNode})
+    monkeypatch.setattr(caching, "NODE_CLASS_CONTAINS_UNIQUE_ID", {})
+    models = tmp_path / "models"
+    models.mkdir()
+    monkeypatch.setitem(folder_paths.folder_names_and_paths, "checkpoints", ([str(models)], folder_paths.supported_pt_extensions))
+
+    def set_prompt(cache, inputs):
+        prompt = {"1": {"class_type": "PlainNode", "inputs": inputs}, "2": {"class_type": "PlainNode", "inputs": {"x": ["1", 0]}}}
+        asyncio.run(cache.set_prompt(DynamicPrompt(prompt), list(prompt.keys()), NoIsChanged()))
+
+    disk = DiskCache(str(tmp_path / "cache"), 1 << 30, Entry)
+    return caching, disk, models, set_prompt
+
+
+def test_entries_are_written_on_eviction_only(output_cache):
+    caching, disk, models, set_prompt = output_cache
+    cache = caching.LRUCache(caching.CacheKeySetInputSignature, max_size=0, disk_cache=disk)
+    set_prompt(cache, {"ckpt": "model.safetensors"})
+    cache.set("2", Entry(ui={}, outputs=[[torch.ones(3)]]))
+    disk.flush()
+    assert len(disk.entries) == 0
+
+    set_prompt(cache, {"ckpt": "other.safetensors"})
+    cache.clean_unused()
+    disk.flush()
+    assert len(disk.entries) == 1
+
+    set_prompt(cache, {"ckpt": "model.safetensors"})
+    assert torch.equal(cache.get("2").outputs[0][0], torch.ones(3))
+
+
+def test_model_file_change_invalidates_persistent_key(output_cache):
+    import os
+
+    caching, disk, models, set_prompt = output_cache
+    model = models / "model.safetensors"
+    model.write_bytes(b"a")
+    cache = caching.LRUCache(caching.CacheKeySetInputSignature, max_size=0, disk_cache=disk)
+    set_prompt(cache, {"ckpt": "model.safetensors"})
+    before = cache.cache_key_set.get_persistent_key("2")
+    data_key = cache.cache_key_set.get_data_key("2")
+
+    model.write_bytes(b"bb")
+    os.utime(model, ns=(1, 1))
+    set_prompt(cache, {"ckpt": "model.safetensors"})
+    assert cache.cache_key_set.get_data_key("2") == data_key
+    assert cache.cache_key_set.get_persistent_key("2") != before
+
+
+def test_live_entries_are_written_on_persist(output_cache):
+    caching, disk, models, set_prompt = output_cache
+    cache = caching.LRUCache(caching.CacheKeySetInputSignature, max_size=10, disk_cache=disk)
+    set_prompt(cache, {"ckpt": "model.safetensors"})
+    cache.set("2", Entry(ui={}, outputs=[[torch.ones(3)]]))
+    disk.register(cache)
+    disk.persist_all()
+    assert len(disk.entries) == 1
+    assert cache.get("2") is not None
+
+    restarted = caching.LRUCache(caching.CacheKeySetInputSignature, max_size=10, disk_cache=DiskCache(disk.directory, 1 << 30, Entry))
+    set_prompt(restarted, {"ckpt": "model.safetensors"})
+    assert torch.equal(restarted.get("2").outputs[0][0], torch.ones(3))
+
+
+def test_one_disk_cache_per_directory(tmp_path, monkeypatch):
+    from comfy_execution import disk_cache
+
+    monkeypatch.setattr(disk_cache, "_shared", {})
+    monkeypatch.setattr(disk_cache.atexit, "register", lambda func: None)
+    first = disk_cache.shared_disk_cache(str(tmp_path), 1 << 30, Entry)
+    assert disk_cache.shared_disk_cache(str(tmp_path / "."), 1 << 20, Entry) is first
+    assert disk_cache.shared_disk_cache(str(tmp_path / "other"), 1 << 30, Entry) is not first
+
+
+def test_live_entries_are_written_at_exit(output_cache, monkeypatch):
+    from comfy_execution import disk_cache
+
+    caching, _, models, set_prompt = output_cache
+    monkeypatch.setattr(disk_cache, "_shared", {})
+    monkeypatch.setattr(disk_cache.atexit, "register", lambda func: None)
+    disk = disk_cache.shared_disk_cache(str(models.parent / "shared"), 1 << 30, Entry)
+    cache = caching.LRUCache(caching.CacheKeySetInputSignature, max_size=10, disk_cache=disk)
+    disk.register(cache)
+    set_prompt(cache, {"ckpt": "model.safetensors"})
+    cache.set("2", Entry(ui={}, outputs=[[torch.ones(3)]]))
+
+    # Like at interpreter exit: the writer thread doesn't take new work anymore.
+    disk.writer.shutdown()
+    disk_cache._persist_shared()
+    assert len(disk.entries) == 1
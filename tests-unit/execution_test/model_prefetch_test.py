@@ -0,0 +1,142 @@
+import time
+
+import pytest
+
+import folder_paths
+from comfy_execution import model_prefetch
+from comfy_execution.model_prefetch import ModelPrefetcher, loader_files
+from comfy_execution.residency_graph import AssetState
+
+
+class CheckpointLoader:
+    RETURN_TYPES = ("MODEL", "CLIP", "VAE")
+
+
+class LoraLoader:
+    RETURN_TYPES = ("MODEL", "CLIP")
+
+
+class LoadImage:
+    RETURN_TYPES = ("IMAGE", "MASK")
+
+
+def fake_model_dir(tmp_path, monkeypatch):
+    files = {}
+    for folder, name in (("checkpoints", "sdxl.safetensors"), ("loras", "detail.safetensors"), ("vae", "ae.safetensors")):
+        path = tmp_path / folder / name
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(b"\0" * 4096)
+        files[(folder, name)] = str(path)
+    monkeypatch.setattr(folder_paths, "get_full_path", lambda folder, name: files.get((folder, name)))
+    return files
+
+
+def test_loader_files_resolves_model_widgets(tmp_path, monkeypatch):
+    files = fake_model_dir(tmp_path, monkeypatch)
+    checkpoint = {"class_type": "CheckpointLoader", "inputs": {"ckpt_name": "sdxl.safetensors", "config_name": "v1.yaml"}}
+    lora = {"class_type": "LoraLoader", "inputs": {"lora_name": "detail.safetensors", "model": ["1", 0], "strength_model": 1.0}}
+    image = {"class_type": "LoadImage", "inputs": {"image": "sdxl.safetensors"}}
+
+    assert loader_files(CheckpointLoader, checkpoint) == [files[("checkpoints", "sdxl.safetensors")]]
+    assert loader_files(LoraLoader, lora) == [files[("loras", "detail.safetensors")]]
+    assert loader_files(LoadImage, image) == []
+    # Unknown widget names are looked up in every model folder.
+    assert loader_files(CheckpointLoader, {"inputs": {"model_file": "ae.safetensors"}}) == [files[("vae", "ae.safetensors")]]
+
+
+def test_prefetcher_warms_upcoming_files_and_records_residency(tmp_path, monkeypatch):
+    files = fake_model_dir(tmp_path, monkeypatch)
+    node_files = {"1": [files[("checkpoints", "sdxl.safetensors")]], "2": [files[("loras", "detail.safetensors")]], "3": []}
+    prefetcher = ModelPrefetcher()
+    monkeypatch.setattr(prefetcher, "files_for", lambda dynprompt, node_id: node_files[node_id])
+
+    prefetcher.schedule(None, ["3", "2", "1"])
+    deadline = time.time() + 5
+    while len(prefetcher.warm) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+
+    assert set(prefetcher.warm) == {node_files["1"][0], node_files["2"][0]}
+    assets = prefetcher.residency.snapshot()["assets"]
+    assert sorted(asset["asset_id"] for asset in assets) == sorted(f"file:{path}" for path in prefetcher.warm)
+    assert all(asset["state"] == AssetState.CPU_HOT and asset["bytes_total"] == 4096 for asset in assets)
+
+    # Files already read are not scheduled again until they change.
+    prefetcher.schedule(None, ["1", "2"])
+    assert prefetcher.wanted == []
+
+
+def test_prefetcher_skips_files_larger_than_available_ram(tmp_path, monkeypatch):
+    files = fake_model_dir(tmp_path, monkeypatch)
+    monkeypatch.setattr(model_prefetch, "MAX_AVAILABLE_RAM_FRACTION", 0.0)
+    prefetcher = ModelPrefetcher()
+    path = files[("vae", "ae.safetensors")]
+    prefetcher._read(path)
+    assert prefetcher.warm == {}
+    assert [asset["state"] for asset in prefetcher.residency.snapshot()["assets"]] == [AssetState.CPU_MMAP]
+
+
+def test_warm_files_expire(tmp_path, monkeypatch):
+    files = fake_model_dir(tmp_path, monkeypatch)
+    clock = [1000.0]
+    monkeypatch.setattr(model_prefetch.time, "monotonic", lambda: clock[0])
+    prefetcher = ModelPrefetcher()
+    path = files[("vae", "ae.safetensors")]
+    prefetcher._read(path)
+    assert prefetcher._is_warm(path)
+
+    clock[0] += model_prefetch.WARM_SECONDS
+    assert not prefetcher._is_warm(path)
+    assert path not in prefetcher.warm
+    assert [asset["state"] for asset in prefetcher.residency.snapshot()["assets"]] == [AssetState.UNLOADED]
+
+    # Reading more than the RAM that was available pushes it out of the page cache as well.
+    prefetcher._read(path)
+    available = prefetcher.warm[path][4]
+    prefetcher.bytes_read += available
+    assert not prefetcher._is_warm(path)
+
+
+def test_pending_order_follows_dependencies(monkeypatch):
+    nodes = pytest.importorskip("nodes")
+    from comfy_execution.graph import DynamicPrompt, TopologicalSort
+
+    class Node:
+        @classmethod
+        def INPUT_TYPES(cls):
+            return {"optional": {"a": ("*",), "b": ("*",)}}
+
+    monkeypatch.setattr(nodes, "NODE_CLASS_MAPPINGS", {"Node": Node})
+    prompt = {
+        "out": {"class_type": "Node", "inputs": {"a": ["mid", 0]}},
+        "mid": {"class_type": "Node", "inputs": {"a": ["lora", 0], "b": ["ckpt", 0]}},
+        "lora": {"class_type": "Node", "inputs": {"a": ["ckpt", 0]}},
+        "ckpt": {"class_type": "Node", "inputs": {}},
+        "extra": {"class_type": "Node", "inputs": {}},
+    }
+    sort = TopologicalSort(DynamicPrompt(prompt))
+    sort.add_node("out")
+    assert list(sort.pendingNodes)[0] == "out"
+    assert sort.get_pending_order() == ["ckpt", "lora", "mid", "out"]
+
+    sort.add_external_block("lora")
+    # Nodes that can't get ready on their own follow in discovery order.
+    assert sort.get_pending_order() == ["ckpt", "out", "mid", "lora"]
+
+    # The order is kept while nodes finish, and computed again once nodes are added.
+    sort.pop_node("ckpt")
+    assert sort.has_pending_order()
+    assert sort.get_pending_order() == ["out", "mid", "lora"]
+    sort.add_node("extra")
+    assert not sort.has_pending_order()
+
+
+def test_started_nodes_drop_their_files_from_the_plan(monkeypatch):
+    node_files = {"1": ["a.safetensors"], "2": []}
+    prefetcher = ModelPrefetcher()
+    monkeypatch.setattr(prefetcher, "files_for", lambda dynprompt, node_id: node_files[node_id])
+    # Without a notify the reader thread keeps waiting.
+    prefetcher.wanted = ["a.safetensors", "b.safetensors"]
+    prefetcher.node_started(None, "2")
+    assert prefetcher.wanted == ["a.safetensors", "b.safetensors"]
+    prefetcher.node_started(None, "1")
+    assert prefetcher.wanted == ["b.safetensors"]
@@ -40,3 +40,180 @@ def test_nova_executor_emits_plan_and_snapshot(monkeypatch):
     event_names = [name for name, _, _ in server.events]
     assert "telemetry.nova_plan" in event_names
     assert "telemetry.nova_residency_snapshot" in event_names
+
+
+class FakeDynPrompt:
+    def __init__(self, prompt):
+        self.prompt = prompt
+
+    def get_node(self, node_id):
+        return self.prompt[node_id]
+
+
+class FakeExecutionList:
+    """Minimal stand-in for comfy_execution.graph.ExecutionList (which needs torch)."""
+
+    def __init__(self, prompt):
+        self.pending = {node_id: {x[0] for x in node["inputs"].values() if isinstance(x, list)} for node_id, node in prompt.items()}
+        self.externalBlocks = 0
+        self.unblockedEvent = None
+
+    def is_empty(self):
+        return len(self.pending) == 0
+
+    def get_ready_nodes(self):
+        return [node_id for node_id, deps in self.pending.items() if len(deps) == 0]
+
+    def complete_node_execution(self, node_id):
+        del self.pending[node_id]
+        for deps in self.pending.values():
+            deps.discard(node_id)
+
+    async def stage_node_execution(self):
+        return None, {"node_id": next(iter(self.pending))}, RuntimeError("cycle")
+
+
+class LoaderNode:
+    RETURN_TYPES = ("MODEL", "CLIP", "VAE")
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {"required": {"ckpt_name": ("STRING",)}}
+
+
+class EncodeNode:
+    RETURN_TYPES = ("CONDITIONING",)
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {"required": {"clip": ("CLIP",), "text": ("STRING",)}}
+
+
+class ImageNode:
+    RETURN_TYPES = ("IMAGE",)
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {"required": {"image": ("IMAGE",)}}
+
+
+def _fake_nodes(monkeypatch):
+    mappings = {"Loader": LoaderNode, "Encode": EncodeNode, "Image": ImageNode}
+    monkeypatch.setitem(__import__("sys").modules, "nodes", type("M", (), {"NODE_CLASS_MAPPINGS": mappings})())
+
+
+def test_classify_node_lanes():
+    from comfy_execution.nova_scheduler import NodeLane, classify_node
+
+    assert classify_node(LoaderNode, {"inputs": {"ckpt_name": "a.safetensors"}}) == NodeLane.IO
+    assert classify_node(EncodeNode, {"inputs": {"clip": ["1", 1], "text": "a"}}) == NodeLane.GPU
+    assert classify_node(ImageNode, {"inputs": {"image": ["1", 0]}}) == NodeLane.CPU
+
+
+def test_dispatcher_overlaps_independent_loaders_and_serializes_gpu(monkeypatch):
+    import asyncio
+    import threading
+    import time
+    from comfy_execution.nova_scheduler import ParallelNodeDispatcher
+    from comfy_execution.utils import get_node_executor
+
+    _fake_nodes(monkeypatch)
+    prompt = {
+        "1": {"class_type": "Loader", "inputs": {"ckpt_name": "a"}},
+        "2": {"class_type": "Loader", "inputs": {"ckpt_name": "b"}},
+        "3": {"class_type": "Encode", "inputs": {"clip": ["1", 1], "text": "x"}},
+        "4": {"class_type": "Encode", "inputs": {"clip": ["2", 1], "text": "y"}},
+    }
+    execution_list = FakeExecutionList(prompt)
+    lock = threading.Lock()
+    active = {"io": 0, "gpu": 0}
+    peak = {"io": 0, "gpu": 0}
+    order = []
+
+    def work(lane):
+        with lock:
+            active[lane] += 1
+            peak[lane] = max(peak[lane], active[lane])
+        time.sleep(0.05)
+        with lock:
+            active[lane] -= 1
+
+    async def execute_node(node_id):
+        lane = "io" if prompt[node_id]["class_type"] == "Loader" else "gpu"
+        await asyncio.get_running_loop().run_in_executor(get_node_executor(), work, lane)
+        return "SUCCESS", None, None
+
+    def finish_node(node_id, result, error, ex):
+        order.append(node_id)
+        execution_list.complete_node_execution(node_id)
+        return True
+
+    dispatcher = ParallelNodeDispatcher(io_workers=2, cpu_workers=1, device="fake:0")
+    completed, error, _ = asyncio.run(dispatcher.run(FakeDynPrompt(prompt), execution_list, execute_node, finish_node))
+    dispatcher.shutdown()
+
+    assert completed and error is None
+    assert sorted(order) == ["1", "2", "3", "4"]
+    assert peak["io"] == 2
+    assert peak["gpu"] == 1
+
+
+def test_dispatcher_stops_scheduling_after_failure(monkeypatch):
+    import asyncio
+    from comfy_execution.nova_scheduler import ParallelNodeDispatcher
+
+    _fake_nodes(monkeypatch)
+    prompt = {
+        "1": {"class_type": "Loader", "inputs": {"ckpt_name": "a"}},
+        "2": {"class_type": "Encode", "inputs": {"clip": ["1", 1], "text": "x"}},
+    }
+    execution_list = FakeExecutionList(prompt)
+    executed = []
+
+    async def execute_node(node_id):
+        executed.append(node_id)
+        return "FAILURE", {"node_id": node_id}, RuntimeError("boom")
+
+    dispatcher = ParallelNodeDispatcher(device="fake:0")
+    completed, error, _ = asyncio.run(dispatcher.run(FakeDynPrompt(prompt), execution_list, execute_node, lambda *a: False))
+    dispatcher.shutdown()
+
+    assert completed is False and error is None
+    assert executed == ["1"]
+
+
+def test_nova_executor_sends_batched_prompts_through_the_batch_server(monkeypatch):
+    import sys
+    import types
+
+    import comfy_execution.nova_scheduler as ns
+    from comfy_execution import prompt_batching
+
+    class MessagingExecutor(FakeLegacyExecutor):
+        def execute(self, prompt, prompt_id, extra_data=None, execute_outputs=None):
+            self.server.send_sync("executed", {"node": "9.b1", "display_node": "9.b1", "output": {}, "prompt_id": prompt_id}, self.server.client_id)
+
+    monkeypatch.setitem(sys.modules, "execution", types.SimpleNamespace(PromptExecutor=MessagingExecutor))
+    monkeypatch.setattr(ns, "detect_profile", lambda: __import__("comfy_execution.profile_policy", fromlist=["NovaExecutionProfile"]).NovaExecutionProfile.PASCAL_4G)
+    mappings = {"Loader": LoaderNode, "Encode": EncodeNode, "Save": ImageNode}
+    monkeypatch.setitem(sys.modules, "nodes", types.SimpleNamespace(NODE_CLASS_MAPPINGS=mappings))
+    monkeypatch.setattr(prompt_batching, "PER_PROMPT_WIDGETS", {"Encode": ("text",)})
+    monkeypatch.setattr(prompt_batching, "_signatures", prompt_batching.OrderedDict())
+
+    def item(i):
+        prompt = {
+            "1": {"class_type": "Loader", "inputs": {"ckpt_name": "a"}},
+            "2": {"class_type": "Encode", "inputs": {"clip": ["1", 1], "text": f"text {i}"}},
+            "9": {"class_type": "Save", "inputs": {"image": ["2", 0]}},
+        }
+        return (i, f"p{i}", prompt, {"client_id": f"c{i}"}, ["9"], {})
+
+    server = FakeServer()
+    batch = prompt_batching.PromptBatch([item(0), item(1)])
+    ex = NovaPromptExecutor(server)
+    ex.server = prompt_batching.BatchServer(server, batch)
+    ex.execute(batch.prompt, "p0", {}, batch.execute_outputs)
+    ex.server = server
+
+    assert ("executed", {"node": "9", "display_node": "9", "output": {}, "prompt_id": "p1"}, "c1") in server.events
+    assert ex._legacy.server is server
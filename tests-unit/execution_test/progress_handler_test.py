@@ -0,0 +1,118 @@
+import time
+
+import pytest
+
+from comfy.cli_args import args
+from comfy_execution import progress
+from comfy_execution.progress import ProgressRegistry, WebUIProgressHandler
+
+
+class FakeServer:
+    def __init__(self, flags=None):
+        self.client_id = "client"
+        self.sockets = {"client": object()}
+        self.sockets_metadata = {"client": {"feature_flags": flags or {}}}
+        self.messages = []
+
+    def send_sync(self, event, data, sid=None):
+        self.messages.append((event, data, sid))
+
+
+class FakeDynPrompt:
+    def get_display_node_id(self, node_id):
+        return node_id
+
+    def get_parent_node_id(self, node_id):
+        return None
+
+    def get_real_node_id(self, node_id):
+        return node_id
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(progress.time, "monotonic", lambda: now[0])
+    return now
+
+
+def _registry(server):
+    registry = ProgressRegistry("prompt", FakeDynPrompt())
+    handler = WebUIProgressHandler(server)
+    handler.set_registry(registry)
+    registry.register_handler(handler)
+    return registry
+
+
+def test_updates_are_rate_limited_but_start_and_finish_are_not(clock, monkeypatch):
+    monkeypatch.setattr(args, "progress_state_hz", 2.0)
+    server = FakeServer()
+    registry = _registry(server)
+
+    registry.start_progress("1")
+    for step in range(1, 50):
+        registry.update_progress("1", step, 50)
+    assert len(server.messages) == 1
+
+    clock[0] += 0.5
+    registry.update_progress("1", 50, 50)
+    registry.finish_progress("1")
+    assert len(server.messages) == 3
+    event, data, sid = server.messages[-1]
+    assert event == "progress_state" and sid == "client"
+    assert data["nodes"]["1"]["state"] == "finished" and "delta" not in data
+
+
+def test_folded_updates_are_sent_at_the_end_of_the_interval(monkeypatch):
+    monkeypatch.setattr(args, "progress_state_hz", 20.0)
+    server = FakeServer()
+    registry = _registry(server)
+
+    registry.start_progress("1")
+    for step in range(1, 5):
+        registry.update_progress("1", step, 50)
+    assert len(server.messages) == 1
+
+    deadline = time.time() + 5
+    while len(server.messages) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert len(server.messages) == 2
+    assert server.messages[-1][1]["nodes"]["1"]["value"] == 4
+
+    # Nothing changed since: no more messages.
+    time.sleep(0.1)
+    assert len(server.messages) == 2
+
+
+def test_reset_cancels_the_trailing_send(monkeypatch):
+    monkeypatch.setattr(args, "progress_state_hz", 20.0)
+    server = FakeServer()
+    registry = _registry(server)
+    registry.start_progress("1")
+    registry.update_progress("1", 1, 50)
+    registry.reset_handlers()
+    time.sleep(0.1)
+    assert len(server.messages) == 1
+
+
+def test_delta_clients_get_only_changed_nodes(clock):
+    server = FakeServer({"supports_progress_state_delta": True, "progress_state_hz": 0})
+    registry = _registry(server)
+
+    registry.start_progress("1")
+    registry.finish_progress("1")
+    registry.start_progress("2")
+    first, finish_1, start_2 = (data for _, data, _ in server.messages)
+    assert "delta" not in first and list(first["nodes"]) == ["1"]
+    assert finish_1["delta"] is True and list(finish_1["nodes"]) == ["1"]
+    assert start_2["delta"] is True and list(start_2["nodes"]) == ["2"]
+
+    server.sockets_metadata["client"]["progress_resync"] = True
+    registry.update_progress("2", 1, 4)
+    resync = server.messages[-1][1]
+    assert "delta" not in resync and sorted(resync["nodes"]) == ["1", "2"]
+    assert "progress_resync" not in server.sockets_metadata["client"]
+
+    server.sockets["client"] = object()  # reconnected
+    registry.update_progress("2", 2, 4)
+    assert "delta" not in server.messages[-1][1]
@@ -0,0 +1,175 @@
+import sys
+import types
+
+import pytest
+
+from comfy_execution import prompt_batching
+from comfy_execution.prompt_batching import BatchServer, PromptBatch, batch_signature
+
+
+class FakeNode:
+    RETURN_TYPES = ("ANY",)
+
+
+class FakeLoader:
+    RETURN_TYPES = ("MODEL", "CLIP", "VAE")
+
+
+@pytest.fixture(autouse=True)
+def batching_enabled(monkeypatch):
+    mappings = {
+        "CheckpointLoaderSimple": FakeLoader,
+        "CLIPTextEncode": FakeNode,
+        "EmptyLatentImage": FakeNode,
+        "KSampler": FakeNode,
+        "VAEDecode": FakeNode,
+        "SaveImage": FakeNode,
+    }
+    monkeypatch.setitem(sys.modules, "nodes", types.SimpleNamespace(NODE_CLASS_MAPPINGS=mappings))
+    monkeypatch.setattr(prompt_batching, "BATCHED_NODES", {
+        "KSampler": ("BatchedKSampler", ("positive", "negative", "latent_image"), ("seed",)),
+        "VAEDecode": ("BatchedVAEDecode", ("samples",), ()),
+    })
+    monkeypatch.setattr(prompt_batching, "PER_PROMPT_WIDGETS", {"KSampler": ("seed",), "CLIPTextEncode": ("text",)})
+    monkeypatch.setattr(prompt_batching, "_signatures", prompt_batching.OrderedDict())
+
+
+def make_prompt(seed=1, text="a cat", steps=20):
+    return {
+        "4": {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": "model.safetensors"}},
+        "5": {"class_type": "EmptyLatentImage", "inputs": {"width": 512, "height": 512, "batch_size": 1}},
+        "6": {"class_type": "CLIPTextEncode", "inputs": {"text": text, "clip": ["4", 1]}},
+        "7": {"class_type": "CLIPTextEncode", "inputs": {"text": "blurry", "clip": ["4", 1]}},
+        "3": {"class_type": "KSampler", "inputs": {"seed": seed, "steps": steps, "cfg": 7.0, "sampler_name": "euler",
+                                                   "scheduler": "normal", "denoise": 1.0, "model": ["4", 0],
+                                                   "positive": ["6", 0], "negative": ["7", 0], "latent_image": ["5", 0]}},
+        "8": {"class_type": "VAEDecode", "inputs": {"samples": ["3", 0], "vae": ["4", 2]}},
+        "9": {"class_type": "SaveImage", "inputs": {"filename_prefix": "ComfyUI", "images": ["8", 0]}},
+    }
+
+
+def make_item(number, prompt_id, prompt, client_id="c1"):
+    return (number, prompt_id, prompt, {"client_id": client_id, "extra_pnginfo": {"workflow": prompt_id}}, ["9"], {})
+
+
+def test_signature_ignores_per_prompt_widgets_only():
+    a = batch_signature(make_item(0, "a", make_prompt(seed=1, text="a cat")))
+    b = batch_signature(make_item(1, "b", make_prompt(seed=2, text="a dog")))
+    assert a is not None and a == b
+    assert batch_signature(make_item(2, "c", make_prompt(steps=30))) != a
+    assert batch_signature(make_item(3, "d", make_prompt(), client_id="c2")) != a
+
+
+def test_merged_prompt_shares_unchanged_nodes_and_batches_samplers():
+    items = [make_item(i, f"p{i}", make_prompt(seed=i, text=f"text {i}")) for i in range(3)]
+    batch = PromptBatch(items)
+    merged = batch.prompt
+
+    for shared in ("4", "5", "7"):
+        assert merged[shared]["inputs"] == items[0][2][shared]["inputs"]
+    assert [merged[f"6.b{i}"]["inputs"]["text"] for i in range(3)] == ["text 0", "text 1", "text 2"]
+    assert "6" not in merged
+
+    sampler = merged["3.batch"]
+    assert sampler["class_type"] == "BatchedKSampler"
+    assert [sampler["inputs"][f"seed_{i}"] for i in range(3)] == [0, 1, 2]
+    assert sampler["inputs"]["model"] == ["4", 0]
+    assert sampler["inputs"]["positive_2"] == ["6.b2", 0]
+    assert sampler["inputs"]["negative_1"] == ["7", 0]
+    assert sampler["inputs"]["latent_image_0"] == ["5", 0]
+
+    decode = merged["8.batch"]
+    assert decode["class_type"] == "BatchedVAEDecode"
+    assert decode["inputs"]["samples_1"] == ["3.batch.b1", 0]
+    assert merged["3.batch.b1"] == {"class_type": "PromptBatchItem", "inputs": {"batch": ["3.batch", 0], "index": 1}}
+    assert decode["inputs"]["vae"] == ["4", 2]
+
+    assert [merged[f"9.b{i}"]["inputs"]["images"] for i in range(3)] == [[f"8.batch.b{i}", 0] for i in range(3)]
+    assert batch.execute_outputs == ["9.b0", "9.b1", "9.b2"]
+
+
+def test_split_history_and_prompt_info():
+    items = [make_item(i, f"p{i}", make_prompt(seed=i)) for i in range(2)]
+    batch = PromptBatch(items)
+    history = {
+        "outputs": {"9.b0": {"images": ["a.png"]}, "9.b1": {"images": ["b.png"]}},
+        "meta": {
+            "9.b0": {"node_id": "9.b0", "display_node": "9.b0", "parent_node": None, "real_node_id": "9.b0"},
+            "9.b1": {"node_id": "9.b1", "display_node": "9.b1", "parent_node": None, "real_node_id": "9.b1"},
+        },
+    }
+    second = batch.split_history(history, 1)
+    assert second["outputs"] == {"9": {"images": ["b.png"]}}
+    assert second["meta"]["9"]["display_node"] == "9"
+
+    prompt, pnginfo = batch.get_prompt_info("9.b1", None, None)
+    assert prompt is items[1][2]
+    assert pnginfo == {"workflow": "p1"}
+
+
+def test_messages_go_to_the_prompt_they_concern():
+    items = [make_item(i, f"p{i}", make_prompt(seed=i, text=f"text {i}"), client_id=f"c{i}") for i in range(2)]
+    batch = PromptBatch(items)
+
+    class FakeServer:
+        client_id = "c0"
+
+        def __init__(self):
+            self.messages = []
+
+        def send_sync(self, event, data, sid=None):
+            self.messages.append((event, data, sid))
+
+    server = FakeServer()
+    batched = BatchServer(server, batch)
+    batched.send_sync("execution_start", {"prompt_id": "p0"}, "c0")
+    batched.send_sync("executed", {"node": "9.b1", "display_node": "9.b1", "output": {}, "prompt_id": "p0"}, "c0")
+    batched.send_sync("executing", {"node": "3.batch", "display_node": "3.batch", "prompt_id": "p0"}, "c0")
+    batched.send_sync("execution_cached", {"nodes": ["4", "6.b0", "6.b1"], "prompt_id": "p0"}, "c0")
+    batched.send_sync("status", {"status": {}})
+    assert server.messages == [
+        ("execution_start", {"prompt_id": "p0"}, "c0"),
+        ("execution_start", {"prompt_id": "p1"}, "c1"),
+        ("executed", {"node": "9", "display_node": "9", "output": {}, "prompt_id": "p1"}, "c1"),
+        ("executing", {"node": "3", "display_node": "3", "prompt_id": "p0"}, "c0"),
+        ("executing", {"node": "3", "display_node": "3", "prompt_id": "p1"}, "c1"),
+        ("execution_cached", {"nodes": ["4", "6"], "prompt_id": "p0"}, "c0"),
+        ("execution_cached", {"nodes": ["4", "6"], "prompt_id": "p1"}, "c1"),
+        ("status", {"status": {}}, None),
+    ]
+    batched.last_node_id = "9.b1"
+    assert server.last_node_id == "9.b1"
+
+
+def test_each_prompt_gets_its_own_status():
+    items = [make_item(i, f"p{i}", make_prompt(seed=i)) for i in range(2)]
+    batch = PromptBatch(items)
+    error = {"prompt_id": "p0", "node_id": "9.b1", "node_type": "SaveImage", "executed": ["4", "9.b0"], "current_outputs": []}
+    messages = [("execution_start", {"prompt_id": "p0"}), ("execution_error", error)]
+
+    first = batch.item_messages(messages, 0)
+    second = batch.item_messages(messages, 1)
+    assert first == [("execution_start", {"prompt_id": "p0"}), ("execution_success", {"prompt_id": "p0"})]
+    assert second[1][0] == "execution_error"
+    assert second[1][1]["prompt_id"] == "p1" and second[1][1]["node_id"] == "9"
+    assert second[1][1]["executed"] == ["4"]
+
+
+def test_queue_get_batch_pops_compatible_items():
+    pytest.importorskip("torch")
+    from execution import PromptQueue
+
+    class FakeServer:
+        def queue_updated(self):
+            pass
+
+    q = PromptQueue(FakeServer())
+    q.put(make_item(0, "a", make_prompt(seed=1)))
+    q.put(make_item(1, "b", make_prompt(steps=5)))
+    q.put(make_item(2, "c", make_prompt(seed=3)))
+    q.put(make_item(3, "d", make_prompt(seed=4)))
+
+    batch = q.get_batch(timeout=0, max_items=2, batch_key=batch_signature)
+    assert [item[1] for item, _ in batch] == ["a", "c"]
+    assert len(q.currently_running) == 2
+    assert sorted(item[1] for item in q.get_current_queue_volatile()[1]) == ["b", "d"]
@@ -0,0 +1,52 @@
+from comfy_execution.queue_index import HistoryRing, IndexedQueue
+
+
+def make_item(number, prompt_id, workflow_id=None):
+    extra_data = {}
+    if workflow_id is not None:
+        extra_data["extra_pnginfo"] = {"workflow": {"id": workflow_id}}
+    return (number, prompt_id, {}, extra_data, [], {})
+
+
+def test_indexed_queue_orders_by_number_then_insertion():
+    q = IndexedQueue()
+    for item in [make_item(2, "c"), make_item(1, "a"), make_item(1, "b"), make_item(-1, "front")]:
+        q.push(item)
+    assert [x[1] for x in q.smallest(2)] == ["front", "a"]
+    assert len(q) == 4
+    assert [q.pop()[1] for _ in range(4)] == ["front", "a", "b", "c"]
+
+
+def test_indexed_queue_delete_and_priority_change():
+    q = IndexedQueue()
+    for i in range(200):
+        q.push(make_item(i, f"p{i}"))
+    for i in range(0, 200, 2):
+        assert q.remove(f"p{i}")
+    assert not q.remove("p0")
+    assert q.set_priority("p199", -5)
+    assert len(q) == 100
+    assert q.pop()[:2] == (-5, "p199")
+    assert [q.pop()[1] for _ in range(3)] == ["p1", "p3", "p5"]
+
+
+def test_indexed_queue_snapshot_is_reused_until_modified():
+    q = IndexedQueue()
+    q.push(make_item(0, "a"))
+    first = q.items()
+    assert q.items() is first
+    q.push(make_item(1, "b"))
+    assert sorted(x[1] for x in q.items()) == ["a", "b"]
+
+
+def test_history_ring_drops_oldest_and_keeps_indexes():
+    history = HistoryRing(3)
+    for i, status in enumerate(["success", "error", "success", "success"]):
+        history.add(f"p{i}", {"prompt": make_item(i, f"p{i}", "wf" if i % 2 else None), "status": {"status_str": status}})
+    assert list(history) == ["p1", "p2", "p3"]
+    assert list(history.ids_with_status("success")) == ["p2", "p3"]
+    assert list(history.ids_with_workflow("wf")) == ["p1", "p3"]
+
+    history.pop("p3")
+    assert list(history.ids_with_workflow("wf")) == ["p1"]
+    assert list(history.slice(1, 1)) == ["p2"]
@@ -0,0 +1,41 @@
+import pytest
+
+import comfy_execution.residency_graph as residency_graph
+from comfy_execution.residency_graph import AssetState, ResidencyGraph, prometheus_gauges
+
+
+def test_record_counts_events_per_asset_and_in_total():
+    graph = ResidencyGraph()
+    graph.record("model:a", "miss", state=AssetState.CPU_HOT, bytes_total=100)
+    graph.record("model:a", "load", seconds=0.5, state=AssetState.GPU_FULL, bytes_gpu_resident=100, bytes_cpu_resident=0, device="cuda:0")
+    graph.record("model:a", "hit")
+    graph.record("model:b", "partial_load", seconds=0.25, state=AssetState.GPU_PARTIAL, bytes_total=300, bytes_gpu_resident=100, bytes_cpu_resident=200)
+
+    snapshot = graph.snapshot()
+    a = next(asset for asset in snapshot["assets"] if asset["asset_id"] == "model:a")
+    assert (a["misses"], a["loads"], a["hits"], a["partial_loads"]) == (1, 1, 1, 0)
+    assert a["state"] == AssetState.GPU_FULL and a["bytes_gpu_resident"] == 100 and a["device"] == "cuda:0"
+    assert a["last_load_seconds"] == 0.5
+    assert snapshot["totals"]["load"] == 1 and snapshot["totals"]["partial_load"] == 1
+    assert snapshot["totals"]["load_seconds"] == 0.75
+
+    with pytest.raises(ValueError):
+        graph.record("model:a", "evicted")
+
+
+def test_unloaded_assets_are_forgotten_first(monkeypatch):
+    monkeypatch.setattr(residency_graph, "MAX_ASSETS", 2)
+    graph = ResidencyGraph()
+    graph.touch("model:gone", state=AssetState.UNLOADED)
+    graph.touch("model:loaded", state=AssetState.GPU_FULL)
+    graph.touch("model:new", state=AssetState.CPU_HOT)
+    assert sorted(asset["asset_id"] for asset in graph.snapshot()["assets"]) == ["model:loaded", "model:new"]
+
+
+def test_prometheus_lines():
+    graph = ResidencyGraph()
+    graph.record("model:a", "load", seconds=1.0, bytes_total=10, bytes_gpu_resident=6, bytes_cpu_resident=4, label='sd "xl"')
+    text = "\n".join(graph.prometheus())
+    assert 'comfy_residency_events_total{event="load"} 1' in text
+    assert 'comfy_residency_bytes{asset="model:a",name="sd \\"xl\\"",location="gpu"} 6' in text
+    assert prometheus_gauges("comfy_pool", {"bytes": 5, "enabled": True, "name": "x"}) == ["# TYPE comfy_pool_bytes gauge", "comfy_pool_bytes 5"]
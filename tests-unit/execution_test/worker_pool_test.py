@@ -0,0 +1,190 @@
+import pytest
+
+from comfy_execution.worker_pool import DeviceAffinity, WorkerServer, prompt_model_keys
+
+
+def make_item(number, prompt_id, ckpt_name, lora_name=None):
+    prompt = {"1": {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": ckpt_name}}}
+    if lora_name is not None:
+        prompt["2"] = {"class_type": "LoraLoader", "inputs": {"lora_name": lora_name, "strength_model": 1.0, "model": ["1", 0]}}
+    return (number, prompt_id, prompt, {}, ["1"], {})
+
+
+def test_prompt_model_keys_only_picks_model_files():
+    item = make_item(0, "a", "sdxl.safetensors", "detail.safetensors")
+    item[2]["3"] = {"class_type": "CLIPTextEncode", "inputs": {"text": "a photo", "clip": ["1", 1]}}
+    assert prompt_model_keys(item[2]) == {("ckpt_name", "sdxl.safetensors"), ("lora_name", "detail.safetensors")}
+
+
+def test_affinity_prefers_resident_models_and_leaves_others_alone():
+    affinity = DeviceAffinity()
+    affinity.record("0:cuda:0", make_item(0, "x", "sdxl.safetensors")[2])
+    affinity.record("1:cuda:1", make_item(0, "y", "flux.safetensors")[2])
+
+    queue = [make_item(0, "a", "flux.safetensors"), make_item(1, "b", "new.safetensors"), make_item(2, "c", "sdxl.safetensors")]
+    assert affinity.pick("0:cuda:0", queue) == 2
+    assert affinity.pick("1:cuda:1", queue) == 0
+    # A worker without anything loaded takes the first prompt no other worker holds the models of.
+    assert affinity.pick("2:cuda:2", queue) == 1
+
+    affinity.forget("0:cuda:0")
+    assert affinity.pick("0:cuda:0", queue) == 1
+
+
+def test_worker_server_keeps_prompt_state_per_worker():
+    class Server:
+        client_id = None
+        last_node_id = None
+        last_prompt_id = None
+        sockets_metadata = {}
+
+    shared = Server()
+    a = WorkerServer(shared)
+    b = WorkerServer(shared)
+    a.client_id = "client-a"
+    b.client_id = "client-b"
+    assert a.client_id == "client-a"
+    assert b.client_id == "client-b"
+    assert a.sockets_metadata is shared.sockets_metadata
+
+
+def test_queue_routes_prompts_to_fake_devices():
+    pytest.importorskip("torch")
+    from execution import PromptQueue
+
+    class FakeServer:
+        def queue_updated(self):
+            pass
+
+    q = PromptQueue(FakeServer())
+    affinity = DeviceAffinity()
+    q.register_worker("0:cpu", affinity)
+    q.register_worker("1:cpu", affinity)
+    affinity.record("1:cpu", make_item(0, "x", "flux.safetensors")[2])
+
+    q.put(make_item(0, "a", "sdxl.safetensors"))
+    q.put(make_item(1, "b", "flux.safetensors"))
+    (item, _) = q.get(timeout=0, worker="1:cpu")
+    assert item[1] == "b"
+    (item, _) = q.get(timeout=0, worker="0:cpu")
+    assert item[1] == "a"
+
+    q.set_flag("unload_models", True)
+    assert q.get_flags(worker="0:cpu") == {"unload_models": True}
+    assert q.get_flags(worker="1:cpu") == {"unload_models": True}
+    assert q.get_flags(worker="1:cpu") == {}
+
+
+def test_single_worker_groups_same_models_within_max_delay():
+    affinity = DeviceAffinity(lookahead=4, max_delay=10.0)
+    affinity.record(None, make_item(0, "x", "sdxl.safetensors", "detail.safetensors")[2])
+
+    queue = [
+        make_item(0, "a", "flux.safetensors"),
+        make_item(1, "b", "sdxl.safetensors"),
+        make_item(2, "c", "sdxl.safetensors", "detail.safetensors"),
+    ]
+    # Exact same checkpoint + LoRA set first, then the one sharing the checkpoint.
+    assert affinity.pick(None, queue, now=0.0) == 2
+    queue.pop(2)
+    assert affinity.pick(None, queue, now=5.0) == 1
+    queue.pop(1)
+
+    queue.append(make_item(3, "d", "sdxl.safetensors"))
+    # "a" has been passed over since t=0, it can't be held back past max_delay.
+    assert affinity.pick(None, queue, now=9.0) == 1
+    assert affinity.pick(None, queue, now=10.0) == 0
+
+
+def test_last_prompt_outranks_older_resident_models():
+    affinity = DeviceAffinity()
+    affinity.record(None, make_item(0, "x", "sdxl.safetensors", "a.safetensors")[2])
+    affinity.record(None, make_item(0, "y", "sdxl.safetensors", "b.safetensors")[2])
+    affinity.record(None, make_item(0, "z", "flux.safetensors")[2])
+
+    queue = [make_item(0, "a", "sdxl.safetensors", "a.safetensors"), make_item(1, "b", "flux.safetensors", "c.safetensors")]
+    assert affinity.score(None, affinity.model_keys(queue[0]))[2] > affinity.score(None, affinity.model_keys(queue[1]))[2]
+    assert affinity.pick(None, queue, now=0.0) == 1
+
+
+def test_prompts_pushed_out_of_the_window_still_get_their_turn():
+    pytest.importorskip("torch")
+    from execution import PromptQueue
+
+    class FakeServer:
+        def queue_updated(self):
+            pass
+
+    q = PromptQueue(FakeServer())
+    affinity = DeviceAffinity(lookahead=2, max_delay=0.0)
+    q.register_worker(None, affinity)
+    affinity.record(None, make_item(0, "x", "sdxl.safetensors")[2])
+    q.put(make_item(5, "old", "flux.safetensors"))
+    q.put(make_item(6, "same", "sdxl.safetensors"))
+    assert q.get(timeout=0)[0][1] == "same"
+
+    for number in range(3):
+        q.put(make_item(number, f"new{number}", "sdxl.safetensors"))
+    assert q.get(timeout=0)[0][1] == "old"
+
+
+def test_interrupt_only_hits_the_targeted_worker():
+    pytest.importorskip("torch")
+    import contextvars
+    import comfy.model_management as mm
+
+    def worker(name):
+        ctx = contextvars.copy_context()
+        ctx.run(mm.set_interrupt_worker, name)
+        return ctx
+
+    a = worker("0:cpu")
+    b = worker("1:cpu")
+    try:
+        mm.interrupt_current_processing(worker="0:cpu")
+        assert a.run(mm.processing_interrupted)
+        assert not b.run(mm.processing_interrupted)
+        with pytest.raises(mm.InterruptProcessingException):
+            a.run(mm.throw_exception_if_processing_interrupted)
+        assert not a.run(mm.processing_interrupted)
+
+        # a worker interrupting itself leaves the others running
+        b.run(mm.interrupt_current_processing)
+        assert b.run(mm.processing_interrupted)
+        assert not a.run(mm.processing_interrupted)
+
+        # an untargeted interrupt from outside any worker stops all of them
+        mm.interrupt_current_processing(False)
+        mm.interrupt_current_processing()
+        assert a.run(mm.processing_interrupted)
+        assert b.run(mm.processing_interrupted)
+    finally:
+        mm.interrupt_current_processing(False)
+        mm.worker_interrupt_flags.pop("0:cpu", None)
+        mm.worker_interrupt_flags.pop("1:cpu", None)
+
+
+def test_model_loads_lock_per_device():
+    pytest.importorskip("torch")
+    import comfy.model_management as mm
+
+    assert mm.device_models_lock("cuda:0") is mm.device_models_lock("cuda:0")
+    assert mm.device_models_lock("cuda:0") is not mm.device_models_lock("cuda:1")
+
+
+def test_queue_tracks_the_worker_running_each_prompt():
+    pytest.importorskip("torch")
+    from execution import PromptQueue
+
+    class FakeServer:
+        def queue_updated(self):
+            pass
+
+    q = PromptQueue(FakeServer())
+    q.register_worker("0:cpu", DeviceAffinity())
+    q.put(make_item(0, "a", "sdxl.safetensors"))
+    (item, item_id) = q.get(timeout=0, worker="0:cpu")
+    assert q.get_running_worker("a") == "0:cpu"
+    assert q.get_running_worker("b") is None
+    q.task_done(item_id, {}, None)
+    assert q.get_running_worker("a") is None
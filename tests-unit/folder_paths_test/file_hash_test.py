@@ -0,0 +1,24 @@
+import hashlib
+import os
+
+import folder_paths
+from folder_paths import get_file_hash
+
+
+def test_file_hash_is_memoized_until_the_file_changes(tmp_path, monkeypatch):
+    path = tmp_path / "image.png"
+    path.write_bytes(b"first")
+    assert get_file_hash(str(path)) == hashlib.sha256(b"first").hexdigest()
+
+    opened = []
+    real_open = open
+    monkeypatch.setattr("builtins.open", lambda *args, **kwargs: opened.append(args[0]) or real_open(*args, **kwargs))
+    assert get_file_hash(str(path)) == hashlib.sha256(b"first").hexdigest()
+    assert opened == []
+    monkeypatch.undo()
+
+    path.write_bytes(b"second!")
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    assert get_file_hash(str(path)) == hashlib.sha256(b"second!").hexdigest()
+    assert folder_paths._file_hash_cache[os.path.abspath(path)][2] == hashlib.sha256(b"second!").hexdigest()
@@ -0,0 +1,84 @@
+import json
+import struct
+import threading
+import time
+from io import BytesIO
+
+from PIL import Image
+
+import app.preview_encoder as preview_encoder
+from app.preview_encoder import PreviewEncoder, encode_preview, preview_settings
+
+
+def test_preview_settings_from_client_flags():
+    assert preview_settings({}, "JPEG", True) == ("JPEG", 95)
+    assert preview_settings({"preview_format": "webp", "preview_quality": 60}, "JPEG", True) == ("WEBP", 60)
+    # WebP needs the mimetype of the metadata messages
+    assert preview_settings({"preview_format": "webp"}, "JPEG", False) == ("JPEG", 95)
+    assert preview_settings({"preview_format": "gif", "preview_quality": 500}, "PNG", True) == ("PNG", 95)
+
+
+def test_encode_once_per_setting():
+    image = Image.new("RGB", (64, 32), "red")
+    out = encode_preview(image, 16, [("JPEG", 50), ("WEBP", 80)], metadata={"node_id": "3"})
+
+    data = out[("WEBP", 80)]
+    length = struct.unpack(">I", data[:4])[0]
+    assert json.loads(data[4:4 + length]) == {"node_id": "3", "image_type": "image/webp"}
+    decoded = Image.open(BytesIO(data[4 + length:]))
+    assert decoded.format == "WEBP" and decoded.size == (16, 8)
+
+    data = encode_preview(image, None, [("PNG", 95)])[("PNG", 95)]
+    assert struct.unpack(">I", data[:4])[0] == preview_encoder.PREVIEW_TYPE_NUMBERS["PNG"]
+    assert Image.open(BytesIO(data[4:])).size == (64, 32)
+
+
+def test_previews_are_dropped_while_the_encoder_is_busy(monkeypatch):
+    release = threading.Event()
+
+    def slow_encode(*args):
+        release.wait(10)
+        return {}
+    monkeypatch.setattr(preview_encoder, "encode_preview", slow_encode)
+
+    encoder = PreviewEncoder(workers=1, max_pending=2)
+    image = Image.new("RGB", (4, 4))
+    futures = [encoder.submit(image, None, [("JPEG", 95)]) for _ in range(4)]
+    assert futures[2] is None and futures[3] is None
+    release.set()
+    for future in futures[:2]:
+        future.result(10)
+    deadline = time.monotonic() + 10
+    while encoder.stats()["pending"] > 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert encoder.stats() == {"pending": 0, "encoded": 2, "dropped": 2, "stale": 0}
+    assert encoder.submit(image, None, [("JPEG", 95)]) is not None
+
+
+def test_frames_finishing_out_of_order_are_stale():
+    encoder = PreviewEncoder()
+    stream = (("preview", "3"), "client")
+    first, epoch = encoder.new_frame("client")
+    second, _ = encoder.new_frame("client")
+    assert encoder.deliverable(stream, "client", second, epoch, True)
+    assert not encoder.deliverable(stream, "client", first, epoch, True)
+    # Other streams are ordered on their own.
+    assert encoder.deliverable((("preview", "4"), "client"), "client", first, epoch, True)
+    assert encoder.stats()["stale"] == 1
+
+
+def test_previews_without_node_id_are_stale_once_another_node_runs():
+    encoder = PreviewEncoder()
+    stream = (("preview",), "client")
+    frame, epoch = encoder.new_frame("client")
+    encoder.node_started("other client")
+    assert encoder.deliverable(stream, "client", frame, epoch, False)
+
+    frame, epoch = encoder.new_frame("client")
+    encoder.node_started("client")
+    assert not encoder.deliverable(stream, "client", frame, epoch, False)
+    frame, epoch = encoder.new_frame("client")
+    encoder.node_started(None)
+    assert not encoder.deliverable(stream, "client", frame, epoch, False)
+    # A preview with a node id is shown on its own node.
+    assert encoder.deliverable((("preview", "3"), "client"), "client", frame, epoch, True)
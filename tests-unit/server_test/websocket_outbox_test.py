@@ -0,0 +1,112 @@
+import asyncio
+
+import app.websocket_outbox as websocket_outbox
+from app.websocket_outbox import WebSocketFanout, WebSocketOutbox, coalesce_key
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.received = []
+        self.gate = asyncio.Event()
+        self.gate.set()
+        self.closed_with = None
+
+    async def send_str(self, message):
+        await self.gate.wait()
+        self.received.append(message)
+
+    async def send_bytes(self, message):
+        await self.gate.wait()
+        self.received.append(message)
+
+    async def close(self, code=None, message=None):
+        self.closed_with = code
+
+
+async def _drain():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def test_progress_is_coalesced_behind_newer_messages():
+    outbox = WebSocketOutbox(FakeWebSocket())
+    key = coalesce_key("progress", {"prompt_id": "p", "node": "3", "value": 1, "max": 10})
+    outbox.put("executing 3", False)
+    outbox.put("progress 1", False, key)
+    outbox.put("executing 4", False)
+    outbox.put("progress 2", False, key)
+    assert [m for _, m in outbox.queue.values()] == ["executing 3", "executing 4", "progress 2"]
+    assert outbox.coalesced == 1
+    assert coalesce_key("executed", {"node": "3"}) is None
+
+
+def test_old_coalescable_messages_are_dropped(monkeypatch):
+    monkeypatch.setattr(websocket_outbox, "MAX_QUEUED", 2)
+    outbox = WebSocketOutbox(FakeWebSocket())
+    outbox.put("status", False)
+    for node in range(4):
+        outbox.put(f"preview {node}", True, ("preview", node))
+    assert [m for _, m in outbox.queue.values()] == ["status", "preview 2", "preview 3"]
+    assert outbox.dropped == 2
+
+
+def test_slow_client_does_not_delay_the_others():
+    async def run():
+        fanout = WebSocketFanout()
+        slow, fast = FakeWebSocket(), FakeWebSocket()
+        slow.gate.clear()
+        fanout.add("slow", slow)
+        fanout.add("fast", fast)
+        for i in range(3):
+            fanout.send(f"message {i}", False)
+        fanout.send("only fast", False, sid="fast")
+        await _drain()
+        assert fast.received == ["message 0", "message 1", "message 2", "only fast"]
+        assert slow.received == []
+        assert fanout.stats()["queued"] == 2
+
+        slow.gate.set()
+        await _drain()
+        assert slow.received == ["message 0", "message 1", "message 2"]
+        assert fanout.stats()["sent"] == 7
+        fanout.remove("slow")
+        fanout.remove("fast")
+    asyncio.run(run())
+
+
+def test_client_that_never_reads_is_disconnected(monkeypatch):
+    monkeypatch.setattr(websocket_outbox, "MAX_PENDING", 3)
+
+    async def run():
+        fanout = WebSocketFanout()
+        ws = FakeWebSocket()
+        ws.gate.clear()
+        fanout.add("a", ws)
+        for i in range(5):
+            fanout.send(f"message {i}", False)
+        await _drain()
+        assert "a" not in fanout.outboxes
+        assert ws.closed_with is not None
+        assert fanout.stats()["disconnected_slow"] == 1
+    asyncio.run(run())
+
+
+def test_outbox_stops_on_the_first_send_error(caplog):
+    class BrokenWebSocket(FakeWebSocket):
+        async def send_str(self, message):
+            raise ConnectionResetError("gone")
+
+    async def run():
+        outbox = WebSocketOutbox(BrokenWebSocket())
+        outbox.start()
+        task = outbox.task
+        for i in range(5):
+            outbox.put(f"message {i}", False)
+        await _drain()
+        assert outbox.dead
+        assert task.done()
+        assert len(outbox.queue) == 0
+        assert outbox.put("later", False)
+        assert len(outbox.queue) == 0
+    asyncio.run(run())
+    assert len([r for r in caplog.records if "send error" in r.getMessage()]) == 1